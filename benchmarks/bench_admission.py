@@ -0,0 +1,134 @@
+"""
+Load test for admission control (self-contained, no DB needed).
+
+    python benchmarks/bench_admission.py [--seconds 10] [--heavy-clients 64] [--light-clients 8]
+
+A stand-in app exposes the real endpoint names (main.item_detail,
+main.gallery) so admission.classify() puts them in the same classes as in
+production. Both endpoints need a shared backend with --backend slots (think
+DB connections or CPU cores): an item page holds a slot for 5 ms and a
+gallery text search holds one for 200 ms. Heavy clients hammer /gallery?q=
+while light clients fetch /item/<id>. The run is done once without the
+limiter and once with it, printing item-page latency percentiles and how the
+searches fared.
+"""
+import argparse
+import http.client
+import logging
+import os
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Blueprint, Flask  # noqa: E402
+from werkzeug.serving import make_server  # noqa: E402
+
+from project.admission import AdmissionMiddleware, Limiter, parse_class_spec  # noqa: E402
+
+
+def _app(backend_slots: int):
+    backend = threading.BoundedSemaphore(backend_slots)
+    main = Blueprint("main", __name__)
+
+    def work(seconds):
+        with backend:
+            time.sleep(seconds)
+
+    @main.get("/item/<int:item_id>")
+    def item_detail(item_id):
+        work(0.005)
+        return f"item {item_id}"
+
+    @main.get("/gallery")
+    def gallery():
+        work(0.2)
+        return "results"
+
+    app = Flask(__name__)
+    app.register_blueprint(main)
+    return app
+
+
+def _client(port, path, stop, out):
+    while not stop.is_set():
+        t0 = time.perf_counter()
+        try:
+            con = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+            con.request("GET", path)
+            status = con.getresponse().status
+            con.close()
+        except OSError:
+            status = 0
+        out.append((status, time.perf_counter() - t0))
+
+
+def _pct(values, p):
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def run(args, admission: bool):
+    app = _app(args.backend)
+    if admission:
+        limiter = Limiter({"cheap": parse_class_spec(args.cheap),
+                           "default": parse_class_spec(args.cheap),
+                           "expensive": parse_class_spec(args.expensive)},
+                          args.max_active, args.queue_timeout)
+        app.wsgi_app = AdmissionMiddleware(app.wsgi_app, app.url_map, limiter, retry_after=1)
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    server.socket.listen(1024)
+    port = server.server_port
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    stop = threading.Event()
+    light, heavy = [], []
+    threads = [threading.Thread(target=_client, args=(port, f"/item/{i}", stop, light))
+               for i in range(args.light_clients)]
+    threads += [threading.Thread(target=_client, args=(port, "/gallery?q=blue", stop, heavy))
+                for _ in range(args.heavy_clients)]
+    for t in threads:
+        t.start()
+    time.sleep(args.seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+    server.shutdown()
+
+    ok = [s for c, s in light if c == 200]
+    label = "with admission" if admission else "no admission"
+    print(f"\n{label}")
+    print(f"  /item/<id>    {len(ok):>6} ok  {len(light) - len(ok):>5} failed   "
+          f"p50 {_pct(ok, .5) * 1000:7.1f} ms  p95 {_pct(ok, .95) * 1000:7.1f} ms  "
+          f"p99 {_pct(ok, .99) * 1000:7.1f} ms  max {max(ok, default=0) * 1000:7.1f} ms")
+    h_ok = [s for c, s in heavy if c == 200]
+    h_503 = [s for c, s in heavy if c == 503]
+    print(f"  /gallery?q=   {len(h_ok):>6} ok  {len(h_503):>5} 503   "
+          f"p50 {_pct(h_ok, .5) * 1000:7.1f} ms  "
+          f"503 answered in {statistics.median(h_503) * 1000 if h_503 else 0:.1f} ms (median)")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--seconds", type=float, default=10)
+    ap.add_argument("--heavy-clients", type=int, default=64)
+    ap.add_argument("--light-clients", type=int, default=8)
+    ap.add_argument("--backend", type=int, default=8, help="shared backend slots")
+    ap.add_argument("--max-active", type=int, default=8)
+    ap.add_argument("--cheap", default="8/32")
+    ap.add_argument("--expensive", default="4/4")
+    ap.add_argument("--queue-timeout", type=float, default=2.0)
+    args = ap.parse_args()
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)  # no access log per request
+    print(f"{args.heavy_clients} clients on /gallery?q= (200 ms), {args.light_clients} on /item/<id> (5 ms), "
+          f"{args.backend} backend slots, {args.seconds:g}s per run")
+    run(args, admission=False)
+    run(args, admission=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Compare /gallery HTML against the JSON catalogue API (needs a populated MySQL DB).
+
+    python benchmarks/bench_api_payload.py [--runs 20] [--limit 24]
+"""
+import argparse
+import gzip
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from project import create_app  # noqa: E402
+from project.compress import brotli  # noqa: E402
+
+
+def _sizes(body: bytes) -> dict:
+    out = {"raw": len(body), "gzip": len(gzip.compress(body, 6))}
+    if brotli is not None:
+        out["br"] = len(brotli.compress(body, quality=5))
+    return out
+
+
+def _timed(client, url, runs):
+    best = float("inf")
+    body = b""
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        resp = client.get(url)
+        best = min(best, time.perf_counter() - t0)
+        body = resp.get_data()
+    return body, best
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--runs", type=int, default=20)
+    ap.add_argument("--limit", type=int, default=24)
+    args = ap.parse_args()
+
+    app = create_app()
+    client = app.test_client()
+    cases = [
+        ("gallery (HTML)", "/gallery"),
+        ("api full rows", f"/api/v1/artworks?limit={args.limit}"),
+        ("api card fields", f"/api/v1/artworks?limit={args.limit}"
+                            "&fields=title,artistName,pricePerMonth,imageUrl,leaseStatus"),
+    ]
+    base = None
+    print(f"{'case':<18}{'best ms':>9}{'raw':>10}{'gzip':>9}{'br':>9}{'% of html':>11}")
+    for name, url in cases:
+        body, best = _timed(client, url, args.runs)
+        sizes = _sizes(body)
+        base = base or sizes["raw"]
+        print(f"{name:<18}{best * 1000:>9.2f}{sizes['raw']:>10}{sizes['gzip']:>9}"
+              f"{sizes.get('br', '-'):>9}{100.0 * sizes['raw'] / base:>10.1f}%")
+
+
+if __name__ == "__main__":
+    main()
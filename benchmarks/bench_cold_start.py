@@ -0,0 +1,78 @@
+"""
+Cold-start time of a fresh worker process: import + create_app, then the first
+requests it serves (needs a populated MySQL DB for the catalogue pages).
+
+    python benchmarks/bench_cold_start.py [--runs 5] [--url / --url /gallery]
+
+Each scenario starts new Python processes, so nothing is shared in memory;
+only the on-disk Jinja bytecode cache carries over between runs.
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = r"""
+import json, sys, time
+t0 = time.perf_counter()
+from project import create_app
+app = create_app()
+out = {"create_app": time.perf_counter() - t0}
+client = app.test_client()
+for url in sys.argv[1:]:
+    t1 = time.perf_counter()
+    client.get(url)
+    out[url] = time.perf_counter() - t1
+out["total"] = time.perf_counter() - t0
+print(json.dumps(out))
+"""
+
+
+def _run(env: dict, urls) -> dict:
+    proc = subprocess.run([sys.executable, "-c", CHILD, *urls], cwd=ROOT, env={**os.environ, **env},
+                          capture_output=True, text=True, check=True)
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--runs", type=int, default=5)
+    ap.add_argument("--url", action="append", dest="urls")
+    args = ap.parse_args()
+    urls = args.urls or ["/", "/gallery"]
+
+    bytecode_dir = tempfile.mkdtemp(prefix="jinja-bytecode-")
+    scenarios = [
+        # (label, env, clear the bytecode dir before every run)
+        ("lazy templates, no bytecode cache",
+         {"STARTUP_BYTECODE_DIR": "", "STARTUP_COMPILE_TEMPLATES": "0", "STARTUP_WARMUP": "0"}, True),
+        ("eager compile, empty bytecode cache",
+         {"STARTUP_BYTECODE_DIR": bytecode_dir, "STARTUP_COMPILE_TEMPLATES": "1", "STARTUP_WARMUP": "0"}, True),
+        ("eager compile, warm bytecode cache",
+         {"STARTUP_BYTECODE_DIR": bytecode_dir, "STARTUP_COMPILE_TEMPLATES": "1", "STARTUP_WARMUP": "0"}, False),
+        ("warm bytecode cache + warm-up",
+         {"STARTUP_BYTECODE_DIR": bytecode_dir, "STARTUP_COMPILE_TEMPLATES": "1", "STARTUP_WARMUP": "1"}, False),
+    ]
+    try:
+        cols = ["create_app", *urls, "total"]
+        print(f"{'scenario':<38}" + "".join(f"{c[:12]:>13}" for c in cols) + "   (median ms)")
+        for label, env, clear in scenarios:
+            results = []
+            for _ in range(args.runs):
+                if clear:
+                    shutil.rmtree(bytecode_dir, ignore_errors=True)
+                results.append(_run(env, urls))
+            print(f"{label:<38}" + "".join(
+                f"{statistics.median(r[c] for r in results) * 1000:>13.1f}" for c in cols))
+    finally:
+        shutil.rmtree(bytecode_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
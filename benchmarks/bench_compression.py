@@ -0,0 +1,67 @@
+"""
+Bytes on the wire and CPU cost of compressing the gallery page and the admin
+center's panels (needs a populated MySQL DB).
+
+    python benchmarks/bench_compression.py [--runs 20]
+"""
+import argparse
+import gzip
+import inspect
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from project import create_app  # noqa: E402
+from project.compress import brotli  # noqa: E402
+from project.views import admin_panels  # noqa: E402
+
+
+def _codecs():
+    out = [("identity", lambda b: b)]
+    for level in (1, 6, 9):
+        out.append((f"gzip-{level}", lambda b, l=level: gzip.compress(b, compresslevel=l)))
+    if brotli is not None:
+        for q in (4, 5, 11):
+            out.append((f"br-{q}", lambda b, q=q: brotli.compress(b, quality=q)))
+    return out
+
+
+def _measure(name, body, runs):
+    print(f"\n{name}: {len(body)} bytes uncompressed")
+    print(f"{'codec':<10}{'bytes':>10}{'ratio':>8}{'cpu ms':>9}")
+    for codec, fn in _codecs():
+        t0 = time.process_time()
+        for _ in range(runs):
+            out = fn(body)
+        cpu = (time.process_time() - t0) / runs
+        print(f"{codec:<10}{len(out):>10}{len(out) / len(body):>8.2f}{cpu * 1000:>9.3f}")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--runs", type=int, default=20)
+    args = ap.parse_args()
+
+    app = create_app()
+    client = app.test_client()
+    _measure("/gallery", client.get("/gallery").get_data(), args.runs)
+
+    # the admin center page is a shell; its data is the panels JSON it fetches.
+    # That needs a logged-in admin, so call the view without its login checks.
+    with app.test_request_context("/admin/center/panels"):
+        body = inspect.unwrap(admin_panels)().get_data()
+    _measure("/admin/center/panels", body, args.runs)
+
+    # end-to-end through the middleware
+    for enc in ("identity", "gzip", "br"):
+        t0 = time.perf_counter()
+        resp = client.get("/gallery", headers={"Accept-Encoding": enc})
+        ms = (time.perf_counter() - t0) * 1000
+        print(f"\n/gallery via app, Accept-Encoding={enc}: "
+              f"{len(resp.get_data())} bytes, {resp.headers.get('Content-Encoding', 'identity')}, {ms:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
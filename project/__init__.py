@@ -1,11 +1,27 @@
 # project/__init__.py
 import os
+import time
 from flask import Flask
 
 # binds Flask-MySQLdb in models.py and exposes get_db() etc.
 from .models import init_models, close_db
+from .compress import init_compression
+from .jobs import init_jobs
+from .uploads import init_uploads
+from .profiling import init_profiling
+from .metrics import init_metrics
+from .cache import init_cache
+from .archive import init_archive
+from .prerender import init_prerender
+from .leases import init_leases
+from .config import Config
+from .recommend import init_recommend
+from .palette import init_palette
+from .admission import init_admission
+from .startup import init_startup
 
 def create_app():
+    started = time.perf_counter()
     app = Flask(__name__, static_folder="static", template_folder="templates")
 
     # ---- Base config (override via env) ----
@@ -25,15 +41,158 @@ def create_app():
     os.makedirs(upload_dir, exist_ok=True)
     app.config["UPLOAD_FOLDER"] = upload_dir
     app.config["ALLOWED_IMAGE_EXTS"] = {"jpg", "jpeg", "png", "gif", "webp"}
+    # whole request body cap (Werkzeug answers 413 before reading an oversized body)
+    app.config["MAX_CONTENT_LENGTH"] = int(os.getenv("MAX_CONTENT_LENGTH", str(Config.MAX_CONTENT_LENGTH)))
+    # per-image caps, enforced while the file streams to disk
+    app.config["UPLOAD_MAX_IMAGE_BYTES"] = int(os.getenv("UPLOAD_MAX_IMAGE_BYTES", str(Config.MAX_CONTENT_LENGTH)))
+    app.config["UPLOAD_MAX_PIXELS"] = int(os.getenv("UPLOAD_MAX_PIXELS", str(50_000_000)))
+    # the format + dimensions must be readable within this many leading bytes
+    app.config["UPLOAD_SNIFF_BYTES"] = int(os.getenv("UPLOAD_SNIFF_BYTES", str(256 * 1024)))
+
+    # ---- Compression (gzip/br) ----
+    app.config["COMPRESS_ENABLED"] = os.getenv("COMPRESS_ENABLED", "1") == "1"
+    # bodies smaller than this are sent uncompressed (gzip/br overhead isn't worth it)
+    app.config["COMPRESS_MIN_SIZE"] = int(os.getenv("COMPRESS_MIN_SIZE", "500"))
+
+    # ---- Background jobs (SQLite queue, `flask jobs-worker`) ----
+    # off = handlers run inline in the request (no worker needed for local dev)
+    app.config["JOBS_ENABLED"] = os.getenv("JOBS_ENABLED", "0") == "1"
+    app.config["JOBS_DB"] = os.getenv("JOBS_DB", os.path.join(app.instance_path, "jobs.sqlite"))
+    app.config["JOBS_WORKERS"] = int(os.getenv("JOBS_WORKERS", "2"))
+    app.config["JOBS_MAX_ATTEMPTS"] = int(os.getenv("JOBS_MAX_ATTEMPTS", "5"))
+    app.config["JOBS_BACKOFF_BASE"] = float(os.getenv("JOBS_BACKOFF_BASE", "2"))     # seconds
+    app.config["JOBS_BACKOFF_MAX"] = float(os.getenv("JOBS_BACKOFF_MAX", "300"))     # seconds
+    app.config["JOBS_POLL_INTERVAL"] = float(os.getenv("JOBS_POLL_INTERVAL", "0.5"))  # seconds
+    # a running job whose worker hasn't finished within this window is retried
+    app.config["JOBS_LEASE_SECONDS"] = float(os.getenv("JOBS_LEASE_SECONDS", "600"))
+
+    # ---- Similar artworks (precomputed top-K, `flask recs-build`) ----
+    app.config["RECS_INDEX_PATH"] = os.getenv("RECS_INDEX_PATH", os.path.join(app.instance_path, "recs.npz"))
+    app.config["RECS_TOP_K"] = int(os.getenv("RECS_TOP_K", "8"))
+    app.config["RECS_BLOCK_SIZE"] = int(os.getenv("RECS_BLOCK_SIZE", "512"))
+    # how often a web worker checks the index file for a newer version (seconds)
+    app.config["RECS_RELOAD_INTERVAL"] = float(os.getenv("RECS_RELOAD_INTERVAL", "30"))
+
+    # ---- Admin analytics ----
+    app.config["ANALYTICS_CHUNK_SIZE"] = int(os.getenv("ANALYTICS_CHUNK_SIZE", "5000"))
+    # cache lifetime (seconds) for periods that include today vs. periods already over
+    app.config["ANALYTICS_CACHE_TTL"] = int(os.getenv("ANALYTICS_CACHE_TTL", "300"))
+    app.config["ANALYTICS_CLOSED_TTL"] = int(os.getenv("ANALYTICS_CLOSED_TTL", "86400"))
+
+    # ---- Request profiling (opt-in; results on /admin/profiles) ----
+    app.config["PROFILE_ENABLED"] = os.getenv("PROFILE_ENABLED", "0") == "1"
+    # fraction of requests sampled automatically; admins can force one with "X-Profile: 1"
+    app.config["PROFILE_SAMPLE_RATE"] = float(os.getenv("PROFILE_SAMPLE_RATE", "0.01"))
+    app.config["PROFILE_INTERVAL"] = float(os.getenv("PROFILE_INTERVAL", "0.005"))  # seconds between samples
+    app.config["PROFILE_DB"] = os.getenv("PROFILE_DB", os.path.join(app.instance_path, "profiles.sqlite"))
+    app.config["PROFILE_KEEP"] = int(os.getenv("PROFILE_KEEP", "500"))
+
+    # ---- Metrics (/metrics, merged across worker processes) ----
+    app.config["METRICS_ENABLED"] = os.getenv("METRICS_ENABLED", "1") == "1"
+    # per-process snapshot files; must be shared by all workers on the node
+    app.config["METRICS_DIR"] = os.getenv("METRICS_DIR", os.path.join(app.instance_path, "metrics"))
+    app.config["METRICS_FLUSH_INTERVAL"] = float(os.getenv("METRICS_FLUSH_INTERVAL", "1.0"))  # seconds
+    # optional bearer token required to scrape /metrics
+    app.config["METRICS_TOKEN"] = os.getenv("METRICS_TOKEN", "")
+
+    # ---- Cache (per-process L1 + node-shared L2, see cache.py) ----
+    app.config["CACHE_ENABLED"] = os.getenv("CACHE_ENABLED", "1") == "1"
+    app.config["CACHE_BACKEND"] = os.getenv("CACHE_BACKEND", "sqlite")  # sqlite | memory (tests)
+    app.config["CACHE_DB"] = os.getenv("CACHE_DB", os.path.join(app.instance_path, "cache.sqlite"))
+    app.config["CACHE_L1_SIZE"] = int(os.getenv("CACHE_L1_SIZE", "2048"))  # entries per process
+    app.config["CACHE_TTL"] = int(os.getenv("CACHE_TTL", "300"))  # seconds
+    # upper bound on how long another worker may serve a row changed elsewhere
+    app.config["CACHE_CHECK_INTERVAL"] = float(os.getenv("CACHE_CHECK_INTERVAL", "1.0"))  # seconds
+    app.config["CACHE_LOG_RETENTION"] = int(os.getenv("CACHE_LOG_RETENTION", "3600"))  # seconds
+    # list_artworks id lists per filter combination, per process
+    app.config["QUERY_CACHE_BYTES"] = int(os.getenv("QUERY_CACHE_BYTES", str(16 * 1024 * 1024)))
+
+    # ---- Archive (flask archive: cold rows -> <table>_archive) ----
+    app.config["ARCHIVE_ORDER_DAYS"] = int(os.getenv("ARCHIVE_ORDER_DAYS", "730"))  # order age horizon
+    app.config["ARCHIVE_BATCH_SIZE"] = int(os.getenv("ARCHIVE_BATCH_SIZE", "500"))  # rows per transaction
+
+    # ---- Popularity (write-behind view / cart / lease counters) ----
+    app.config["POPULARITY_ENABLED"] = os.getenv("POPULARITY_ENABLED", "1") == "1"
+    app.config["POPULARITY_FLUSH_INTERVAL"] = float(os.getenv("POPULARITY_FLUSH_INTERVAL", "10"))  # seconds
+    app.config["POPULARITY_RANK_INTERVAL"] = float(os.getenv("POPULARITY_RANK_INTERVAL", "60"))  # seconds
+    app.config["POPULARITY_BATCH_SIZE"] = int(os.getenv("POPULARITY_BATCH_SIZE", "500"))  # rows per upsert
+
+    # ---- Pre-rendering (static anonymous catalogue pages) ----
+    app.config["PRERENDER_DIR"] = os.getenv("PRERENDER_DIR", os.path.join(app.instance_path, "prerendered"))
+    # re-render changed items + gallery pages on artwork writes (via the job queue)
+    app.config["PRERENDER_ENABLED"] = os.getenv("PRERENDER_ENABLED", "0") == "1"
+    # answer anonymous GETs from PRERENDER_DIR (leave off when a CDN/nginx serves the files)
+    app.config["PRERENDER_SERVE"] = os.getenv("PRERENDER_SERVE", "0") == "1"
+    app.config["PRERENDER_MAX_AGE"] = int(os.getenv("PRERENDER_MAX_AGE", "60"))  # seconds
+
+    # ---- Admin center (lazy-loaded panels) ----
+    app.config["ADMIN_PAGE_SIZE"] = int(os.getenv("ADMIN_PAGE_SIZE", "25"))  # rows per panel page
+    # bulk artwork updates/deletes (/artworks/bulk): ids per UPDATE statement and commit
+    app.config["BULK_CHUNK_SIZE"] = int(os.getenv("BULK_CHUNK_SIZE", "500"))
+
+    # ---- Lease scheduler (flask leases: leaseStatus follows order_items dates) ----
+    app.config["LEASES_STATE_FILE"] = os.getenv("LEASES_STATE_FILE", os.path.join(app.instance_path, "leases.json"))
+    app.config["LEASES_POLL_INTERVAL"] = float(os.getenv("LEASES_POLL_INTERVAL", "30"))  # seconds
+    app.config["LEASES_BATCH_SIZE"] = int(os.getenv("LEASES_BATCH_SIZE", "500"))  # artworks per UPDATE
+    app.config["LEASES_POLL_OVERLAP"] = int(os.getenv("LEASES_POLL_OVERLAP", "1000"))  # ids re-read per poll
+
+    # ---- Suggest (artist / gallery / title type-ahead) ----
+    # full rebuild interval; writes in this process patch the index immediately
+    app.config["SUGGEST_REBUILD_INTERVAL"] = int(os.getenv("SUGGEST_REBUILD_INTERVAL", "300"))  # seconds
+    app.config["SUGGEST_MAX_RESULTS"] = int(os.getenv("SUGGEST_MAX_RESULTS", "20"))
+    app.config["SUGGEST_SCAN_LIMIT"] = int(os.getenv("SUGGEST_SCAN_LIMIT", "5000"))  # keys ranked per lookup
+
+    # ---- Colour search (palette.py, `flask palette-backfill`) ----
+    app.config["PALETTE_SAMPLE_SIZE"] = int(os.getenv("PALETTE_SAMPLE_SIZE", "64"))  # px, longest side
+    # an artwork matches a colour when this share of its pixels is near it
+    app.config["PALETTE_MIN_SHARE"] = float(os.getenv("PALETTE_MIN_SHARE", "0.15"))
+    app.config["PALETTE_RELOAD_INTERVAL"] = float(os.getenv("PALETTE_RELOAD_INTERVAL", "60"))  # seconds
+    app.config["PALETTE_BATCH_SIZE"] = int(os.getenv("PALETTE_BATCH_SIZE", "200"))  # palettes per upsert
+
+    # ---- Admission control (admission.py: per-class limits, 503 when full) ----
+    app.config["ADMISSION_ENABLED"] = os.getenv("ADMISSION_ENABLED", "1") == "1"
+    # all classes together; keep below the server's thread count (see admission.py)
+    app.config["ADMISSION_MAX_ACTIVE"] = int(os.getenv("ADMISSION_MAX_ACTIVE", "32"))
+    # "<concurrent>/<queued>" per class; cheap requests get freed slots first
+    app.config["ADMISSION_CHEAP"] = os.getenv("ADMISSION_CHEAP", "32/64")
+    app.config["ADMISSION_DEFAULT"] = os.getenv("ADMISSION_DEFAULT", "16/16")
+    app.config["ADMISSION_EXPENSIVE"] = os.getenv("ADMISSION_EXPENSIVE", "4/4")
+    app.config["ADMISSION_QUEUE_TIMEOUT"] = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "2.0"))  # seconds
+    app.config["ADMISSION_RETRY_AFTER"] = int(os.getenv("ADMISSION_RETRY_AFTER", "5"))  # seconds
+
+    # ---- Async mode (asgi.py: uvicorn asgi:app) ----
+    app.config["ASYNC_DB_POOL_MIN"] = int(os.getenv("ASYNC_DB_POOL_MIN", "1"))
+    # MySQL connections per worker process; also caps concurrent native requests
+    app.config["ASYNC_DB_POOL_MAX"] = int(os.getenv("ASYNC_DB_POOL_MAX", "20"))
+    # threads for the endpoints that stay sync (see admission.py for sizing)
+    app.config["ASYNC_WSGI_THREADS"] = int(os.getenv("ASYNC_WSGI_THREADS", "64"))
+
+    # ---- File delivery (delivery.py: static files and /uploads/) ----
+    # "" = the app server sends the file (sendfile, Range -> 206),
+    # "x-accel" = nginx X-Accel-Redirect, "x-sendfile" = Apache / lighttpd X-Sendfile
+    app.config["DELIVERY_MODE"] = os.getenv("DELIVERY_MODE", "").lower()
+    # nginx `internal` location aliased to project/static/ (x-accel only)
+    app.config["DELIVERY_ACCEL_PREFIX"] = os.getenv("DELIVERY_ACCEL_PREFIX", "/_static/")
+
+    # ---- Start-up (see startup.py) ----
+    # compiled templates shared by every worker on the node ("" = off)
+    app.config["STARTUP_BYTECODE_DIR"] = os.getenv("STARTUP_BYTECODE_DIR", os.path.join(app.instance_path, "jinja-bytecode"))
+    app.config["STARTUP_COMPILE_TEMPLATES"] = os.getenv("STARTUP_COMPILE_TEMPLATES", "1") == "1"
+    # prime the DB connection and read caches before serving (needs the DB; off for CLI/dev)
+    app.config["STARTUP_WARMUP"] = os.getenv("STARTUP_WARMUP", "0") == "1"
 
     # ---- DB bind & teardown ----
     init_models(app)
+    init_cache(app)
     app.teardown_appcontext(close_db)
 
     # ---- Blueprints ----
     from .views import main
     app.register_blueprint(main)
 
+    from .api import api
+    app.register_blueprint(api)
+
     # optional auth blueprint (if present)
     try:
         from .auth import auth
@@ -41,4 +200,17 @@ def create_app():
     except Exception:
         pass
 
+    init_metrics(app)
+    init_profiling(app)
+    init_uploads(app)
+    init_compression(app)
+    init_jobs(app)
+    init_archive(app)
+    init_prerender(app)
+    init_leases(app)
+    init_recommend(app)
+    init_palette(app)
+    init_admission(app)  # last middleware = outermost: shed load before anything else runs
+    init_startup(app, started)  # last: templates and warm-up need everything registered
+
     return app
@@ -0,0 +1,228 @@
+# project/admission.py
+"""
+Admission control: per-class concurrency limits with bounded queues.
+
+Every request is put in a class by endpoint before Flask handles it:
+
+    static     static files                               never limited
+    cheap      item pages, suggest, single-row API reads  woken first
+    default    everything not listed
+    expensive  admin center / analytics, gallery and API text search,
+               login / register (password hashing), uploads, bulk edits
+
+Each class has "limit/queue" (ADMISSION_CHEAP etc.): at most `limit` requests
+run at once, and up to `queue` more wait. All classes together may run at
+most ADMISSION_MAX_ACTIVE requests. When a slot frees, waiting cheap
+requests get it before default ones, and default before expensive ones.
+
+A request is answered 503 with Retry-After right away if its class queue is
+full. It also gets a 503 if it has waited ADMISSION_QUEUE_TIMEOUT without a
+slot. Waiting requests still hold a server thread, so the server should run
+at least ADMISSION_MAX_ACTIVE + the queue sizes threads. That way the queuing
+happens here, per class, and not in the server's accept backlog. With one
+thread per process (sync workers) every class is capped at 1 anyway.
+
+Metrics: admission_active / admission_queue_length gauges and
+admission_rejected_total / admission_wait_seconds, per class.
+"""
+import functools
+import threading
+import time
+from collections import deque
+from urllib.parse import parse_qs
+
+from werkzeug.exceptions import HTTPException
+from werkzeug.wsgi import ClosingIterator
+
+from .metrics import gauge_set, inc, observe
+
+# lower = served first when a slot frees
+PRIORITY = ("cheap", "default", "expensive")
+
+ENDPOINT_CLASSES = {
+    "static": "static",
+    "main.uploads_compat": "static",
+    "metrics": "cheap",
+    "main.home": "cheap",
+    "main.item_detail": "cheap",
+    "api.artworks_detail": "cheap",
+    "api.job_status": "cheap",
+    "api.suggest_names": "cheap",
+    "main.admin_center": "expensive",
+    "main.admin_panel": "expensive",
+    "main.admin_panels": "expensive",
+    "main.admin_analytics": "expensive",
+    "main.admin_profiles": "expensive",
+    "main.admin_profile_detail": "expensive",
+    "auth.login_post": "expensive",
+    "auth.register_post": "expensive",
+    "main.artworks_bulk": "expensive",
+}
+# catalogue listings: a LIKE scan with ?q=, otherwise answered from the query cache
+SEARCH_ENDPOINTS = {"main.gallery", "api.artworks_list"}
+
+
+def classify(endpoint: str, method: str, query_string: str) -> str:
+    if endpoint in SEARCH_ENDPOINTS:
+        return "expensive" if parse_qs(query_string).get("q") else "default"
+    if endpoint == "main.upload" and method == "POST":
+        return "expensive"
+    return ENDPOINT_CLASSES.get(endpoint, "default")
+
+
+def parse_class_spec(spec: str):
+    """'32/64' -> (limit, queue)"""
+    limit, _, queue = spec.partition("/")
+    return int(limit), int(queue or 0)
+
+
+class _Class:
+    def __init__(self, name, limit, queue):
+        self.name = name
+        self.limit = limit
+        self.queue = queue
+        self.active = 0
+        self.waiting = deque()  # of _Waiter
+
+
+class _Waiter:
+    __slots__ = ("event", "granted")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.granted = False
+
+
+class Limiter:
+    def __init__(self, classes: dict, max_active: int, queue_timeout: float):
+        self.classes = {name: _Class(name, *spec) for name, spec in classes.items()}
+        self.order = sorted(self.classes.values(), key=lambda c: PRIORITY.index(c.name))
+        self.max_active = max_active
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self._lock = threading.Lock()
+
+    def _can_run(self, c) -> bool:
+        return c.active < c.limit and self.active < self.max_active
+
+    def _start(self, c):
+        c.active += 1
+        self.active += 1
+
+    def _gauges(self, c):
+        gauge_set("admission_active", {"class": c.name}, c.active)
+        gauge_set("admission_queue_length", {"class": c.name}, len(c.waiting))
+
+    def acquire(self, name: str) -> bool:
+        """Block until a slot is free; False = rejected (queue full or waited too long)."""
+        c = self.classes[name]
+        with self._lock:
+            # behind anyone of this class already waiting
+            if not c.waiting and self._can_run(c):
+                self._start(c)
+                self._gauges(c)
+                return True
+            if len(c.waiting) >= c.queue:
+                inc("admission_rejected_total", {"class": name, "reason": "queue_full"})
+                return False
+            w = _Waiter()
+            c.waiting.append(w)
+            self._gauges(c)
+        t0 = time.perf_counter()
+        w.event.wait(self.queue_timeout)
+        with self._lock:
+            if not w.granted:
+                c.waiting.remove(w)
+                self._gauges(c)
+                inc("admission_rejected_total", {"class": name, "reason": "timeout"})
+                return False
+        observe("admission_wait_seconds", {"class": name}, time.perf_counter() - t0)
+        return True
+
+    def release(self, name: str):
+        with self._lock:
+            c = self.classes[name]
+            c.active -= 1
+            self.active -= 1
+            # hand freed slots out in priority order
+            for q in self.order:
+                while q.waiting and self._can_run(q):
+                    w = q.waiting.popleft()
+                    w.granted = True
+                    self._start(q)
+                    w.event.set()
+                self._gauges(q)
+
+
+class AdmissionMiddleware:
+    """WSGI middleware: classify, wait for a slot (or 503), release when the body is done."""
+
+    def __init__(self, wsgi_app, url_map, limiter: Limiter, retry_after: int = 5):
+        self.wsgi_app = wsgi_app
+        self.url_map = url_map
+        self.limiter = limiter
+        self.retry_after = str(retry_after)
+
+    def _class_of(self, environ) -> str:
+        try:
+            endpoint, _ = self.url_map.bind_to_environ(environ).match()
+        except HTTPException:
+            return "default"  # 404 / 405 / redirects: let Flask answer them
+        return classify(endpoint, environ.get("REQUEST_METHOD", "GET"),
+                        environ.get("QUERY_STRING", ""))
+
+    def _reject(self, start_response):
+        body = b"Server busy, please retry shortly.\n"
+        start_response("503 Service Unavailable", [
+            ("Content-Type", "text/plain; charset=utf-8"),
+            ("Content-Length", str(len(body))),
+            ("Retry-After", self.retry_after),
+            ("Cache-Control", "no-store"),
+        ])
+        return [body]
+
+    def __call__(self, environ, start_response):
+        name = self._class_of(environ)
+        if name not in self.limiter.classes:
+            return self.wsgi_app(environ, start_response)
+        if not self.limiter.acquire(name):
+            return self._reject(start_response)
+        try:
+            app_iter = self.wsgi_app(environ, start_response)
+        except BaseException:
+            self.limiter.release(name)
+            raise
+        # the slot is held until the server closes the body (sent, or the client went away)
+        release = functools.partial(self.limiter.release, name)
+        wrapper = environ.get("wsgi.file_wrapper")
+        if isinstance(wrapper, type) and isinstance(app_iter, wrapper):
+            # the server's own file wrapper (delivery.py) must reach it unwrapped, or
+            # it can't sendfile(); release from the wrapper's close() instead
+            return _release_on_close(app_iter, release)
+        return ClosingIterator(app_iter, release)
+
+
+def _release_on_close(app_iter, release):
+    close = getattr(app_iter, "close", None)
+
+    def _close():
+        try:
+            if close is not None:
+                close()
+        finally:
+            release()
+    app_iter.close = _close
+    return app_iter
+
+
+def init_admission(app):
+    """Install last so the limiter is the outermost middleware."""
+    cfg = app.config
+    if not cfg.get("ADMISSION_ENABLED"):
+        return
+    limiter = Limiter(
+        {name: parse_class_spec(cfg[f"ADMISSION_{name.upper()}"]) for name in PRIORITY},
+        cfg["ADMISSION_MAX_ACTIVE"], cfg["ADMISSION_QUEUE_TIMEOUT"],
+    )
+    app.extensions["admission"] = limiter
+    app.wsgi_app = AdmissionMiddleware(app.wsgi_app, app.url_map, limiter, cfg["ADMISSION_RETRY_AFTER"])
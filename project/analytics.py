@@ -0,0 +1,233 @@
+# project/analytics.py
+"""
+Revenue and utilisation rollups for the admin center.
+
+order_items are streamed in chunks into NumPy arrays; all grouping is done with
+bincount / interval arithmetic instead of per-row Python. Results are cached per
+period (closed periods much longer than the current one).
+"""
+import threading
+import time
+from datetime import date
+
+import numpy as np
+from flask import current_app
+
+from .models import get_db, _source, artwork_lookup
+from .metrics import cache_lookup
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+# ---------------- date helpers ----------------
+def add_months_np(start: np.ndarray, months: np.ndarray) -> np.ndarray:
+    """
+    Vectorised twin of views._add_months: same month, N months later, with the
+    day clamped to the length of the target month (Jan 31 + 1 -> Feb 28/29).
+    """
+    start = start.astype("datetime64[D]")
+    first = start.astype("datetime64[M]")
+    day = (start - first.astype("datetime64[D]")).astype(np.int64)  # 0-based
+    target = first + months.astype(np.int64)
+    days_in = ((target + 1).astype("datetime64[D]") - target.astype("datetime64[D]")).astype(np.int64)
+    return target.astype("datetime64[D]") + np.minimum(day, days_in - 1)
+
+
+def month_index(d: np.ndarray) -> np.ndarray:
+    """datetime64 -> months since 1970-01 (int)."""
+    return d.astype("datetime64[M]").astype(np.int64)
+
+
+def month_label(idx: int) -> str:
+    return str(np.datetime64(int(idx), "M"))
+
+
+# ---------------- loading ----------------
+def load_order_items(start: date, end: date, chunk_size: int = 5000, include_archived: bool = True) -> dict:
+    """
+    Lease lines overlapping [start, end) as column arrays:
+    artworkId, providerId, genre, title, startDate, endDate, months, totalPrice.
+    Archived orders count by default: reports cover history, not just hot rows.
+    Artwork columns are looked up by id afterwards rather than joined, so neither
+    side has to go through an unindexed hot+archive UNION; lines whose artwork
+    row is gone drop out, as they did with the join.
+    """
+    cols = {k: [] for k in ("artworkId", "startDate", "endDate", "months", "totalPrice")}
+    overlap = "startDate < %s AND (endDate IS NULL OR endDate > %s)"
+    src, src_params = _source("order_items", include_archived, "oi", where=overlap, params=(end, start))
+    db = get_db()
+    with db.cursor() as cur:
+        cur.execute(f"""
+            SELECT oi.artworkId, oi.startDate, oi.endDate, oi.months, oi.totalPrice
+            FROM {src}
+            WHERE oi.startDate < %s AND (oi.endDate IS NULL OR oi.endDate > %s)
+        """, (*src_params, end, start))
+        while True:
+            chunk = cur.fetchmany(chunk_size)
+            if not chunk:
+                break
+            for k, acc in cols.items():
+                acc.extend(r[k] for r in chunk)
+        ids = sorted(set(cols["artworkId"]))
+        artworks = {}
+        for i in range(0, len(ids), chunk_size):
+            artworks.update(artwork_lookup(cur, ids[i:i + chunk_size],
+                                           ("providerId", "genre", "title"), include_archived))
+
+    keep = [i for i, a in enumerate(cols["artworkId"]) if a in artworks]
+    if len(keep) < len(cols["artworkId"]):
+        cols = {k: [acc[i] for i in keep] for k, acc in cols.items()}
+    for k in ("providerId", "genre", "title"):
+        cols[k] = [artworks[a][k] for a in cols["artworkId"]]
+
+    n = len(cols["artworkId"])
+    starts = np.array(cols["startDate"], dtype="datetime64[D]") if n else np.array([], "datetime64[D]")
+    months = np.array([max(1, int(round(float(m or 1)))) for m in cols["months"]], dtype=np.int64)
+    ends = np.array([e if e is not None else np.datetime64("NaT") for e in cols["endDate"]],
+                    dtype="datetime64[D]") if n else np.array([], "datetime64[D]")
+    missing = np.isnat(ends)
+    if missing.any():
+        ends[missing] = add_months_np(starts[missing], months[missing])
+    return {
+        "artworkId": np.array(cols["artworkId"], dtype=np.int64),
+        "providerId": np.array(cols["providerId"], dtype=np.int64),
+        "genre": np.array([g or "" for g in cols["genre"]], dtype=object),
+        "title": cols["title"],
+        "startDate": starts,
+        "endDate": ends,
+        "months": months,
+        "totalPrice": np.array([float(t or 0) for t in cols["totalPrice"]], dtype=np.float64),
+    }
+
+
+# ---------------- rollups ----------------
+def revenue_by_month(items: dict, start: date, end: date):
+    """
+    Lease revenue recognised per calendar month: each line's totalPrice is spread
+    evenly over its `months` lease months, beginning with the start month.
+    Returns (month_indices, amounts) covering every month in [start, end).
+    """
+    m0, m1 = month_index(np.datetime64(start, "D")), month_index(np.datetime64(end, "D"))
+    n = items["months"]
+    if len(n) == 0:
+        return np.arange(m0, m1), np.zeros(m1 - m0)
+    owner = np.repeat(np.arange(len(n)), n)
+    offset = np.arange(n.sum()) - np.repeat(np.cumsum(n) - n, n)
+    month = month_index(items["startDate"])[owner] + offset
+    amount = (items["totalPrice"] / n)[owner]
+    inside = (month >= m0) & (month < m1)
+    totals = np.bincount(month[inside] - m0, weights=amount[inside], minlength=m1 - m0)
+    return np.arange(m0, m1), totals
+
+
+def _recognised_per_line(items: dict, start: date, end: date) -> np.ndarray:
+    """Share of each line's revenue that falls in [start, end) months."""
+    n = items["months"]
+    if len(n) == 0:
+        return np.zeros(0)
+    m0, m1 = month_index(np.datetime64(start, "D")), month_index(np.datetime64(end, "D"))
+    first = month_index(items["startDate"])
+    last = first + n  # exclusive
+    covered = np.clip(np.minimum(last, m1) - np.maximum(first, m0), 0, None)
+    return items["totalPrice"] * covered / n
+
+
+def revenue_by_group(keys: np.ndarray, amounts: np.ndarray):
+    """Sum amounts per distinct key -> [(key, total)] sorted by total desc."""
+    if len(keys) == 0:
+        return []
+    uniq, inv = np.unique(keys, return_inverse=True)
+    totals = np.bincount(inv, weights=amounts, minlength=len(uniq))
+    order = np.argsort(-totals)
+    return [(uniq[i], float(totals[i])) for i in order]
+
+
+def occupancy(items: dict, start: date, end: date):
+    """
+    Leased-days ratio per artwork over [start, end). Overlapping leases of the same
+    artwork are merged (union of intervals) so a day is never counted twice.
+    Returns (artworkIds, leased_days, ratio).
+    """
+    p0, p1 = np.datetime64(start, "D"), np.datetime64(end, "D")
+    period_days = int((p1 - p0).astype(np.int64))
+    if len(items["artworkId"]) == 0 or period_days <= 0:
+        return np.array([], np.int64), np.array([], np.int64), np.array([])
+
+    uniq, art = np.unique(items["artworkId"], return_inverse=True)
+    # clip every lease into [0, period_days]; leases outside the period become empty
+    s = np.clip((items["startDate"] - p0).astype(np.int64), 0, period_days)
+    e = np.clip((items["endDate"] - p0).astype(np.int64), 0, period_days)
+    e = np.maximum(e, s)
+
+    # shift each artwork into its own disjoint range so one global running max
+    # of end days works as a per-artwork running max
+    span = period_days + 1
+    s_off, e_off = s + art * span, e + art * span
+    order = np.lexsort((s_off, art))
+    s_off, e_off, art_sorted = s_off[order], e_off[order], art[order]
+    prev_end = np.concatenate([[np.iinfo(np.int64).min], np.maximum.accumulate(e_off)[:-1]])
+    # only the part of each lease past everything before it (same artwork) is new
+    new_days = np.clip(e_off - np.maximum(s_off, prev_end), 0, None)
+    leased = np.bincount(art_sorted, weights=new_days, minlength=len(uniq)).astype(np.int64)
+    return uniq, leased, leased / period_days
+
+
+# ---------------- report ----------------
+def _provider_names(provider_ids) -> dict:
+    ids = [int(i) for i in provider_ids]
+    if not ids:
+        return {}
+    db = get_db()
+    with db.cursor() as cur:
+        cur.execute(f"""
+            SELECT providerId, COALESCE(NULLIF(galleryName, ''), artistName) AS name
+            FROM providers
+            WHERE providerId IN ({",".join(["%s"] * len(ids))})
+        """, ids)
+        return {r["providerId"]: r["name"] for r in cur.fetchall()}
+
+
+def _compute(start: date, end: date) -> dict:
+    items = load_order_items(start, end, current_app.config["ANALYTICS_CHUNK_SIZE"])
+    months, monthly = revenue_by_month(items, start, end)
+    per_line = _recognised_per_line(items, start, end)
+    art_ids, leased, ratio = occupancy(items, start, end)
+    titles = dict(zip(items["artworkId"].tolist(), items["title"]))
+    order = np.argsort(-ratio)
+    by_provider = revenue_by_group(items["providerId"], per_line)
+    names = _provider_names(k for k, _ in by_provider)
+    return {
+        "start": start,
+        "end": end,
+        "lines": int(len(items["artworkId"])),
+        "total": float(monthly.sum()),
+        "by_month": [(month_label(m), float(v)) for m, v in zip(months, monthly)],
+        "by_provider": [(names.get(int(k)) or f"Provider #{k}", v) for k, v in by_provider],
+        "by_genre": [(str(k) or "-", v) for k, v in revenue_by_group(items["genre"], per_line)],
+        "occupancy": [
+            {"artworkId": int(art_ids[i]), "title": titles.get(int(art_ids[i])),
+             "leasedDays": int(leased[i]), "ratio": float(ratio[i])}
+            for i in order
+        ],
+        "computed_at": time.time(),
+    }
+
+
+def revenue_report(start: date, end: date) -> dict:
+    """Cached per (start, end); periods that ended before today rarely change."""
+    cfg = current_app.config
+    ttl = cfg["ANALYTICS_CACHE_TTL"] if end > date.today() else cfg["ANALYTICS_CLOSED_TTL"]
+    key = (start, end)
+    with _cache_lock:
+        hit = _cache.get(key)
+    if hit and time.time() - hit["computed_at"] < ttl:
+        cache_lookup("analytics", True)
+        return hit
+    cache_lookup("analytics", False)
+    report = _compute(start, end)
+    with _cache_lock:
+        if len(_cache) >= 64:
+            _cache.pop(next(iter(_cache)))
+        _cache[key] = report
+    return report
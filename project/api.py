@@ -0,0 +1,155 @@
+# project/api.py
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+from flask import Blueprint, Response, request
+
+from .models import list_artworks, get_artwork, ARTWORK_FIELDS
+from .views import can_see_job, read_filters
+from .jobs import get_job
+from .suggest import KINDS, suggest
+
+# orjson is optional; it is several times faster than the stdlib encoder
+try:
+    import orjson
+except Exception:
+    orjson = None
+
+api = Blueprint("api", __name__, url_prefix="/api")
+
+DEFAULT_PAGE_SIZE = 24
+MAX_PAGE_SIZE = 100
+
+
+# ------------- encoding -------------
+def _json_default(obj):
+    # DECIMAL(10,2) prices fit a double exactly enough for display / sorting
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, (date, datetime)):
+        return obj.isoformat()
+    raise TypeError(f"Not JSON serializable: {type(obj).__name__}")
+
+
+def dumps(payload) -> bytes:
+    """Compact JSON bytes (no whitespace, UTF-8)."""
+    if orjson is not None:
+        return orjson.dumps(payload, default=_json_default)
+    return json.dumps(payload, default=_json_default, ensure_ascii=False,
+                      separators=(",", ":")).encode("utf-8")
+
+
+def json_response(payload, status: int = 200) -> Response:
+    """JSON response; gzip/br negotiation is done by CompressionMiddleware."""
+    return Response(dumps(payload), status=status, mimetype="application/json")
+
+
+def _error(message: str, status: int) -> Response:
+    return json_response({"error": message}, status)
+
+
+# ------------- helpers -------------
+def _fields():
+    """?fields=title,pricePerMonth -> validated list (None = all columns)."""
+    raw = (request.args.get("fields") or "").strip()
+    if not raw:
+        return None
+    fields = [f.strip() for f in raw.split(",") if f.strip()]
+    unknown = [f for f in fields if f not in ARTWORK_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown field(s): {', '.join(unknown)}")
+    return fields
+
+
+def _page_size():
+    try:
+        n = int(request.args.get("limit") or DEFAULT_PAGE_SIZE)
+    except ValueError:
+        raise ValueError("limit must be an integer")
+    return max(1, min(n, MAX_PAGE_SIZE))
+
+
+def _project(row: dict, fields):
+    # artworkId is always selected (keyset cursor) but only returned if asked for
+    if fields and "artworkId" not in fields:
+        row = {k: v for k, v in row.items() if k != "artworkId"}
+    return row
+
+
+# ------------- endpoints -------------
+@api.get("/v1/artworks")
+def artworks_list():
+    """
+    Same filters as /gallery, plus:
+      fields=<comma list>  sparse fieldset (trims the response; rows are
+                           read whole through the artwork row cache)
+      limit=<1..100>       page size
+      after=<artworkId>    keyset cursor (value of "next" from the previous page)
+    """
+    try:
+        fields = _fields()
+        limit = _page_size()
+        after = request.args.get("after")
+        after = int(after) if after else None
+        filters = read_filters(request.args)
+        # one extra row tells us whether another page exists
+        rows = list_artworks(filters, fields=fields, after_id=after, limit=limit + 1)
+    except ValueError as e:
+        return _error(str(e), 400)
+
+    more = len(rows) > limit
+    rows = rows[:limit]
+    return json_response({
+        "items": [_project(r, fields) for r in rows],
+        "next": rows[-1]["artworkId"] if more else None,
+    })
+
+
+@api.get("/v1/artworks/<int:artwork_id>")
+def artworks_detail(artwork_id: int):
+    try:
+        fields = _fields()
+    except ValueError as e:
+        return _error(str(e), 400)
+    row = get_artwork(artwork_id, fields=fields)
+    if not row:
+        return _error("Artwork not found", 404)
+    return json_response(_project(row, fields))
+
+
+@api.get("/v1/jobs/<int:job_id>")
+def job_status(job_id: int):
+    """Polled by the UI after handing work off (checkout); submitter or admin only."""
+    job = get_job(job_id) if can_see_job(job_id) else None
+    if not job:
+        return _error("Job not found", 404)  # same answer for other people's jobs
+    return json_response({
+        "jobId": job["jobId"],
+        "kind": job["kind"],
+        "status": job["status"],
+        "attempts": job["attempts"],
+        "result": job["result"],
+        # the exception line only; tracebacks stay in the worker log
+        "error": job["lastError"].strip().splitlines()[-1] if job["lastError"] else None,
+    })
+
+
+@api.get("/suggest")
+def suggest_names():
+    """
+    Type-ahead for the gallery filters:
+      q=<prefix>                  case / accent-insensitive, matches any word start
+      kind=artist|gallery|title   optional
+      limit=<n>                   default 10
+    """
+    kind = request.args.get("kind") or None
+    if kind and kind not in KINDS:
+        return _error(f"kind must be one of: {', '.join(KINDS)}", 400)
+    try:
+        limit = max(1, int(request.args.get("limit") or 10))
+    except ValueError:
+        return _error("limit must be an integer", 400)
+    resp = json_response({"items": suggest(request.args.get("q", ""), kind, limit)})
+    resp.headers["Cache-Control"] = "public, max-age=60"
+    return resp
@@ -0,0 +1,129 @@
+# project/archive.py
+"""
+Hot/cold partitioning: cold rows move from artworks / orders / order_items
+into <table>_archive twins (CREATE TABLE ... LIKE, so same columns and indexes,
+no foreign keys).
+
+    flask archive                 # everything eligible, in batches
+    flask archive --max-batches 10 --sleep 0.5
+
+Eligible rows:
+  orders       orderDate older than ARCHIVE_ORDER_DAYS and every lease line ended
+               (moved together with their order_items)
+  artworks     soft-deleted and not referenced by any order_items row still hot
+
+Each batch is one transaction (copy, then delete), so an interrupted run loses
+nothing and simply continues on the next run. Readers only see archived rows
+when they pass include_archived=True (see models._source).
+"""
+import time
+from datetime import date, timedelta
+
+import click
+
+from .models import get_db, ARCHIVE_SUFFIX
+
+ARCHIVED_TABLES = ("artworks", "orders", "order_items")
+
+
+def ensure_archive_tables():
+    db = get_db()
+    with db.cursor() as cur:
+        for table in ARCHIVED_TABLES:
+            cur.execute(f"CREATE TABLE IF NOT EXISTS {table}{ARCHIVE_SUFFIX} LIKE {table}")
+    db.commit()
+
+
+def _move(cur, table: str, pk: str, ids: list):
+    marks = ",".join(["%s"] * len(ids))
+    # IGNORE: rows already present (e.g. copied by hand) must not abort the batch
+    cur.execute(f"INSERT IGNORE INTO {table}{ARCHIVE_SUFFIX} SELECT * FROM {table} WHERE {pk} IN ({marks})", ids)
+    cur.execute(f"DELETE FROM {table} WHERE {pk} IN ({marks})", ids)
+
+
+def _batches(select_sql: str, params: tuple, pk: str, move, batch_size: int, max_batches=None, pause=0.0):
+    """Run select_sql (keyset on pk) and move() each batch of ids in its own transaction."""
+    db = get_db()
+    after, moved, batches = 0, 0, 0
+    while max_batches is None or batches < max_batches:
+        with db.cursor() as cur:
+            cur.execute(select_sql, (after, *params, batch_size))
+            ids = [r[pk] for r in cur.fetchall()]
+            if not ids:
+                db.rollback()
+                break
+            try:
+                move(cur, ids)
+            except Exception:
+                db.rollback()
+                raise
+        db.commit()
+        after = ids[-1]  # skipped (ineligible) rows are never rescanned in this run
+        moved += len(ids)
+        batches += 1
+        if pause:
+            time.sleep(pause)
+    return moved
+
+
+def archive_orders(cutoff: date, batch_size: int = 500, max_batches=None, pause: float = 0.0) -> int:
+    """Move orders placed before cutoff whose leases have all ended. Returns orders moved."""
+    def move(cur, order_ids):
+        marks = ",".join(["%s"] * len(order_ids))
+        cur.execute(f"SELECT orderItemId FROM order_items WHERE orderId IN ({marks})", order_ids)
+        item_ids = [r["orderItemId"] for r in cur.fetchall()]
+        if item_ids:
+            _move(cur, "order_items", "orderItemId", item_ids)  # before orders: FK cascades
+        _move(cur, "orders", "orderId", order_ids)
+
+    return _batches("""
+        SELECT o.orderId
+        FROM orders o
+        WHERE o.orderId > %s AND o.orderDate < %s
+          AND NOT EXISTS (
+            SELECT 1 FROM order_items oi
+            WHERE oi.orderId = o.orderId AND (oi.endDate IS NULL OR oi.endDate >= CURDATE())
+          )
+        ORDER BY o.orderId
+        LIMIT %s
+        FOR UPDATE
+    """, (cutoff,), "orderId", move, batch_size, max_batches, pause)
+
+
+def archive_artworks(batch_size: int = 500, max_batches=None, pause: float = 0.0) -> int:
+    """Move soft-deleted artworks no hot order line points at. Returns artworks moved."""
+    return _batches("""
+        SELECT a.artworkId
+        FROM artworks a
+        WHERE a.artworkId > %s AND a.isDeleted = 1
+          AND NOT EXISTS (SELECT 1 FROM order_items oi WHERE oi.artworkId = a.artworkId)
+        ORDER BY a.artworkId
+        LIMIT %s
+        FOR UPDATE
+    """, (), "artworkId", lambda cur, ids: _move(cur, "artworks", "artworkId", ids), batch_size, max_batches, pause)
+
+
+def order_cutoff(days: int) -> date:
+    return date.today() - timedelta(days=days)
+
+
+def init_archive(app):
+    @app.cli.command("archive")
+    @click.option("--what", type=click.Choice(["all", "orders", "artworks"]), default="all")
+    @click.option("--older-than-days", type=int, default=None, help="Order horizon (default ARCHIVE_ORDER_DAYS).")
+    @click.option("--batch-size", type=int, default=None, help="Rows per transaction (default ARCHIVE_BATCH_SIZE).")
+    @click.option("--max-batches", type=int, default=None, help="Stop after this many batches per table.")
+    @click.option("--sleep", "pause", type=float, default=0.0, help="Seconds to pause between batches.")
+    def archive_command(what, older_than_days, batch_size, max_batches, pause):
+        """Move old orders and soft-deleted artworks into the archive tables."""
+        cfg = app.config
+        batch_size = batch_size or cfg["ARCHIVE_BATCH_SIZE"]
+        days = cfg["ARCHIVE_ORDER_DAYS"] if older_than_days is None else older_than_days
+        ensure_archive_tables()
+        # orders first: archiving their lines is what frees deleted artworks
+        if what in ("all", "orders"):
+            n = archive_orders(order_cutoff(days), batch_size, max_batches, pause)
+            click.echo(f"orders archived: {n}")
+        if what in ("all", "artworks"):
+            n = archive_artworks(batch_size, max_batches, pause)
+            click.echo(f"artworks archived: {n}")
@@ -0,0 +1,577 @@
+# project/asgi.py
+"""
+Async serving mode (ASGI).
+
+    uvicorn asgi:app --workers 4
+    uvicorn --factory project.asgi:create_asgi_app
+
+The gallery, item page, catalogue JSON API and checkout run as coroutines
+on an aiomysql connection pool: a request waiting on MySQL holds a pool
+connection, not a thread. Queries that don't depend on each other go out
+together with asyncio.gather (an item row and its similar artworks, the
+catalogue id query and the colour match, checkout's payment and address
+rows). Everything else (auth, uploads, admin, static files) is the
+unchanged Flask app, run in a pool of ASYNC_WSGI_THREADS threads.
+
+Native requests get the same Flask request context and hooks as sync ones
+(metrics, profiling, pre-rendered pages, session, flash) and use the same
+caches. Only the views' own code and the aiomysql queries run on the event
+loop. Everything sync that may block goes to a thread: the request hooks
+(before_request, error handlers, after_request, teardown), the login loader,
+row-cache and version lookups (the L2 store is a SQLite file), the
+similar-artworks and palette index loads, and job submit. WSGI middleware
+only sees thread-pool requests: native responses are compressed here, and
+their concurrency is bounded by the pool (ASYNC_DB_POOL_MAX) instead of by
+admission control.
+
+Request bodies are read before dispatch, up to MAX_CONTENT_LENGTH (413
+beyond it), so chunked uploads reach Flask with a Content-Length.
+
+aiomysql is optional; without it every request goes to the thread pool.
+run.py and any WSGI server keep serving the sync app as before.
+"""
+import asyncio
+import contextvars
+import functools
+import sys
+import tempfile
+import time
+from bisect import bisect_right
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import abort, current_app, flash, g, redirect, render_template, request, session, url_for
+from flask_login import current_user
+from werkzeug.exceptions import HTTPException, RequestEntityTooLarge
+
+from .api import _error, _fields, _page_size, _project, json_response
+from .cache import _copy
+from .compress import compress, is_compressible, negotiate_encoding
+from .models import _artwork_columns, _artwork_where, _pick, _query_key
+from .palette import NAMED_COLOURS, colour_matches, parse_colour, sort_by_colour
+from .popularity import record as record_event, sort_by_popularity
+from .prerender import RENDER_HEADER
+from .recommend import similar_ids
+from .views import _cart, _parse_float, check_colour, checkout_form, checkout_placed, read_filters
+
+# aiomysql is optional; without it there are no native views
+try:
+    import aiomysql
+except Exception:
+    aiomysql = None
+
+BODY_SPOOL_SIZE = 1 << 20  # request bodies above this go to a temp file (uploads)
+
+
+# ---------------- database ----------------
+def _db_timing(seconds: float):
+    # same counters as models._TimedCursor, so metrics see async queries too
+    g._db_time = g.get("_db_time", 0.0) + seconds
+    g._db_queries = g.get("_db_queries", 0) + 1
+
+
+class AsyncDB:
+    """aiomysql pool, created on first use inside the server's event loop."""
+
+    def __init__(self, config):
+        self.config = config
+        self.pool = None
+        self._lock = asyncio.Lock()
+
+    async def _pool(self):
+        if self.pool is None:
+            async with self._lock:
+                if self.pool is None:
+                    cfg = self.config
+                    self.pool = await aiomysql.create_pool(
+                        host=cfg["MYSQL_HOST"], port=cfg["MYSQL_PORT"],
+                        user=cfg["MYSQL_USER"], password=cfg["MYSQL_PASSWORD"],
+                        db=cfg["MYSQL_DB"], charset="utf8mb4", autocommit=True,
+                        cursorclass=aiomysql.DictCursor,
+                        minsize=cfg["ASYNC_DB_POOL_MIN"], maxsize=cfg["ASYNC_DB_POOL_MAX"],
+                    )
+        return self.pool
+
+    async def execute(self, sql: str, params=()):
+        """(rows, lastrowid) of one statement on a pooled connection."""
+        pool = await self._pool()
+        async with pool.acquire() as conn:
+            async with conn.cursor() as cur:
+                t0 = time.perf_counter()
+                try:
+                    await cur.execute(sql, params)
+                    rows = await cur.fetchall()
+                finally:
+                    _db_timing(time.perf_counter() - t0)
+                return rows, cur.lastrowid
+
+    async def fetchall(self, sql: str, params=()) -> list:
+        return list((await self.execute(sql, params))[0] or ())
+
+    async def insert(self, sql: str, params=()) -> int:
+        return (await self.execute(sql, params))[1]
+
+    async def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            await self.pool.wait_closed()
+            self.pool = None
+
+
+# ---------------- catalogue (async twins of models.list_artworks & co.) ----------------
+async def _query_ids(aio, filters: dict) -> list:
+    where, params = _artwork_where(filters)
+    rows = await aio.db.fetchall(f"""
+      SELECT artworkId
+      FROM artworks
+      WHERE {" AND ".join(where)}
+      ORDER BY artworkId DESC
+    """, params)
+    return [r["artworkId"] for r in rows]
+
+
+async def _cached_ids(aio, filters: dict) -> tuple:
+    """Ids matching the SQL filters, through the query cache (one load per key at a time)."""
+    c = current_app.extensions.get("cache")
+    if c is None:
+        return tuple(await _query_ids(aio, filters))
+    qc = current_app.extensions["query_cache"]
+    key = ("catalogue", _query_key(filters))
+    version = await asyncio.to_thread(c.version, "catalogue")  # may read the L2 log
+    ids = qc.peek(key, version)
+    if ids is not None:
+        return ids
+    if key in aio.inflight:
+        return await asyncio.shield(aio.inflight[key])
+    fut = aio.inflight[key] = asyncio.get_running_loop().create_future()
+    try:
+        ids = qc.put(key, await _query_ids(aio, filters), version)
+        fut.set_result(ids)
+        return ids
+    except BaseException as e:
+        fut.set_exception(e)
+        fut.exception()  # retrieved: no "never retrieved" warning when nobody waited
+        raise
+    finally:
+        del aio.inflight[key]
+
+
+async def artwork_ids(aio, filters: dict) -> tuple:
+    """Matching ids, newest first; the colour is matched per request, as in models.list_artworks."""
+    colour = filters.get("colour")
+    if not colour:
+        return await _cached_ids(aio, filters)
+    parse_colour(colour)  # ValueError before any query
+    # the palette matrix may need a (sync) reload; match while the ids load
+    ids, matches = await asyncio.gather(_cached_ids(aio, dict(filters, colour="")),
+                                        asyncio.to_thread(colour_matches, colour))
+    return tuple(i for i in ids if i in matches)
+
+
+async def _load_artworks(aio, ids) -> dict:
+    rows = await aio.db.fetchall(f"""
+      SELECT {_artwork_columns()}
+      FROM artworks
+      WHERE artworkId IN ({",".join(["%s"] * len(ids))}) AND isDeleted=0
+    """, list(ids))
+    return {r["artworkId"]: r for r in rows}
+
+
+async def artworks(aio, ids, fields=None) -> list:
+    """Non-deleted artworks for ids, in the order of ids (artwork row cache first)."""
+    ids = [int(i) for i in ids]
+    if not ids:
+        return []
+    c = current_app.extensions.get("cache")
+    if c is None:
+        by_id = await _load_artworks(aio, dict.fromkeys(ids))
+    else:
+        # L2 is a SQLite file: its reads and writes go to a thread
+        by_id, missing, since = await asyncio.to_thread(c.lookup, "artwork", dict.fromkeys(ids))
+        if missing:
+            loaded = await _load_artworks(aio, missing)
+            await asyncio.to_thread(c.fill, "artwork", by_id, missing, loaded, since)
+    return [_pick(_copy(by_id[i]), fields) for i in ids if by_id.get(i)]
+
+
+async def list_artworks(aio, filters: dict, fields=None, after_id=None, limit=None) -> list:
+    ids = await artwork_ids(aio, filters)
+    if after_id:
+        ids = ids[bisect_right(ids, -int(after_id), key=lambda i: -i):]
+    if limit:
+        ids = ids[:int(limit)]
+    return await artworks(aio, ids, fields)
+
+
+# ---------------- native views ----------------
+NATIVE_VIEWS = {}
+
+
+def native(endpoint: str):
+    """Register `async def view(aio, **view_args)` as the async version of endpoint."""
+    def decorator(fn):
+        NATIVE_VIEWS[endpoint] = fn
+        return fn
+    return decorator
+
+
+@native("main.gallery")
+async def gallery(aio):
+    filters = check_colour(read_filters(request.args))
+    items = await list_artworks(aio, filters)
+    sort = request.args.get("sort") or ""
+    if filters["colour"] and not sort:
+        items = await asyncio.to_thread(sort_by_colour, items, filters["colour"])
+    elif sort:
+        items = await asyncio.to_thread(sort_by_popularity, items, sort)
+    return render_template("gallery.html", items=items, filters=filters, sort=sort,
+                           colours=NAMED_COLOURS)
+
+
+async def _similar(aio, item_id: int) -> list:
+    try:
+        # the first call (or one after `recs-build`) loads the index file
+        return await artworks(aio, await asyncio.to_thread(similar_ids, item_id))
+    except Exception:
+        current_app.logger.exception("Load similar artworks failed")
+        return []
+
+
+@native("main.item_detail")
+async def item_detail(aio, item_id: int):
+    rows, similar = await asyncio.gather(artworks(aio, [item_id]), _similar(aio, item_id))
+    if not rows:
+        abort(404)
+    if not request.headers.get(RENDER_HEADER):
+        record_event(item_id, "views")
+    return render_template("item_detail.html", item=rows[0], similar=similar)
+
+
+@native("main.checkout")
+async def checkout(aio):
+    cart = _cart()
+    total = sum(_parse_float(x.get("subtotal"), 0.0) for x in cart)
+    if request.method == "GET":
+        return render_template("checkout.html", cart=cart, total=total)
+    if not cart:
+        flash("Your cart is empty.", "warning")
+        return redirect(url_for("main.checkout"))
+
+    form = checkout_form(request.form)
+    if form is None:
+        flash("Please complete all fields.", "warning")
+        return render_template("checkout.html", cart=cart, total=total)
+
+    try:
+        payment_id, address_id = await asyncio.gather(
+            aio.db.insert("""
+                INSERT INTO payments (cardNumber, expDate, cvv)
+                VALUES (%s, %s, %s)
+            """, (form["card"], form["exp"], form["cvv"])),
+            aio.db.insert("""
+                INSERT INTO addresses (recipientName, address, city, state, postcode)
+                VALUES (%s, %s, %s, %s, %s)
+            """, (form["recipient"], form["addr"], form["city"], form["state"], form["postcode"])),
+        )
+        user_id = current_user.id if getattr(current_user, "is_authenticated", False) else None
+        order_id = await aio.db.insert("""
+            INSERT INTO orders (userId, email, phoneNumber, totalPrice, addressId, paymentId)
+            VALUES (%s, %s, %s, %s, %s, %s)
+        """, (user_id, form["email"], form["phone"], float(total), address_id, payment_id))
+        # job submit runs inline (sync DB) when the queue is off
+        return await asyncio.to_thread(checkout_placed, order_id, cart)
+    except Exception:
+        current_app.logger.exception("Async checkout failed")
+        flash("Checkout failed. Please try again.", "danger")
+        return render_template("checkout.html", cart=cart, total=total)
+
+
+@native("api.artworks_list")
+async def api_artworks_list(aio):
+    try:
+        fields = _fields()
+        limit = _page_size()
+        after = request.args.get("after")
+        after = int(after) if after else None
+        rows = await list_artworks(aio, read_filters(request.args), fields=fields,
+                                   after_id=after, limit=limit + 1)
+    except ValueError as e:
+        return _error(str(e), 400)
+    more = len(rows) > limit
+    rows = rows[:limit]
+    return json_response({
+        "items": [_project(r, fields) for r in rows],
+        "next": rows[-1]["artworkId"] if more else None,
+    })
+
+
+@native("api.artworks_detail")
+async def api_artworks_detail(aio, artwork_id: int):
+    try:
+        fields = _fields()
+    except ValueError as e:
+        return _error(str(e), 400)
+    rows = await artworks(aio, [artwork_id], fields)
+    if not rows:
+        return _error("Artwork not found", 404)
+    return json_response(_project(rows[0], fields))
+
+
+# ---------------- ASGI <-> WSGI ----------------
+def _environ(scope, body, size: int) -> dict:
+    root = scope.get("root_path", "")
+    path = scope["path"][len(root):] if scope["path"].startswith(root) else scope["path"]
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": root.encode("utf-8").decode("latin-1"),
+        "PATH_INFO": path.encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": str(server[0]),
+        "SERVER_PORT": str(server[1] or 80),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": client[0],
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": body,
+        "wsgi.input_terminated": True,
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    for name, value in scope.get("headers", ()):
+        name, value = name.decode("latin-1"), value.decode("latin-1")
+        if name == "content-type":
+            key = "CONTENT_TYPE"
+        elif name == "content-length":
+            key = "CONTENT_LENGTH"
+        else:
+            key = "HTTP_" + name.upper().replace("-", "_")
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    # the whole body is already spooled: its size, whatever the client declared
+    # (none for chunked requests, which Flask would otherwise read as empty)
+    environ["CONTENT_LENGTH"] = str(size)
+    return environ
+
+
+async def _read_body(receive, limit=None):
+    """(spooled body, its size); None once more than limit bytes arrive."""
+    body = tempfile.SpooledTemporaryFile(max_size=BODY_SPOOL_SIZE)
+    size = 0
+    while True:
+        msg = await receive()
+        if msg["type"] == "http.disconnect":
+            break
+        chunk = msg.get("body", b"")
+        size += len(chunk)
+        if limit is not None and size > limit:
+            body.close()
+            return None, size
+        body.write(chunk)
+        if not msg.get("more_body"):
+            break
+    body.seek(0)
+    return body, size
+
+
+async def _send_too_large(send):
+    resp = RequestEntityTooLarge().get_response()
+    await send(_start(resp.status, resp.headers.to_wsgi_list()))
+    await send({"type": "http.response.body", "body": resp.get_data()})
+
+
+def _start(status: str, headers) -> dict:
+    return {
+        "type": "http.response.start",
+        "status": int(status[:3]),
+        "headers": [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in headers],
+    }
+
+
+class AsyncApp:
+    """
+    ASGI app: endpoints in `views` (default NATIVE_VIEWS) run as coroutines on `db`,
+    all other requests run the WSGI app in a thread pool.
+    """
+
+    def __init__(self, flask_app, db=None, views=None, threads: int = 64):
+        self.flask_app = flask_app
+        self.db = db
+        self.views = NATIVE_VIEWS if views is None else views
+        self.executor = ThreadPoolExecutor(threads, thread_name_prefix="wsgi")
+        self.inflight = {}  # catalogue query key -> future (single flight)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            return await self._lifespan(receive, send)
+        if scope["type"] != "http":
+            raise RuntimeError(f"Unsupported ASGI scope type {scope['type']!r}")
+        limit = self.flask_app.config.get("MAX_CONTENT_LENGTH")
+        declared = dict(scope.get("headers", ())).get(b"content-length", b"")
+        if limit is not None and declared.isdigit() and int(declared) > limit:
+            return await _send_too_large(send)
+        body, size = await _read_body(receive, limit)
+        if body is None:
+            return await _send_too_large(send)
+        try:
+            environ = _environ(scope, body, size)
+            view, args = self._match(environ)
+            if view is None:
+                loop = asyncio.get_running_loop()
+                await loop.run_in_executor(self.executor, self._run_wsgi, environ, send, loop)
+            else:
+                await self._native(view, args, environ, send)
+        finally:
+            body.close()
+
+    async def _lifespan(self, receive, send):
+        while True:
+            msg = await receive()
+            if msg["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif msg["type"] == "lifespan.shutdown":
+                if self.db is not None:
+                    await self.db.close()
+                self.executor.shutdown(wait=False)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    def _match(self, environ):
+        if self.db is None or not self.views:
+            return None, None
+        try:
+            endpoint, args = self.flask_app.url_map.bind_to_environ(environ).match()
+        except HTTPException:
+            return None, None  # 404 / 405 / redirects: Flask answers them
+        return self.views.get(endpoint), args
+
+    # ---- thread pool (sync) ----
+    def _run_wsgi(self, environ, send, loop):
+        captured = []
+
+        def start_response(status, headers, exc_info=None):
+            captured[:] = [status, headers]
+            return lambda data: None  # legacy write() is not used by Flask
+
+        app_iter = self.flask_app.wsgi_app(environ, start_response)
+        self._send_iter(send, loop, captured, app_iter)
+
+    @staticmethod
+    def _send_iter(send, loop, captured, app_iter):
+        """Stream a WSGI body from this (worker) thread; each chunk waits until sent."""
+        def push(msg):
+            asyncio.run_coroutine_threadsafe(send(msg), loop).result()
+
+        started = False
+        try:
+            for chunk in app_iter:
+                if not chunk:
+                    continue
+                if not started:
+                    push(_start(*captured))
+                    started = True
+                push({"type": "http.response.body", "body": chunk, "more_body": True})
+            if not started:
+                push(_start(*captured))
+            push({"type": "http.response.body", "body": b""})
+        finally:
+            close = getattr(app_iter, "close", None)
+            if close:
+                close()
+
+    # ---- native (async) ----
+    @staticmethod
+    def _in(cv, fn, *args):
+        """Run fn(*args) in a thread, inside the request's contextvars.Context."""
+        return asyncio.get_running_loop().run_in_executor(None, functools.partial(cv.run, fn, *args))
+
+    def _open(self, ctx):
+        ctx.push()
+        rv = self.flask_app.preprocess_request()  # hooks may serve a file, flush metrics ...
+        if rv is None and "_user_id" in session:
+            current_user._get_current_object()  # the login loader may query MySQL
+        return rv
+
+    def _close(self, ctx, rv, exc, environ):
+        """full_dispatch_request's ending, then teardown (as Flask pops before the body is sent)."""
+        app = self.flask_app
+        error = None
+        try:
+            try:
+                try:
+                    if exc is not None:
+                        raise exc
+                except Exception as e:
+                    rv = app.handle_user_exception(e)
+                response = app.finalize_request(rv)
+            except Exception as e:
+                error = e
+                response = app.handle_exception(e)
+            self._compress(response, environ)
+            return response
+        finally:
+            ctx.pop(error)
+
+    async def _native(self, view, args, environ, send):
+        # The request's Flask contexts live in their own contextvars.Context, which
+        # the hooks (in threads) and the view (a task on the loop) enter one at a time.
+        ctx = self.flask_app.request_context(environ)
+        cv = contextvars.copy_context()
+        exc = None
+        holder = None  # what is in cv right now: the opening thread, then the view task
+        try:
+            holder = self._in(cv, self._open, ctx)
+            rv = await asyncio.shield(holder)
+            if rv is None:
+                holder = asyncio.get_running_loop().create_task(view(self, **args), context=cv)
+                rv = await holder
+        except asyncio.CancelledError:
+            # client gone: still tear down (metrics, DB close) once cv is free
+            await asyncio.wait([holder])
+            await self._in(cv, ctx.pop, None)
+            raise
+        except Exception as e:
+            rv, exc = None, e
+        response = await self._in(cv, self._close, ctx, rv, exc, environ)
+        await self._send_response(send, response, environ)
+
+    def _compress(self, response, environ):
+        cfg = self.flask_app.config
+        if not cfg.get("COMPRESS_ENABLED", True) or not response.is_sequence:
+            return
+        encoding = negotiate_encoding(environ.get("HTTP_ACCEPT_ENCODING", ""))
+        if (not encoding or response.status_code in (204, 206, 304)
+                or "Content-Encoding" in response.headers
+                or not is_compressible(response.mimetype or "")
+                or response.calculate_content_length() < cfg.get("COMPRESS_MIN_SIZE", 500)):
+            return
+        response.set_data(compress(response.get_data(), encoding))
+        response.headers["Content-Encoding"] = encoding
+        response.vary.add("Accept-Encoding")
+
+    async def _send_response(self, send, response, environ):
+        app_iter, status, headers = response.get_wsgi_response(environ)
+        if not response.is_sequence:  # e.g. a pre-rendered file: read it in a thread
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(self.executor, self._send_iter, send, loop,
+                                       [status, headers], app_iter)
+            return
+        await send(_start(status, headers))
+        await send({"type": "http.response.body", "body": b"".join(app_iter)})
+
+
+def create_asgi_app(flask_app=None):
+    """ASGI entry point (uvicorn --factory project.asgi:create_asgi_app)."""
+    if flask_app is None:
+        from . import create_app
+        flask_app = create_app()
+    cfg = flask_app.config
+    if aiomysql is None:
+        flask_app.logger.warning("aiomysql is not installed: async mode serves every request in threads")
+        db = None
+    else:
+        db = AsyncDB(cfg)
+    aio = AsyncApp(flask_app, db, threads=cfg["ASYNC_WSGI_THREADS"])
+    flask_app.extensions["asgi"] = aio
+    return aio
@@ -0,0 +1,515 @@
+# project/cache.py
+"""
+Two-tier cache shared by all worker processes on a node.
+
+    L1  per-process LRU (no I/O, may lag other workers by CACHE_CHECK_INTERVAL)
+    L2  shared store: SQLite file under instance/ (MemoryStore in tests)
+
+Writes call invalidate(namespace, keys). That drops the entries from this
+process' L1 and from L2, and appends a row to the store's invalidation log.
+Every process reads the log at most once per CACHE_CHECK_INTERVAL seconds (on
+its next lookup) and drops the listed keys from its own L1. A stale L1 entry
+therefore lives for at most one check interval after the write.
+"""
+import os
+import pickle
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app
+
+from .metrics import cache_lookup
+
+MISS = object()
+GET_CHUNK = 500  # keys per SELECT in SqliteStore.get_many
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache (
+  cacheKey  TEXT PRIMARY KEY,   -- "<namespace>:<key>"
+  namespace TEXT NOT NULL,
+  value     BLOB NOT NULL,      -- pickle
+  expiresAt REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS invalidations (
+  seq       INTEGER PRIMARY KEY AUTOINCREMENT,
+  namespace TEXT NOT NULL,
+  cacheKey  TEXT,               -- NULL = whole namespace
+  createDate REAL NOT NULL
+);
+"""
+
+
+def _copy(value):
+    """Rows are dicts; hand out copies so callers can't mutate the cached ones."""
+    if isinstance(value, dict):
+        return dict(value)
+    if isinstance(value, list):
+        return [dict(v) if isinstance(v, dict) else v for v in value]
+    return value
+
+
+# ---------------- L1 ----------------
+class LRU:
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._data = OrderedDict()  # key -> (value, expiresAt)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            hit = self._data.get(key)
+            if hit is None:
+                return MISS
+            if hit[1] < time.time():
+                del self._data[key]
+                return MISS
+            self._data.move_to_end(key)
+            return hit[0]
+
+    def set(self, key, value, expires_at: float):
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def drop(self, keys):
+        with self._lock:
+            for k in keys:
+                self._data.pop(k, None)
+
+    def drop_namespace(self, namespace: str):
+        prefix = f"{namespace}:"
+        with self._lock:
+            for k in [k for k in self._data if k.startswith(prefix)]:
+                del self._data[k]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+# ---------------- L2 stores ----------------
+class MemoryStore:
+    """In-process stand-in for SqliteStore (tests, single-process dev)."""
+
+    def __init__(self):
+        self._data = {}
+        self._log = []  # [(seq, namespace, cacheKey, createDate)]
+        self._seq = 0
+        self._lock = threading.Lock()
+
+    def get_many(self, keys):
+        now = time.time()
+        with self._lock:
+            out = {}
+            for k in keys:
+                hit = self._data.get(k)
+                if hit and hit[1] >= now:
+                    out[k] = pickle.loads(hit[0])
+            return out
+
+    def set_many(self, namespace, items, expires_at, since_seq):
+        with self._lock:
+            stale = {k for s, ns, k, _ in self._log if s > since_seq and ns == namespace}
+            if None in stale:
+                return
+            for k, v in items.items():
+                if k not in stale:
+                    self._data[k] = (pickle.dumps(v), expires_at)
+
+    def invalidate(self, namespace, keys):
+        with self._lock:
+            if keys is None:
+                for k in [k for k in self._data if k.startswith(f"{namespace}:")]:
+                    del self._data[k]
+                keys = [None]
+            else:
+                for k in keys:
+                    self._data.pop(k, None)
+            for k in keys:
+                self._seq += 1
+                self._log.append((self._seq, namespace, k, time.time()))
+
+    def changes_since(self, seq):
+        with self._lock:
+            first = self._log[0][0] if self._log else self._seq + 1
+            return first, [(s, ns, k) for s, ns, k, _ in self._log if s > seq]
+
+    def last_seq(self):
+        with self._lock:
+            return self._seq
+
+    def prune(self, older_than: float):
+        with self._lock:
+            keep = [e for e in self._log[:-1] if e[3] >= older_than] + self._log[-1:]
+            n, self._log = len(self._log) - len(keep), keep
+            return n
+
+
+class SqliteStore:
+    """L2 in a WAL-mode SQLite file; one connection per thread (and per process after fork)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        con = self._connect()
+        try:
+            con.executescript(SCHEMA)
+        finally:
+            con.close()
+
+    def _connect(self):
+        con = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        con.execute("PRAGMA journal_mode=WAL")
+        con.execute("PRAGMA synchronous=NORMAL")
+        return con
+
+    @property
+    def _con(self):
+        con = getattr(self._local, "con", None)
+        if con is None or self._local.pid != os.getpid():
+            con = self._local.con = self._connect()
+            self._local.pid = os.getpid()
+        return con
+
+    def get_many(self, keys):
+        keys = list(keys)
+        now = time.time()
+        out = {}
+        # chunked: SQLite caps bound parameters per statement (999 before 3.32)
+        for i in range(0, len(keys), GET_CHUNK):
+            chunk = keys[i:i + GET_CHUNK]
+            rows = self._con.execute(f"""
+                SELECT cacheKey, value FROM cache
+                WHERE cacheKey IN ({",".join("?" * len(chunk))}) AND expiresAt >= ?
+            """, chunk + [now]).fetchall()
+            out.update((k, pickle.loads(v)) for k, v in rows)
+        return out
+
+    def set_many(self, namespace, items, expires_at, since_seq):
+        """Skip keys invalidated after since_seq: they may have been loaded before the write."""
+        con = self._con
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            stale = {k for (k,) in con.execute(
+                "SELECT cacheKey FROM invalidations WHERE seq > ? AND namespace = ?",
+                (since_seq, namespace))}
+            if None not in stale:
+                con.executemany(
+                    "INSERT OR REPLACE INTO cache (cacheKey, namespace, value, expiresAt) VALUES (?, ?, ?, ?)",
+                    [(k, namespace, pickle.dumps(v), expires_at) for k, v in items.items() if k not in stale])
+            con.execute("COMMIT")
+        except Exception:
+            con.execute("ROLLBACK")
+            raise
+
+    def invalidate(self, namespace, keys):
+        con = self._con
+        now = time.time()
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            if keys is None:
+                con.execute("DELETE FROM cache WHERE namespace = ?", (namespace,))
+                con.execute("INSERT INTO invalidations (namespace, cacheKey, createDate) VALUES (?, NULL, ?)",
+                            (namespace, now))
+            else:
+                con.executemany("DELETE FROM cache WHERE cacheKey = ?", [(k,) for k in keys])
+                con.executemany("INSERT INTO invalidations (namespace, cacheKey, createDate) VALUES (?, ?, ?)",
+                                [(namespace, k, now) for k in keys])
+            con.execute("COMMIT")
+        except Exception:
+            con.execute("ROLLBACK")
+            raise
+
+    def changes_since(self, seq):
+        """(oldest seq still in the log, [(seq, namespace, cacheKey)] newer than seq)."""
+        con = self._con
+        first = con.execute("SELECT MIN(seq) FROM invalidations").fetchone()[0]
+        rows = con.execute("SELECT seq, namespace, cacheKey FROM invalidations WHERE seq > ? ORDER BY seq",
+                           (seq,)).fetchall()
+        return (first if first is not None else seq + 1), rows
+
+    def last_seq(self):
+        return self._con.execute("SELECT COALESCE(MAX(seq), 0) FROM invalidations").fetchone()[0]
+
+    def prune(self, older_than: float):
+        con = self._con
+        # keep the newest row so AUTOINCREMENT / MIN(seq) stay meaningful
+        n = con.execute("""
+            DELETE FROM invalidations
+            WHERE createDate < ? AND seq < (SELECT MAX(seq) FROM invalidations)
+        """, (older_than,)).rowcount
+        con.execute("DELETE FROM cache WHERE expiresAt < ?", (time.time(),))
+        return n
+
+
+# ---------------- two-tier cache ----------------
+class Cache:
+    def __init__(self, store, l1_size=2048, ttl=300, check_interval=1.0, log_retention=3600):
+        self.store = store
+        self.l1 = LRU(l1_size)
+        self.ttl = ttl
+        self.check_interval = check_interval
+        self.log_retention = log_retention
+        self._seen = store.last_seq()
+        self._checked_at = time.monotonic()
+        self._pruned_at = time.monotonic()
+        self._sync_lock = threading.Lock()
+        self.versions = {}  # namespace -> count of namespace-wide invalidations seen
+        self._epoch = 0     # bumped when the log was pruned past _seen: every namespace is suspect
+
+    def version(self, namespace: str) -> int:
+        """Changes whenever namespace is invalidated as a whole, here or in another worker."""
+        self._sync()
+        return self.versions.get(namespace, 0) + self._epoch
+
+    def _bump(self, namespace: str):
+        self.versions[namespace] = self.versions.get(namespace, 0) + 1
+
+    def _sync(self):
+        """Apply other workers' invalidations to L1 (at most once per check_interval)."""
+        if time.monotonic() - self._checked_at < self.check_interval:
+            return
+        with self._sync_lock:
+            if time.monotonic() - self._checked_at < self.check_interval:
+                return
+            first, rows = self.store.changes_since(self._seen)
+            if first > self._seen + 1:
+                # log was pruned past what we've seen: any namespace may have been invalidated
+                self.l1.clear()
+                self._epoch += 1
+            for seq, ns, key in rows:
+                if key is None:
+                    self.l1.drop_namespace(ns)
+                    self._bump(ns)
+                else:
+                    self.l1.drop([key])
+                self._seen = max(self._seen, seq)
+            self._checked_at = time.monotonic()
+
+    def get_many(self, namespace: str, keys, loader, ttl=None) -> dict:
+        """
+        {key: value} for keys; L1, then L2, then loader(missing_keys) -> {key: value}.
+        Keys the loader doesn't return are cached as None.
+        """
+        out, missing, since = self.lookup(namespace, keys, ttl)
+        if missing:
+            self.fill(namespace, out, missing, loader(missing), since, ttl)
+        return {k: _copy(out[k]) for k in keys}
+
+    def lookup(self, namespace: str, keys, ttl=None):
+        """
+        First half of get_many, for callers whose loader is async:
+        (found {key: value}, missing keys, since) -> load missing -> fill().
+        """
+        self._sync()
+        since = self._seen
+        out, missing = {}, []
+        for k in keys:
+            v = self.l1.get(f"{namespace}:{k}")
+            cache_lookup(f"{namespace}.l1", v is not MISS)
+            if v is MISS:
+                missing.append(k)
+            else:
+                out[k] = v
+        if not missing:
+            return out, [], since
+        found = self.store.get_many(f"{namespace}:{k}" for k in missing)
+        expires = time.time() + (ttl or self.ttl)
+        still = []
+        for k in missing:
+            fk = f"{namespace}:{k}"
+            hit = fk in found
+            cache_lookup(f"{namespace}.l2", hit)
+            if hit:
+                out[k] = found[fk]
+                self.l1.set(fk, out[k], expires)
+            else:
+                still.append(k)
+        return out, still, since
+
+    def fill(self, namespace: str, out: dict, missing, loaded: dict, since: int, ttl=None):
+        """Store loaded values for missing keys (None for absent ones) in L1 + L2 and in out."""
+        expires = time.time() + (ttl or self.ttl)
+        self.store.set_many(namespace, {f"{namespace}:{k}": loaded.get(k) for k in missing},
+                            expires, since)
+        for k in missing:
+            out[k] = loaded.get(k)
+            self.l1.set(f"{namespace}:{k}", out[k], expires)
+        return out
+
+    def get_or_load(self, namespace: str, key, loader, ttl=None):
+        return self.get_many(namespace, [key], lambda ks: {key: loader()}, ttl)[key]
+
+    def invalidate(self, namespace: str, keys=None):
+        """Drop keys (or the whole namespace) everywhere and tell the other workers."""
+        if keys is None:
+            self.l1.drop_namespace(namespace)
+            self.store.invalidate(namespace, None)
+            self._bump(namespace)
+        else:
+            full = [f"{namespace}:{k}" for k in keys]
+            self.l1.drop(full)
+            self.store.invalidate(namespace, full)
+        if time.monotonic() - self._pruned_at > self.log_retention / 10:
+            self._pruned_at = time.monotonic()
+            self.store.prune(time.time() - self.log_retention)
+
+
+# ---------------- query results ----------------
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class QueryCache:
+    """
+    Per-process map of canonical query key -> tuple of ids, LRU-evicted by
+    approximate memory size. Concurrent misses for one key run the loader once
+    (single-flight); the rest wait for its result. Everything is dropped when the
+    version passed in changes (see Cache.version).
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.version = None
+        self._entries = OrderedDict()  # key -> (ids, size)
+        self._inflight = {}            # key -> _Flight
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _size(key, ids) -> int:
+        # tuple header + 8-byte slot and a small int object per id, plus the key
+        return sys.getsizeof(ids) + 28 * len(ids) + sys.getsizeof(key) + 64 * len(key)
+
+    def _reset(self, version):
+        self._entries.clear()
+        self.bytes = 0
+        self.version = version
+
+    def peek(self, key, version):
+        """Cached ids or None, without loading (async callers load, then put())."""
+        with self._lock:
+            if version != self.version:
+                self._reset(version)
+            hit = self._entries.get(key)
+            if hit is not None:
+                self._entries.move_to_end(key)
+            cache_lookup("query", hit is not None)
+            return hit[0] if hit is not None else None
+
+    def put(self, key, ids, version) -> tuple:
+        ids = tuple(ids)
+        with self._lock:
+            if version == self.version:
+                self._store(key, ids)
+        return ids
+
+    def get_or_load(self, key, loader, version) -> tuple:
+        with self._lock:
+            if version != self.version:
+                self._reset(version)
+            hit = self._entries.get(key)
+            if hit is not None:
+                self._entries.move_to_end(key)
+                cache_lookup("query", True)
+                return hit[0]
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _Flight()
+        cache_lookup("query", False)
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+        try:
+            flight.result = tuple(loader())
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+                # a write during the query bumped the version: don't keep the old result
+                if flight.error is None and version == self.version:
+                    self._store(key, flight.result)
+            flight.done.set()
+        return flight.result
+
+    def _store(self, key, ids):
+        size = self._size(key, ids)
+        if size > self.max_bytes:
+            return
+        prev = self._entries.pop(key, None)
+        if prev is not None:
+            self.bytes -= prev[1]  # two async misses for one key both put()
+        self._entries[key] = (ids, size)
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            _, (_, old) = self._entries.popitem(last=False)
+            self.bytes -= old
+
+
+# ---------------- app helpers ----------------
+def _cache():
+    try:
+        return current_app.extensions.get("cache")
+    except RuntimeError:  # outside an app context (scripts)
+        return None
+
+
+def cached(namespace: str, key, loader, ttl=None):
+    """loader() through the app cache; plain loader() when caching is off."""
+    c = _cache()
+    return loader() if c is None else c.get_or_load(namespace, key, loader, ttl)
+
+
+def cached_many(namespace: str, keys, loader, ttl=None) -> dict:
+    """{key: value} for keys; loader(missing) -> {key: value} is called once for all misses."""
+    c = _cache()
+    keys = list(keys)
+    if c is None:
+        loaded = loader(keys) if keys else {}
+        return {k: loaded.get(k) for k in keys}
+    return c.get_many(namespace, keys, loader, ttl)
+
+
+def invalidate(namespace: str, keys=None):
+    c = _cache()
+    if c is not None:
+        c.invalidate(namespace, keys)
+
+
+def cached_query(namespace: str, key, loader):
+    """
+    Id tuple for a canonical query key, valid until `namespace` is invalidated as
+    a whole. None when caching is off (the caller runs its query directly).
+    """
+    c = _cache()
+    if c is None:
+        return None
+    qc = current_app.extensions["query_cache"]
+    return qc.get_or_load((namespace, key), loader, c.version(namespace))
+
+
+def init_cache(app):
+    cfg = app.config
+    if not cfg.get("CACHE_ENABLED"):
+        return
+    if cfg["CACHE_BACKEND"] == "memory":
+        store = MemoryStore()
+    else:
+        store = SqliteStore(cfg["CACHE_DB"])
+    app.extensions["cache"] = Cache(store, cfg["CACHE_L1_SIZE"], cfg["CACHE_TTL"],
+                                    cfg["CACHE_CHECK_INTERVAL"], cfg["CACHE_LOG_RETENTION"])
+    app.extensions["query_cache"] = QueryCache(cfg["QUERY_CACHE_BYTES"])
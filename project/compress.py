@@ -0,0 +1,248 @@
+# project/compress.py
+import gzip
+import mimetypes
+import os
+import zlib
+
+from flask import current_app, request
+from werkzeug.security import safe_join
+
+from .delivery import send_from
+
+# brotli is optional; without it we only ever negotiate gzip
+try:
+    import brotli
+except Exception:
+    brotli = None
+
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+# text-like types worth compressing; images (jpg/png/avif/webp/gif) are already compressed
+COMPRESSIBLE_TYPES = {
+    "text/html", "text/css", "text/plain", "text/csv", "text/xml",
+    "text/javascript", "application/javascript", "application/json",
+    "application/xml", "image/svg+xml",
+}
+# static extensions that get .gz/.br siblings at build time
+PRECOMPRESS_EXTS = {".css", ".js", ".svg", ".html", ".json", ".txt", ".xml"}
+SIBLING_EXT = {"br": ".br", "gzip": ".gz"}
+
+
+def _accepted(accept_encoding: str) -> dict:
+    """Parse an Accept-Encoding header into {coding: q}."""
+    out = {}
+    for part in (accept_encoding or "").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        name, _, params = part.partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        out[name.strip().lower()] = q
+    return out
+
+
+def negotiate_encoding(accept_encoding: str):
+    """Return 'br', 'gzip' or None for the given Accept-Encoding header."""
+    accepted = _accepted(accept_encoding)
+    star = accepted.get("*", 0.0)
+    best, best_q = None, 0.0
+    # prefer br over gzip when the client weights them equally
+    for coding in ("br", "gzip"):
+        if coding == "br" and brotli is None:
+            continue
+        q = accepted.get(coding, star)
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    if encoding == "gzip":
+        return gzip.compress(data, compresslevel=GZIP_LEVEL)
+    return data
+
+
+def is_compressible(mimetype: str) -> bool:
+    return (mimetype or "").split(";")[0].strip().lower() in COMPRESSIBLE_TYPES
+
+
+# ---------------- streaming middleware ----------------
+class _GzipStream:
+    def __init__(self, level):
+        self._z = zlib.compressobj(level, zlib.DEFLATED, 31)  # 31 = gzip container
+
+    def process(self, chunk):
+        return self._z.compress(chunk)
+
+    def finish(self):
+        return self._z.flush()
+
+
+class _BrotliStream:
+    def __init__(self, quality):
+        self._b = brotli.Compressor(quality=quality)
+
+    def process(self, chunk):
+        return self._b.process(chunk)
+
+    def finish(self):
+        return self._b.finish()
+
+
+def _compressor(encoding):
+    return _BrotliStream(BROTLI_QUALITY) if encoding == "br" else _GzipStream(GZIP_LEVEL)
+
+
+class CompressionMiddleware:
+    """
+    WSGI middleware: compresses text responses chunk by chunk (never buffers the body).
+
+    Skipped when the client doesn't accept gzip/br, the response is already encoded
+    (e.g. a precompressed static sibling), not a compressible type, smaller than
+    min_size, a 204/206/304, or marked Cache-Control: no-transform.
+    """
+
+    def __init__(self, wsgi_app, min_size: int = 500):
+        self.wsgi_app = wsgi_app
+        self.min_size = min_size
+
+    def _should_compress(self, status: str, headers: list) -> bool:
+        if status[:3] in ("204", "206", "304"):
+            return False
+        h = {k.lower(): v for k, v in headers}
+        if "content-encoding" in h or "no-transform" in h.get("cache-control", ""):
+            return False
+        if not is_compressible(h.get("content-type", "")):
+            return False
+        length = h.get("content-length")
+        # unknown length = streamed body; compress it as it goes
+        return length is None or int(length) >= self.min_size
+
+    def __call__(self, environ, start_response):
+        encoding = negotiate_encoding(environ.get("HTTP_ACCEPT_ENCODING", ""))
+        if not encoding or environ.get("REQUEST_METHOD") == "HEAD":
+            return self.wsgi_app(environ, start_response)
+
+        captured = []
+
+        def _capture(status, headers, exc_info=None):
+            captured[:] = [status, headers, exc_info]
+            return lambda data: None  # legacy write() is not used by Flask
+
+        app_iter = self.wsgi_app(environ, _capture)
+        status, headers, exc_info = captured
+
+        if not self._should_compress(status, headers):
+            start_response(status, headers, exc_info)
+            return app_iter
+
+        out = []
+        vary = None
+        for k, v in headers:
+            lk = k.lower()
+            if lk in ("content-length", "accept-ranges"):
+                continue
+            if lk == "etag" and not v.startswith("W/"):
+                v = "W/" + v  # body bytes differ from the identity representation
+            if lk == "vary":
+                vary = v
+                continue
+            out.append((k, v))
+        out.append(("Content-Encoding", encoding))
+        if vary and "accept-encoding" not in vary.lower():
+            vary = f"{vary}, Accept-Encoding"
+        out.append(("Vary", vary or "Accept-Encoding"))
+        start_response(status, out, exc_info)
+        return self._stream(app_iter, _compressor(encoding))
+
+    @staticmethod
+    def _stream(app_iter, comp):
+        try:
+            for chunk in app_iter:
+                data = comp.process(chunk)
+                if data:
+                    yield data
+            yield comp.finish()
+        finally:
+            close = getattr(app_iter, "close", None)
+            if close:
+                close()
+
+
+# ---------------- precompressed static assets ----------------
+def send_static_precompressed(filename):
+    """
+    Replacement for Flask's static view: if the client accepts br/gzip and a
+    '<file>.br' / '<file>.gz' sibling exists (see `flask precompress-static`),
+    send that instead of compressing per request.
+    """
+    app = current_app._get_current_object()
+    mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    if is_compressible(mimetype):
+        accepted = _accepted(request.headers.get("Accept-Encoding", ""))
+        for enc in ("br", "gzip"):
+            if accepted.get(enc, accepted.get("*", 0.0)) <= 0:
+                continue
+            path = safe_join(app.static_folder, filename + SIBLING_EXT[enc])
+            if path and os.path.isfile(path):
+                resp = send_from(app.static_folder, filename + SIBLING_EXT[enc],
+                                 max_age=app.get_send_file_max_age(filename),
+                                 mimetype=mimetype, download_name=os.path.basename(filename))
+                resp.headers["Content-Encoding"] = enc
+                resp.vary.add("Accept-Encoding")
+                return resp
+    resp = send_from(app.static_folder, filename, max_age=app.get_send_file_max_age(filename))
+    if is_compressible(mimetype):
+        resp.vary.add("Accept-Encoding")
+    return resp
+
+
+def precompress_static(static_dir: str, force: bool = False) -> list:
+    """Write .gz (and .br if available) siblings for text assets. Returns files written."""
+    written = []
+    for root, _dirs, files in os.walk(static_dir):
+        for name in files:
+            if os.path.splitext(name)[1].lower() not in PRECOMPRESS_EXTS:
+                continue
+            src = os.path.join(root, name)
+            with open(src, "rb") as fh:
+                data = fh.read()
+            mtime = os.path.getmtime(src)
+            targets = [("gzip", ".gz")] + ([("br", ".br")] if brotli is not None else [])
+            for enc, ext in targets:
+                dst = src + ext
+                if not force and os.path.exists(dst) and os.path.getmtime(dst) >= mtime:
+                    continue
+                # build-time: use the strongest settings, it's done once per deploy
+                if enc == "br":
+                    body = brotli.compress(data, quality=11)
+                else:
+                    body = gzip.compress(data, compresslevel=9, mtime=0)
+                tmp = dst + ".tmp"
+                with open(tmp, "wb") as fh:
+                    fh.write(body)
+                os.replace(tmp, dst)
+                written.append(dst)
+    return written
+
+
+def init_compression(app):
+    """Install the middleware, the precompressed static view and the CLI command."""
+    if app.config.get("COMPRESS_ENABLED", True):
+        app.wsgi_app = CompressionMiddleware(app.wsgi_app, app.config.get("COMPRESS_MIN_SIZE", 500))
+    app.view_functions["static"] = send_static_precompressed
+
+    @app.cli.command("precompress-static")
+    def precompress_static_command():
+        """Write .gz/.br siblings for static text assets."""
+        for path in precompress_static(app.static_folder):
+            print(os.path.relpath(path, app.static_folder))
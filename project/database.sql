@@ -147,8 +147,33 @@ CREATE TABLE order_items (
   CONSTRAINT fk_oi_artwork FOREIGN KEY (artworkId) REFERENCES artworks(id) ON DELETE RESTRICT
 ) ENGINE=InnoDB;
 
+-- lease scheduler (project/leases.py) loads unfinished leases by endDate
+CREATE INDEX idx_order_items_end ON order_items(endDate);
 
 
+-- ========== ARTWORK STATS (write-behind counters, see project/popularity.py) ==========
+CREATE TABLE IF NOT EXISTS artwork_stats (
+  artworkId  INT PRIMARY KEY,
+  views      BIGINT NOT NULL DEFAULT 0,
+  cartAdds   BIGINT NOT NULL DEFAULT 0,
+  leases     BIGINT NOT NULL DEFAULT 0,
+  updateDate TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+) ENGINE=InnoDB;
+
+-- ========== ARTWORK PALETTES (colour search, see project/palette.py) ==========
+-- 64-bin RGB histogram, each byte = share of pixels in that bin (1/255ths)
+CREATE TABLE IF NOT EXISTS artwork_palettes (
+  artworkId  INT PRIMARY KEY,
+  histogram  BINARY(64) NOT NULL,
+  updateDate TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+) ENGINE=InnoDB;
+
+-- ========== ARCHIVE (filled by `flask archive`, see project/archive.py) ==========
+-- Same columns and indexes as the hot tables, no foreign keys.
+CREATE TABLE IF NOT EXISTS artworks_archive    LIKE artworks;
+CREATE TABLE IF NOT EXISTS orders_archive      LIKE orders;
+CREATE TABLE IF NOT EXISTS order_items_archive LIKE order_items;
+
 -- ===== Seeds (แก้รหัสผ่านเป็น hash จริงภายหลัง) =====
 INSERT IGNORE INTO users (id,name,email,password_hash,role) VALUES
   (1,'Admin One','admin1@example.com','$pbkdf2-sha256$dummy','admin'),
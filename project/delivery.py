@@ -0,0 +1,128 @@
+# project/delivery.py
+"""
+File delivery for the static view and /uploads/ (artwork images are 2+ MB).
+
+DELIVERY_MODE picks what sends the file bytes:
+
+    x-accel     nginx. The app only answers with headers; X-Accel-Redirect
+                points at DELIVERY_ACCEL_PREFIX + the path under the static
+                folder, and nginx serves the file (ranges, 304s) from an
+                internal location. The worker is free as soon as the
+                headers are out. Precompressed .br/.gz siblings go the same
+                way; nginx does not keep the app's Content-Encoding across the
+                redirect, so the location restores it:
+                    location /_static/ {
+                        internal; alias /srv/artlease/project/static/;
+                        add_header Content-Encoding $upstream_http_content_encoding;
+                        add_header Vary $upstream_http_vary;
+                    }
+    x-sendfile  Apache mod_xsendfile / lighttpd: X-Sendfile with the
+                absolute path.
+    ""          (default) the app server. Range requests get a 206 with
+                only the requested bytes. The body is the server's
+                wsgi.file_wrapper over the open file, seeked to the first
+                byte and limited to the range. gunicorn (and other servers
+                whose wrapper uses os.sendfile) send it from the page cache
+                without copying it through Python, as long as the wrapper
+                reaches the server as is: admission control passes it
+                through, but a middleware that wraps the body (compression
+                of a full text file) makes the server iterate it instead.
+                Iterating, or a server without a file wrapper, reads 256 KB
+                blocks and stops at the end of the range.
+
+With x-accel, files outside the static folder fall back to "".
+"""
+import os
+from urllib.parse import quote
+
+from flask import abort, current_app, request
+from werkzeug.security import safe_join
+from werkzeug.utils import send_file
+
+BLOCK_SIZE = 256 * 1024
+
+
+def _accel_uri(path: str):
+    """Internal nginx URI for a file under the static folder, or None."""
+    root = os.path.abspath(current_app.static_folder)
+    path = os.path.abspath(path)
+    if os.path.commonpath([root, path]) != root:
+        return None
+    rel = os.path.relpath(path, root).replace(os.sep, "/")
+    return current_app.config["DELIVERY_ACCEL_PREFIX"].rstrip("/") + "/" + quote(rel)
+
+
+def _read(f, length: int):
+    try:
+        while length > 0:
+            chunk = f.read(min(BLOCK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+    finally:
+        f.close()
+
+
+class _Span:
+    """A file open at the start of a range: read() stops after length bytes; fileno() is
+    the file's, so a sendfile() from the current offset for Content-Length still works."""
+
+    def __init__(self, f, length: int):
+        self.f = f
+        self.left = length
+
+    def read(self, size: int = -1) -> bytes:
+        size = self.left if size is None or size < 0 else min(size, self.left)
+        data = self.f.read(size) if size > 0 else b""
+        self.left -= len(data)
+        return data
+
+    def fileno(self):
+        return self.f.fileno()
+
+    def close(self):
+        self.f.close()
+
+
+def _body(path: str, start: int, length: int):
+    f = open(path, "rb")
+    f.seek(start)
+    wrapper = request.environ.get("wsgi.file_wrapper")
+    if wrapper is not None:
+        return wrapper(_Span(f, length), BLOCK_SIZE)
+    return _read(f, length)
+
+
+def send_from(directory: str, filename: str, max_age=None, mimetype=None, download_name=None):
+    """
+    send_from_directory() for the static view and uploads, delivered per DELIVERY_MODE.
+    mimetype / download_name override what the file name implies (a precompressed
+    'app.css.br' is sent as text/css named app.css).
+    """
+    path = safe_join(directory, filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+    app = current_app._get_current_object()
+    mode = app.config["DELIVERY_MODE"]
+    kwargs = dict(max_age=app.get_send_file_max_age if max_age is None else max_age,
+                  response_class=app.response_class, _root_path=app.root_path,
+                  mimetype=mimetype, download_name=download_name)
+
+    uri = _accel_uri(path) if mode == "x-accel" else None
+    if uri or mode == "x-sendfile":
+        # ranges and revalidation are the proxy's job; it has the file
+        resp = send_file(path, request.environ, conditional=False, use_x_sendfile=True, **kwargs)
+        if uri:
+            del resp.headers["X-Sendfile"]
+            resp.headers["X-Accel-Redirect"] = uri
+        return resp
+
+    resp = send_file(path, request.environ, conditional=True, **kwargs)
+    if resp.status_code in (200, 206) and request.method != "HEAD":
+        # Werkzeug slices ranges in Python (and hides the file from the server's
+        # sendfile); hand the server the file itself, seeked to the first byte
+        start = resp.content_range.start if resp.status_code == 206 else 0
+        resp.response.close()
+        resp.response = _body(path, start, resp.content_length)
+    return resp
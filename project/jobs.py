@@ -0,0 +1,263 @@
+# project/jobs.py
+"""
+Small durable job queue backed by a local SQLite file.
+
+    from .jobs import job_handler, submit
+
+    @job_handler("order.items")
+    def _insert_items(payload): ...
+
+    job_id = submit("order.items", {...}, key="order-42-items")
+
+Workers are started with `flask jobs-worker --processes 2`. When JOBS_ENABLED is
+off (the default for local dev) submit() runs the handler inline instead.
+"""
+import json
+import os
+import random
+import signal
+import socket
+import sqlite3
+import time
+import traceback
+
+import click
+from flask import current_app
+
+# kind -> callable(payload: dict) -> JSON-serialisable result (or None)
+HANDLERS = {}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+  jobId          INTEGER PRIMARY KEY AUTOINCREMENT,
+  kind           TEXT    NOT NULL,
+  payload        TEXT    NOT NULL,
+  idempotencyKey TEXT    UNIQUE,
+  status         TEXT    NOT NULL DEFAULT 'queued',  -- queued | running | done | failed
+  attempts       INTEGER NOT NULL DEFAULT 0,
+  maxAttempts    INTEGER NOT NULL DEFAULT 5,
+  runAt          REAL    NOT NULL,
+  lockedBy       TEXT,
+  lockedAt       REAL,
+  lastError      TEXT,
+  result         TEXT,
+  createDate     REAL    NOT NULL,
+  updateDate     REAL    NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_due ON jobs(status, runAt);
+"""
+
+
+def job_handler(kind: str):
+    """Register fn as the handler for jobs of this kind."""
+    def decorator(fn):
+        HANDLERS[kind] = fn
+        return fn
+    return decorator
+
+
+# ---------------- storage ----------------
+def _connect(path: str):
+    con = sqlite3.connect(path, timeout=30, isolation_level=None)  # autocommit; explicit BEGINs
+    con.row_factory = sqlite3.Row
+    con.execute("PRAGMA journal_mode=WAL")
+    con.execute("PRAGMA synchronous=NORMAL")
+    return con
+
+
+def _db_path(app=None):
+    return (app or current_app).config["JOBS_DB"]
+
+
+def init_jobs_db(path: str):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    con = _connect(path)
+    try:
+        con.executescript(SCHEMA)
+    finally:
+        con.close()
+
+
+def _row_to_dict(row):
+    if row is None:
+        return None
+    d = dict(row)
+    d["payload"] = json.loads(d["payload"])
+    d["result"] = json.loads(d["result"]) if d["result"] else None
+    return d
+
+
+def enqueue(kind: str, payload: dict, key: str = None, max_attempts: int = None,
+            delay: float = 0.0) -> int:
+    """
+    Persist a job and return its id. With an idempotency key, enqueuing the same
+    key again returns the existing job instead of creating a second one.
+    """
+    cfg = current_app.config
+    now = time.time()
+    con = _connect(_db_path())
+    try:
+        cur = con.execute("""
+            INSERT OR IGNORE INTO jobs
+              (kind, payload, idempotencyKey, maxAttempts, runAt, createDate, updateDate)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, (kind, json.dumps(payload, default=str), key,
+              max_attempts or cfg["JOBS_MAX_ATTEMPTS"], now + delay, now, now))
+        if cur.rowcount:
+            return cur.lastrowid
+        row = con.execute("SELECT jobId FROM jobs WHERE idempotencyKey=?", (key,)).fetchone()
+        return row["jobId"]
+    finally:
+        con.close()
+
+
+def submit(kind: str, payload: dict, key: str = None):
+    """
+    Hand work off to the queue and return the job id right away.
+    With JOBS_ENABLED off the handler runs inline and None is returned.
+    """
+    if not current_app.config.get("JOBS_ENABLED"):
+        HANDLERS[kind](payload)
+        return None
+    return enqueue(kind, payload, key=key)
+
+
+def get_job(job_id: int):
+    con = _connect(_db_path())
+    try:
+        row = con.execute("SELECT * FROM jobs WHERE jobId=?", (job_id,)).fetchone()
+        return _row_to_dict(row)
+    finally:
+        con.close()
+
+
+def _claim(con, worker_id: str, lease_seconds: float):
+    """Atomically take the next due job (or one whose worker died mid-run)."""
+    now = time.time()
+    con.execute("BEGIN IMMEDIATE")
+    try:
+        # a job whose worker died on its last attempt is not retried (it may be what kills them)
+        con.execute("""
+            UPDATE jobs
+            SET status='failed', lastError=COALESCE(lastError, 'worker lease expired'),
+                lockedBy=NULL, updateDate=?
+            WHERE status='running' AND lockedAt < ? AND attempts >= maxAttempts
+        """, (now, now - lease_seconds))
+        row = con.execute("""
+            SELECT * FROM jobs
+            WHERE (status='queued' AND runAt <= ?)
+               OR (status='running' AND lockedAt < ?)
+            ORDER BY runAt
+            LIMIT 1
+        """, (now, now - lease_seconds)).fetchone()
+        if row is None:
+            con.execute("COMMIT")
+            return None
+        con.execute("""
+            UPDATE jobs
+            SET status='running', attempts=attempts+1, lockedBy=?, lockedAt=?, updateDate=?
+            WHERE jobId=?
+        """, (worker_id, now, now, row["jobId"]))
+        con.execute("COMMIT")
+    except Exception:
+        con.execute("ROLLBACK")
+        raise
+    job = _row_to_dict(row)
+    job["attempts"] += 1
+    job["lockedBy"] = worker_id
+    return job
+
+
+def backoff_seconds(attempts: int, base: float, cap: float) -> float:
+    """Exponential backoff with full jitter: U(0, min(cap, base * 2^(n-1)))."""
+    return random.uniform(0, min(cap, base * (2 ** max(0, attempts - 1))))
+
+
+def _finish(con, job, result=None, error=None, cfg=None) -> bool:
+    """Record the outcome; False if the lease was taken over meanwhile (nothing written)."""
+    now = time.time()
+    if error is None:
+        cur = con.execute("""
+            UPDATE jobs SET status='done', result=?, lastError=NULL, lockedBy=NULL, updateDate=?
+            WHERE jobId=? AND lockedBy=?
+        """, (json.dumps(result, default=str), now, job["jobId"], job["lockedBy"]))
+    elif job["attempts"] < job["maxAttempts"]:
+        delay = backoff_seconds(job["attempts"], cfg["JOBS_BACKOFF_BASE"], cfg["JOBS_BACKOFF_MAX"])
+        cur = con.execute("""
+            UPDATE jobs SET status='queued', runAt=?, lastError=?, lockedBy=NULL, updateDate=?
+            WHERE jobId=? AND lockedBy=?
+        """, (now + delay, error, now, job["jobId"], job["lockedBy"]))
+    else:
+        cur = con.execute("""
+            UPDATE jobs SET status='failed', lastError=?, lockedBy=NULL, updateDate=?
+            WHERE jobId=? AND lockedBy=?
+        """, (error, now, job["jobId"], job["lockedBy"]))
+    return cur.rowcount > 0
+
+
+# ---------------- worker ----------------
+def run_worker(app, worker_id: str = None, once: bool = False):
+    """Process jobs until stopped (or until the queue is empty when once=True)."""
+    cfg = app.config
+    worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+    con = _connect(_db_path(app))
+    stopping = []
+    signal.signal(signal.SIGTERM, lambda *_: stopping.append(True))
+    try:
+        while not stopping:
+            job = _claim(con, worker_id, cfg["JOBS_LEASE_SECONDS"])
+            if job is None:
+                if once:
+                    return
+                time.sleep(cfg["JOBS_POLL_INTERVAL"])
+                continue
+            handler = HANDLERS.get(job["kind"])
+            try:
+                if handler is None:
+                    raise LookupError(f"No handler for job kind {job['kind']!r}")
+                # fresh app context per job -> its own request-scoped DB connection
+                with app.app_context():
+                    result = handler(job["payload"])
+                finished = _finish(con, job, result=result)
+            except Exception:
+                app.logger.exception("Job %s (%s) failed", job["jobId"], job["kind"])
+                finished = _finish(con, job, error=traceback.format_exc(limit=5), cfg=cfg)
+            if not finished:
+                app.logger.warning("Job %s (%s): lease expired and was taken over; outcome dropped",
+                                   job["jobId"], job["kind"])
+    finally:
+        con.close()
+
+
+def _worker_process(index: int):
+    # each process builds its own app (and DB connections) after fork/spawn
+    from . import create_app
+    app = create_app()
+    run_worker(app, worker_id=f"{socket.gethostname()}:{os.getpid()}:{index}")
+
+
+def init_jobs(app):
+    init_jobs_db(app.config["JOBS_DB"])
+
+    @app.cli.command("jobs-worker")
+    @click.option("--processes", type=int, default=None, help="Worker processes (default JOBS_WORKERS).")
+    @click.option("--once", is_flag=True, help="Drain due jobs in this process, then exit.")
+    def jobs_worker_command(processes, once):
+        """Run the background job worker pool."""
+        import multiprocessing
+        n = processes or app.config["JOBS_WORKERS"]
+        if once or n <= 1:
+            run_worker(app, once=once)
+            return
+        procs = [multiprocessing.Process(target=_worker_process, args=(i,), daemon=False)
+                 for i in range(n)]
+        for p in procs:
+            p.start()
+
+        def _stop(*_):
+            for p in procs:
+                p.terminate()
+        signal.signal(signal.SIGTERM, _stop)
+        signal.signal(signal.SIGINT, _stop)
+        for p in procs:
+            p.join()
@@ -0,0 +1,192 @@
+# project/leases.py
+"""
+Keeps artworks.leaseStatus in step with the lease dates in order_items.
+
+    flask leases              # long-running scheduler
+    flask leases --once       # process what is due now, then exit (cron)
+
+The scheduler holds a min-heap of (date, artworkId) events: one for each
+lease start and one for each lease end. It is filled once from the leases
+that have not ended. After that it only polls order_items rows near and above
+the highest orderItemId it has seen: ids are allocated at INSERT but become
+visible at COMMIT, so a row can appear below the high-water mark after a later
+one was polled. Each poll re-reads the last LEASES_POLL_OVERLAP ids and skips
+the ones it already pushed. When events fall due, only the affected
+artworks are re-checked, in batches. An artwork is Unavailable while any of
+its leases covers today and Available otherwise. Artworks whose status
+changes go through _artwork_changed, which drops cached rows and refreshes
+listeners.
+
+The date of the last run is kept in LEASES_STATE_FILE, so leases that ended
+while the scheduler was down are still processed on the next start.
+"""
+import heapq
+import json
+import os
+import time
+from datetime import date, datetime, timedelta
+
+import click
+
+from .models import get_db, _artwork_changed
+
+
+def _as_date(v) -> date:
+    if isinstance(v, datetime):
+        return v.date()
+    if isinstance(v, date):
+        return v
+    return date.fromisoformat(str(v)[:10])
+
+
+class LeaseScheduler:
+    def __init__(self, state_file: str, batch_size: int = 500, overlap: int = 1000):
+        self.state_file = state_file
+        self.batch_size = batch_size
+        self.overlap = overlap  # ids below high_water re-read by each poll
+        self.heap = []          # [(date, artworkId)]
+        self.high_water = 0     # highest orderItemId pushed
+        self.recent = set()     # orderItemIds pushed within the overlap window
+        self.last_run = None    # date processed up to (inclusive)
+
+    # -- state --
+    def _load_state(self):
+        try:
+            with open(self.state_file) as fh:
+                self.last_run = date.fromisoformat(json.load(fh)["lastRun"])
+        except (OSError, ValueError, KeyError):
+            self.last_run = date.today() - timedelta(days=1)
+
+    def _save_state(self):
+        os.makedirs(os.path.dirname(self.state_file) or ".", exist_ok=True)
+        tmp = f"{self.state_file}.tmp"
+        with open(tmp, "w") as fh:
+            json.dump({"lastRun": self.last_run.isoformat()}, fh)
+        os.replace(tmp, self.state_file)
+
+    # -- filling the heap --
+    def _push_rows(self, rows, since: date = None) -> int:
+        """Push the start and end events of rows not pushed yet; events before since are dropped."""
+        pushed = 0
+        for r in rows:
+            if r["orderItemId"] in self.recent:
+                continue
+            for d in (_as_date(r["startDate"]), _as_date(r["endDate"])):
+                if since is None or d >= since:
+                    heapq.heappush(self.heap, (d, r["artworkId"]))
+            self.recent.add(r["orderItemId"])
+            self.high_water = max(self.high_water, r["orderItemId"])
+            pushed += 1
+        floor = self.high_water - self.overlap
+        self.recent = {i for i in self.recent if i > floor}
+        return pushed
+
+    def load(self):
+        """Leases that had not ended by the last run (indexed range scans on endDate and the id)."""
+        self._load_state()
+        db = get_db()
+        with db.cursor() as cur:
+            cur.execute("SELECT COALESCE(MAX(orderItemId), 0) AS hw FROM order_items")
+            self.high_water = cur.fetchone()["hw"]
+            # the overlap window is read too, so the first poll doesn't push it again
+            cur.execute("""
+                SELECT orderItemId, artworkId, startDate, endDate
+                FROM order_items
+                WHERE endDate >= %s OR orderItemId > %s
+            """, (self.last_run, max(0, self.high_water - self.overlap)))
+            # events before the last run were already applied; don't re-push them
+            self._push_rows(cur.fetchall(), since=self.last_run)
+
+    def poll_new(self) -> int:
+        """Push leases committed since the last poll (primary-key range scan with overlap)."""
+        db = get_db()
+        with db.cursor() as cur:
+            cur.execute("""
+                SELECT orderItemId, artworkId, startDate, endDate
+                FROM order_items
+                WHERE orderItemId > %s
+                ORDER BY orderItemId
+            """, (max(0, self.high_water - self.overlap),))
+            rows = cur.fetchall()
+        return self._push_rows(rows)
+
+    # -- processing --
+    def due(self, today: date) -> list:
+        ids = set()
+        while self.heap and self.heap[0][0] <= today:
+            ids.add(heapq.heappop(self.heap)[1])
+        return sorted(ids)
+
+    def next_due(self):
+        return self.heap[0][0] if self.heap else None
+
+    def reconcile(self, artwork_ids: list, today: date) -> list:
+        """Set leaseStatus for artwork_ids from their leases; returns the ids that changed."""
+        changed = []
+        db = get_db()
+        for i in range(0, len(artwork_ids), self.batch_size):
+            batch = artwork_ids[i:i + self.batch_size]
+            marks = ",".join(["%s"] * len(batch))
+            with db.cursor() as cur:
+                cur.execute(f"""
+                    SELECT a.artworkId, a.leaseStatus,
+                           EXISTS (SELECT 1 FROM order_items oi
+                                   WHERE oi.artworkId = a.artworkId
+                                     AND oi.startDate <= %s AND oi.endDate > %s) AS leased
+                    FROM artworks a
+                    WHERE a.artworkId IN ({marks}) AND a.isDeleted = 0
+                """, (today, today, *batch))
+                flips = {"Available": [], "Unavailable": []}
+                for r in cur.fetchall():
+                    want = "Unavailable" if r["leased"] else "Available"
+                    if r["leaseStatus"] != want:
+                        flips[want].append(r["artworkId"])
+                for status, ids in flips.items():
+                    if ids:
+                        cur.execute(f"""
+                            UPDATE artworks SET leaseStatus = %s
+                            WHERE artworkId IN ({",".join(["%s"] * len(ids))})
+                        """, (status, *ids))
+                        changed.extend(ids)
+            db.commit()
+        if changed:
+            _artwork_changed(changed)
+        return changed
+
+    def run_due(self, today: date = None) -> list:
+        today = today or date.today()
+        self.poll_new()
+        changed = self.reconcile(self.due(today), today)
+        self.last_run = today
+        self._save_state()
+        return changed
+
+    def run(self, app, poll_interval: float, once: bool = False):
+        # a fresh app context (and DB connection) per pass; the process may idle for hours
+        with app.app_context():
+            self.load()
+        while True:
+            with app.app_context():
+                changed = self.run_due()
+            if changed:
+                app.logger.info("leaseStatus updated for %d artworks", len(changed))
+            if once:
+                return
+            # wake for new leases every poll_interval, or at midnight if an event is due then
+            nxt = self.next_due()
+            wait = poll_interval
+            if nxt is not None:
+                midnight = datetime.combine(max(nxt, date.today() + timedelta(days=1)), datetime.min.time())
+                wait = min(wait, max(1.0, (midnight - datetime.now()).total_seconds()))
+            time.sleep(wait)
+
+
+def init_leases(app):
+    @app.cli.command("leases")
+    @click.option("--once", is_flag=True, help="Process due lease starts/ends, then exit.")
+    def leases_command(once):
+        """Flip artworks Available/Unavailable as their leases start and end."""
+        cfg = app.config
+        LeaseScheduler(cfg["LEASES_STATE_FILE"], cfg["LEASES_BATCH_SIZE"],
+                       cfg["LEASES_POLL_OVERLAP"]).run(
+            app, cfg["LEASES_POLL_INTERVAL"], once=once)
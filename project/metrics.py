@@ -0,0 +1,337 @@
+# project/metrics.py
+"""
+Prometheus-style metrics shared by all worker processes on a node.
+
+Each process keeps its own counters / gauges / histograms in memory and dumps
+them to METRICS_DIR/metrics-<pid>-<start time>.json at most every
+METRICS_FLUSH_INTERVAL seconds (the start time keeps a reused pid from taking
+over a dead worker's file). GET /metrics merges every process file and renders
+the text exposition format. Gauges only count live processes. Counters and
+histograms of exited workers are kept (they are cumulative): a scrape folds
+their files into metrics-exited.json and deletes them.
+"""
+import atexit
+import fcntl
+import glob
+import json
+import os
+import threading
+import time
+
+from flask import current_app, g, request, template_rendered, before_render_template
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+HELP = {
+    "http_requests_total": ("counter", "Requests by endpoint, method and status code."),
+    "http_request_duration_seconds": ("histogram", "Request latency by endpoint."),
+    "http_requests_in_flight": ("gauge", "Requests currently being handled."),
+    "db_request_duration_seconds": ("histogram", "Total DB time spent per request, by endpoint."),
+    "db_queries_total": ("counter", "DB statements executed, by endpoint."),
+    "template_render_duration_seconds": ("histogram", "Template render time by template."),
+    "cache_requests_total": ("counter", "Cache lookups by cache and result (hit/miss)."),
+    "app_startup_seconds": ("gauge", "Worker start-up time by phase (see startup.py)."),
+    "admission_active": ("gauge", "Requests running, by admission class."),
+    "admission_queue_length": ("gauge", "Requests waiting for a slot, by admission class."),
+    "admission_rejected_total": ("counter", "Requests answered 503 by admission control, by class and reason."),
+    "admission_wait_seconds": ("histogram", "Time admitted requests waited in the queue, by class."),
+}
+
+_lock = threading.Lock()
+_counters = {}    # (name, labels) -> float
+_gauges = {}      # (name, labels) -> float
+_histograms = {}  # (name, labels) -> [bucket counts..., +Inf], sum, count
+_last_flush = [0.0]
+
+
+def _key(name, labels):
+    return name, tuple(sorted((labels or {}).items()))
+
+
+# ---------------- recording API ----------------
+def inc(name: str, labels: dict = None, value: float = 1.0):
+    k = _key(name, labels)
+    with _lock:
+        _counters[k] = _counters.get(k, 0.0) + value
+
+
+def gauge_add(name: str, labels: dict = None, value: float = 1.0):
+    k = _key(name, labels)
+    with _lock:
+        _gauges[k] = _gauges.get(k, 0.0) + value
+
+
+def gauge_set(name: str, labels: dict = None, value: float = 0.0):
+    with _lock:
+        _gauges[_key(name, labels)] = float(value)
+
+
+def observe(name: str, labels: dict = None, value: float = 0.0, buckets=DEFAULT_BUCKETS):
+    k = _key(name, labels)
+    with _lock:
+        h = _histograms.get(k)
+        if h is None:
+            h = _histograms[k] = {"buckets": list(buckets), "counts": [0] * (len(buckets) + 1),
+                                  "sum": 0.0, "count": 0}
+        for i, le in enumerate(h["buckets"]):
+            if value <= le:
+                h["counts"][i] += 1
+                break
+        else:
+            h["counts"][-1] += 1
+        h["sum"] += value
+        h["count"] += 1
+
+
+def cache_lookup(cache: str, hit: bool):
+    """Record one cache lookup (used by the caches in models / analytics)."""
+    inc("cache_requests_total", {"cache": cache, "result": "hit" if hit else "miss"})
+
+
+# ---------------- cross-process files ----------------
+EXITED_FILE = "metrics-exited.json"  # counters and histograms of workers that are gone
+_started = {}  # pid -> start time, so a reused pid is a different process (and file)
+
+
+def _start_time(pid: int):
+    """Kernel start time of pid (Linux /proc), or None."""
+    try:
+        with open(f"/proc/{pid}/stat") as fh:
+            return fh.read().rsplit(")", 1)[1].split()[19]
+    except (OSError, IndexError):
+        return None
+
+
+def _snapshot() -> dict:
+    pid = os.getpid()
+    if pid not in _started:
+        _started[pid] = _start_time(pid)
+    with _lock:
+        return {
+            "pid": pid,
+            "started": _started[pid],
+            "counters": [[n, list(l), v] for (n, l), v in _counters.items()],
+            "gauges": [[n, list(l), v] for (n, l), v in _gauges.items()],
+            "histograms": [[n, list(l), h] for (n, l), h in _histograms.items()],
+        }
+
+
+def _write(path: str, snap: dict):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as fh:
+        json.dump(snap, fh)
+    os.replace(tmp, path)
+
+
+def flush(metrics_dir: str):
+    os.makedirs(metrics_dir, exist_ok=True)
+    snap = _snapshot()
+    _write(os.path.join(metrics_dir, f"metrics-{snap['pid']}-{snap['started'] or 0}.json"), snap)
+    _last_flush[0] = time.monotonic()
+
+
+def _alive(snap: dict) -> bool:
+    pid = snap.get("pid")
+    if pid is None:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    # same pid, but a newer process: the one that wrote this file is gone
+    return snap.get("started") is None or _start_time(pid) in (None, snap["started"])
+
+
+def _merge(acc: dict, snap: dict, gauges: bool):
+    for n, l, v in snap["counters"]:
+        k = (n, tuple(tuple(x) for x in l))
+        acc["counters"][k] = acc["counters"].get(k, 0.0) + v
+    if gauges:
+        for n, l, v in snap["gauges"]:
+            k = (n, tuple(tuple(x) for x in l))
+            acc["gauges"][k] = acc["gauges"].get(k, 0.0) + v
+    for n, l, h in snap["histograms"]:
+        k = (n, tuple(tuple(x) for x in l))
+        prev = acc["histograms"].get(k)
+        if prev is None:
+            acc["histograms"][k] = {"buckets": h["buckets"], "counts": list(h["counts"]),
+                                    "sum": h["sum"], "count": h["count"]}
+        else:
+            prev["counts"] = [a + b for a, b in zip(prev["counts"], h["counts"])]
+            prev["sum"] += h["sum"]
+            prev["count"] += h["count"]
+
+
+def _read(path: str):
+    try:
+        with open(path) as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return None  # gone, or being replaced right now; next scrape picks it up
+
+
+def _fold_exited(metrics_dir: str, paths: list):
+    """Merge dead workers' files into EXITED_FILE and delete them, so files don't pile up."""
+    with open(os.path.join(metrics_dir, ".fold.lock"), "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)  # one scraper at a time, or a file counts twice
+        exited_path = os.path.join(metrics_dir, EXITED_FILE)
+        acc = {"counters": {}, "gauges": {}, "histograms": {}}
+        exited = _read(exited_path)
+        if exited:
+            _merge(acc, exited, gauges=False)
+        snaps = [(p, _read(p)) for p in paths]
+        snaps = [(p, snap) for p, snap in snaps if snap is not None]
+        if not snaps:
+            return
+        for _, snap in snaps:
+            _merge(acc, snap, gauges=False)
+        _write(exited_path, {
+            "pid": None,
+            "counters": [[n, list(l), v] for (n, l), v in acc["counters"].items()],
+            "gauges": [],
+            "histograms": [[n, list(l), h] for (n, l), h in acc["histograms"].items()],
+        })
+        for p, _ in snaps:
+            os.remove(p)
+
+
+def collect(metrics_dir: str) -> dict:
+    """Merge every process file into {"counters": {...}, "gauges": {...}, "histograms": {...}}."""
+    acc = {"counters": {}, "gauges": {}, "histograms": {}}
+    dead = []
+    for path in glob.glob(os.path.join(metrics_dir, "metrics-*.json")):
+        snap = _read(path)
+        if snap is None:
+            continue
+        alive = _alive(snap)
+        _merge(acc, snap, gauges=alive)
+        if not alive and os.path.basename(path) != EXITED_FILE:
+            dead.append(path)
+    if dead:
+        try:
+            _fold_exited(metrics_dir, dead)
+        except OSError:
+            current_app.logger.exception("Folding exited workers' metrics failed")
+    return acc
+
+
+# ---------------- exposition ----------------
+def _esc(v) -> str:
+    return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(pairs, extra=None) -> str:
+    items = list(pairs) + (list(extra) if extra else [])
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{_esc(v)}"' for k, v in items) + "}"
+
+
+def _fmt(v: float) -> str:
+    return repr(float(v)) if v != int(v) else str(int(v))
+
+
+def render(data: dict) -> str:
+    by_name = {}
+    for kind in ("counters", "gauges", "histograms"):
+        for (name, labels), value in data[kind].items():
+            by_name.setdefault(name, []).append((labels, value))
+    out = []
+    for name in sorted(by_name):
+        kind, help_text = HELP.get(name, ("untyped", name))
+        out.append(f"# HELP {name} {help_text}")
+        out.append(f"# TYPE {name} {kind}")
+        for labels, value in sorted(by_name[name]):
+            if isinstance(value, dict):
+                cum = 0
+                for le, c in zip(list(value["buckets"]) + ["+Inf"], value["counts"]):
+                    cum += c
+                    le = le if le == "+Inf" else _fmt(le)
+                    out.append(f"{name}_bucket{_labels(labels, [('le', le)])} {cum}")
+                out.append(f"{name}_sum{_labels(labels)} {_fmt(value['sum'])}")
+                out.append(f"{name}_count{_labels(labels)} {value['count']}")
+            else:
+                out.append(f"{name}{_labels(labels)} {_fmt(value)}")
+    return "\n".join(out) + "\n"
+
+
+# ---------------- request instrumentation ----------------
+def _endpoint() -> str:
+    return request.endpoint or "unmatched"
+
+
+def _before():
+    g._metrics_t0 = time.perf_counter()
+    g._db_time = 0.0
+    g._db_queries = 0
+    gauge_add("http_requests_in_flight", None, 1)
+
+
+def _after(response):
+    ep = _endpoint()
+    inc("http_requests_total", {"endpoint": ep, "method": request.method,
+                                "code": str(response.status_code)})
+    return response
+
+
+def _teardown(exc=None):
+    t0 = getattr(g, "_metrics_t0", None)
+    if t0 is None:
+        return
+    g._metrics_t0 = None
+    ep = _endpoint()
+    observe("http_request_duration_seconds", {"endpoint": ep}, time.perf_counter() - t0)
+    if g.get("_db_queries"):
+        observe("db_request_duration_seconds", {"endpoint": ep}, g._db_time)
+        inc("db_queries_total", {"endpoint": ep}, g._db_queries)
+    gauge_add("http_requests_in_flight", None, -1)
+    cfg = current_app.config
+    if time.monotonic() - _last_flush[0] >= cfg["METRICS_FLUSH_INTERVAL"]:
+        try:
+            flush(cfg["METRICS_DIR"])
+        except OSError:
+            current_app.logger.exception("Writing metrics file failed")
+
+
+def _template_started(sender, template, context, **extra):
+    g.setdefault("_tpl_starts", []).append(time.perf_counter())
+
+
+def _template_done(sender, template, context, **extra):
+    starts = g.get("_tpl_starts")
+    if starts:
+        observe("template_render_duration_seconds", {"template": template.name or "string"},
+                time.perf_counter() - starts.pop())
+
+
+def metrics_view():
+    cfg = current_app.config
+    token = cfg.get("METRICS_TOKEN")
+    if token and request.headers.get("Authorization") != f"Bearer {token}":
+        return current_app.response_class("forbidden\n", status=403, mimetype="text/plain")
+    flush(cfg["METRICS_DIR"])
+    body = render(collect(cfg["METRICS_DIR"]))
+    return current_app.response_class(body, mimetype="text/plain; version=0.0.4")
+
+
+def init_metrics(app):
+    if not app.config.get("METRICS_ENABLED"):
+        return
+    app.before_request(_before)
+    app.after_request(_after)
+    app.teardown_request(_teardown)
+    before_render_template.connect(_template_started, app)
+    template_rendered.connect(_template_done, app)
+    app.add_url_rule("/metrics", "metrics", metrics_view)
+    atexit.register(_flush_at_exit, app.config["METRICS_DIR"])
+
+
+def _flush_at_exit(metrics_dir: str):
+    # a worker's last interval of counters; its gauges stop counting once it's gone
+    if _counters or _histograms:
+        try:
+            flush(metrics_dir)
+        except OSError:
+            pass
@@ -1,7 +1,13 @@
 # project/models.py
+import time
+from bisect import bisect_right
+
+from flask import current_app, g
 from flask_mysqldb import MySQL
 from werkzeug.security import generate_password_hash, check_password_hash
 
+from .cache import cached, cached_many, cached_query, invalidate
+
 # Single MySQL instance (Flask-MySQLdb)
 mysql = MySQL()
 
@@ -9,9 +15,53 @@ def init_models(app):
     """Call from create_app() after app.config is ready."""
     mysql.init_app(app)
 
+class _TimedCursor:
+    """Cursor proxy that adds statement time to the current request (g._db_time)."""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def _timed(self, fn, *args):
+        t0 = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            g._db_time = g.get("_db_time", 0.0) + (time.perf_counter() - t0)
+            g._db_queries = g.get("_db_queries", 0) + 1
+
+    def execute(self, *args):
+        return self._timed(self._cursor.execute, *args)
+
+    def executemany(self, *args):
+        return self._timed(self._cursor.executemany, *args)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._cursor.close()
+
+
+class _TimedConnection:
+    def __init__(self, conn):
+        self._conn = conn
+
+    def cursor(self, *args):
+        return _TimedCursor(self._conn.cursor(*args))
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
 def get_db():
-    """Return the underlying MySQLdb connection."""
-    return mysql.connection
+    """Return the request's MySQLdb connection (cursors are timed for metrics)."""
+    return _TimedConnection(mysql.connection)
 
 def close_db(e=None):
     """Nothing required for Flask-MySQLdb; keep as a no-op."""
@@ -19,6 +69,70 @@ def close_db(e=None):
     return None
 
 
+# ---------------- Change listeners ----------------
+# callables(ids: list[int]) run after artworks are created / updated / deleted,
+# e.g. to refresh recommendations or drop cached rows.
+_artwork_listeners = []
+
+def on_artwork_change(fn):
+    """Decorator: register fn(ids) to be called after artwork writes."""
+    if fn not in _artwork_listeners:
+        _artwork_listeners.append(fn)
+    return fn
+
+def _artwork_changed(ids):
+    ids = [int(i) for i in ids]
+    # drop cached rows first so listeners reading artworks see the new state
+    invalidate("artwork", ids)
+    invalidate("facets")
+    invalidate("catalogue")  # bumps the version every cached list_artworks result hangs off
+    for fn in _artwork_listeners:
+        try:
+            fn(ids)
+        except Exception:
+            # a listener must never fail the write that already committed
+            current_app.logger.exception("artwork change listener %r failed", fn)
+
+
+# ---------------- Archive tables ----------------
+# archive.py moves cold rows into <table>_archive twins with identical columns.
+ARCHIVE_SUFFIX = "_archive"
+_archive_checked = {"exists": False, "at": 0.0}
+
+def archive_available() -> bool:
+    """True once `flask archive` has created the archive tables (rechecked each minute until then)."""
+    if _archive_checked["exists"] or time.monotonic() - _archive_checked["at"] < 60:
+        return _archive_checked["exists"]
+    db = get_db()
+    with db.cursor() as cur:
+        cur.execute("SHOW TABLES LIKE %s", (f"orders{ARCHIVE_SUFFIX}",))
+        _archive_checked["exists"] = cur.fetchone() is not None
+    _archive_checked["at"] = time.monotonic()
+    return _archive_checked["exists"]
+
+def _source(table: str, include_archived: bool = False, alias: str = None,
+            where: str = "", params=(), top=None):
+    """
+    FROM target for table, plus the params it binds (put them before the query's own).
+
+    With include_archived the hot and archive rows are unioned. MySQL materialises
+    a UNION derived table before filtering it, so `where` (bare column names, %s
+    placeholders) and top=(order_by, n) are repeated inside each branch, where both
+    tables can use their own indexes. Without it the plain table comes back with no
+    params: callers state the same filter in their own WHERE, which covers both cases.
+    """
+    alias = alias or table
+    if not include_archived or not archive_available():
+        return (table if alias == table else f"{table} {alias}"), []
+    branch, branch_params = (f" WHERE {where}", list(params)) if where else ("", [])
+    if top:
+        order_by, n = top
+        branch += f" ORDER BY {order_by} LIMIT %s"
+        branch_params.append(int(n))
+    union = " UNION ALL ".join(f"(SELECT * FROM {t}{branch})" for t in (table, table + ARCHIVE_SUFFIX))
+    return f"({union}) {alias}", branch_params * 2
+
+
 # ---------------- Users ----------------
 VALID_ROLES = {"admin", "customer", "artist", "gallery"}
 
@@ -39,17 +153,22 @@ def get_user_by_email(email: str):
         """, (email.strip().lower(),))
         return cur.fetchone()
 
-def get_user_by_id(user_id: int):
+def _load_user(user_id: int):
+    # no passwordHash: this row goes into the shared L2 cache file
     db = get_db()
     with db.cursor() as cur:
         cur.execute("""
-            SELECT userId, userName, email, passwordHash, role, isDeleted
+            SELECT userId, userName, email, role, isDeleted
             FROM users
             WHERE userId=%s AND isDeleted=0
             LIMIT 1
         """, (user_id,))
         return cur.fetchone()
 
+def get_user_by_id(user_id: int):
+    """Cached: the login loader calls this on every request. Has no passwordHash."""
+    return cached("users", int(user_id), lambda: _load_user(user_id))
+
 def create_user(userName: str, email: str, password: str, role: str = "customer"):
     role = role if role in VALID_ROLES else "customer"
     db = get_db()
@@ -114,13 +233,24 @@ def create_artwork(provider_id: int, data: dict) -> int:
         ))
         new_id = cur.lastrowid
     db.commit()
+    _artwork_changed([new_id])
     return new_id
 
-def list_artworks(filters: dict) -> list:
-    """
-    filters: artist, gallery, type, genre, price, size, period, q, providerId(optional)
-    """
-    db = get_db()
+# Columns an API client may ask for via ``fields=``; order matches the SELECTs below.
+ARTWORK_FIELDS = (
+    "artworkId", "providerId", "title", "artistName", "galleryName", "type", "genre",
+    "pricePerMonth", "size", "year", "leaseStatus", "imageUrl", "description",
+)
+
+def _artwork_columns(fields=None) -> str:
+    """SELECT list for artworks; unknown names are dropped, artworkId is always kept."""
+    if not fields:
+        return ", ".join(ARTWORK_FIELDS)
+    wanted = set(fields) | {"artworkId"}
+    return ", ".join(c for c in ARTWORK_FIELDS if c in wanted)
+
+def _artwork_where(filters: dict):
+    """Build the WHERE clauses + params shared by every catalogue query."""
     where, params = ["isDeleted=0"], []
 
     if filters.get("providerId"):
@@ -159,31 +289,125 @@ def list_artworks(filters: dict) -> list:
         if p == "pre-1980": where.append("year='before 1980s'")
         elif p.endswith("0s"):
             where.append("year=%s"); params.append(p[:-1])  # '2020s' -> '2020'
+    return where, params
+
+def _query_key(filters: dict) -> tuple:
+    """Canonical form of a filter dict: sorted, empty values dropped, q lower-cased."""
+    out = []
+    for k, v in filters.items():
+        v = str(v).strip() if v is not None else ""
+        if not v:
+            continue
+        out.append((k, v.lower() if k == "q" else v))
+    return tuple(sorted(out))
+
+def _sql_ids(filters: dict) -> list:
+    """Ids matching every filter but colour, newest first."""
+    db = get_db()
+    where, params = _artwork_where(filters)
+    with db.cursor() as cur:
+        cur.execute(f"""
+          SELECT artworkId
+          FROM artworks
+          WHERE {" AND ".join(where)}
+          ORDER BY artworkId DESC
+        """, params)
+        return [r["artworkId"] for r in cur.fetchall()]
+
+def _match_colour(ids, colour: str) -> list:
+    # answered from the in-memory palette matrix, not SQL
+    from .palette import colour_matches
+    matches = colour_matches(colour)
+    return [i for i in ids if i in matches]
+
+def _artwork_ids(filters: dict) -> list:
+    ids = _sql_ids(filters)
+    return _match_colour(ids, filters["colour"]) if filters.get("colour") else ids
+
+def list_artworks(filters: dict, fields=None, after_id=None, limit=None) -> list:
+    """
+    filters: artist, gallery, type, genre, price, size, period, q, providerId(optional),
+             colour (name or #rrggbb, see palette.py)
+    fields:   optional subset of ARTWORK_FIELDS to return (sparse fieldsets)
+    after_id: keyset cursor -> only rows with artworkId < after_id
+    limit:    optional page size
+
+    The matching ids per filter combination (colour aside) are cached until the
+    next artwork write; rows come from the artwork row cache. That cache holds
+    whole rows, so `fields` only trims them afterwards (_pick); it narrows the
+    SELECT only when caching is off. The rows have the same keys either way.
+    """
+    # Only the SQL part is cached: the colour is matched on every call against this
+    # process' palette matrix, which reloads on its own schedule (palette.py), so a
+    # cached colour list could outlive the matrix it was built from.
+    sql_filters = dict(filters, colour="")
+    ids = cached_query("catalogue", _query_key(sql_filters), lambda: _sql_ids(sql_filters))
+    if ids is None and filters.get("colour"):
+        ids = _sql_ids(sql_filters)  # colour can't be expressed in SQL
+    if ids is not None and filters.get("colour"):
+        ids = _match_colour(ids, filters["colour"])
+    if ids is not None:
+        if after_id:
+            # ids are descending: skip everything >= after_id
+            ids = ids[bisect_right(ids, -int(after_id), key=lambda i: -i):]
+        if limit:
+            ids = ids[:int(limit)]
+        return get_artworks_by_ids(ids, fields)
+
+    db = get_db()
+    where, params = _artwork_where(filters)
+    if after_id:
+        where.append("artworkId < %s"); params.append(int(after_id))
 
     sql = f"""
-      SELECT artworkId, providerId, title, artistName, galleryName, type, genre,
-             pricePerMonth, size, year, leaseStatus, imageUrl, description
+      SELECT {_artwork_columns(fields)}
       FROM artworks
       WHERE {" AND ".join(where)}
       ORDER BY artworkId DESC
     """
+    if limit:
+        sql += " LIMIT %s"
+        params.append(int(limit))
     with db.cursor() as cur:
         cur.execute(sql, params)
         return cur.fetchall()
 
-def get_artwork(artwork_id: int):
+def _load_artworks(ids) -> dict:
+    """Full rows for the artwork cache: {artworkId: row} (deleted ones missing)."""
     db = get_db()
     with db.cursor() as cur:
-        cur.execute("""
-          SELECT artworkId, providerId, title, artistName, galleryName, type, genre,
-                 pricePerMonth, size, year, leaseStatus, imageUrl, description
+        cur.execute(f"""
+          SELECT {_artwork_columns()}
           FROM artworks
-          WHERE artworkId=%s AND isDeleted=0
-          LIMIT 1
-        """, (artwork_id,))
-        return cur.fetchone()
+          WHERE artworkId IN ({",".join(["%s"] * len(ids))}) AND isDeleted=0
+        """, list(ids))
+        return {r["artworkId"]: r for r in cur.fetchall()}
+
+def _pick(row: dict, fields=None) -> dict:
+    if not fields:
+        return row
+    wanted = set(fields) | {"artworkId"}
+    return {k: v for k, v in row.items() if k in wanted}
+
+def get_artwork(artwork_id: int, fields=None):
+    row = cached_many("artwork", [int(artwork_id)], _load_artworks)[int(artwork_id)]
+    return _pick(row, fields) if row else None
+
+def get_artworks_by_ids(ids, fields=None) -> list:
+    """Non-deleted artworks for ids, returned in the order of ids."""
+    ids = [int(i) for i in ids]
+    if not ids:
+        return []
+    by_id = cached_many("artwork", dict.fromkeys(ids), _load_artworks)
+    return [_pick(by_id[i], fields) for i in ids if by_id[i]]
 
 def list_distinct_artists():
+    return cached("facets", "artists", _distinct_artists)
+
+def list_distinct_galleries():
+    return cached("facets", "galleries", _distinct_galleries)
+
+def _distinct_artists():
     db = get_db()
     with db.cursor() as cur:
         cur.execute("""
@@ -194,7 +418,7 @@ def list_distinct_artists():
         """)
         return [r["artistName"] for r in cur.fetchall()]
 
-def list_distinct_galleries():
+def _distinct_galleries():
     db = get_db()
     with db.cursor() as cur:
         cur.execute("""
@@ -209,14 +433,17 @@ def list_distinct_galleries():
 def list_artworks_by_provider(provider_id: int):
     return list_artworks({"providerId": provider_id})
 
+# columns update_artwork / bulk_update_artworks may set
+ARTWORK_UPDATABLE = ("title", "artistName", "galleryName", "type", "genre", "pricePerMonth",
+                     "size", "year", "leaseStatus", "imageUrl", "description")
+
 def update_artwork(artwork_id: int, data: dict):
     """Update only fields provided in data."""
     if not data:
         return
     db = get_db()
     cols, params = [], []
-    for k in ["title","artistName","galleryName","type","genre","pricePerMonth",
-              "size","year","leaseStatus","imageUrl","description"]:
+    for k in ARTWORK_UPDATABLE:
         if k in data:
             cols.append(f"{k}=%s")
             params.append(data[k])
@@ -226,12 +453,95 @@ def update_artwork(artwork_id: int, data: dict):
     with db.cursor() as cur:
         cur.execute(f"UPDATE artworks SET {', '.join(cols)} WHERE artworkId=%s AND isDeleted=0", params)
     db.commit()
+    _artwork_changed([artwork_id])
 
 def delete_artwork(artwork_id: int):
     db = get_db()
     with db.cursor() as cur:
         cur.execute("UPDATE artworks SET isDeleted=1 WHERE artworkId=%s", (artwork_id,))
     db.commit()
+    _artwork_changed([artwork_id])
+
+
+# ---------------- Artworks (bulk) ----------------
+BULK_CHUNK_SIZE = 500
+
+def _chunks(ids, size):
+    for i in range(0, len(ids), size):
+        yield ids[i:i + size]
+
+def artwork_owners(ids, chunk_size: int = BULK_CHUNK_SIZE) -> dict:
+    """{artworkId: providerId} for the live artworks among ids (one SELECT per chunk)."""
+    ids = sorted({int(i) for i in ids})
+    owners = {}
+    db = get_db()
+    with db.cursor() as cur:
+        for chunk in _chunks(ids, chunk_size):
+            cur.execute(f"""
+                SELECT artworkId, providerId
+                FROM artworks
+                WHERE artworkId IN ({",".join(["%s"] * len(chunk))}) AND isDeleted=0
+            """, chunk)
+            owners.update((r["artworkId"], r["providerId"]) for r in cur.fetchall())
+    return owners
+
+def artwork_ids_matching(filters: dict) -> list:
+    """Ids of live artworks matching list_artworks filters, read from the DB (not the query cache)."""
+    return _artwork_ids(filters)
+
+def _bulk_set(set_sql: str, set_params: list, ids, provider_id=None,
+              chunk_size: int = BULK_CHUNK_SIZE) -> int:
+    """
+    One UPDATE ... WHERE artworkId IN (chunk) per chunk, committed per chunk;
+    caches and listeners are notified once at the end. provider_id restricts
+    the rows touched to that provider's artworks. Returns rows changed.
+    """
+    ids = sorted({int(i) for i in ids})
+    if not ids:
+        return 0
+    guard, guard_params = "", []
+    if provider_id is not None:
+        guard, guard_params = " AND providerId=%s", [provider_id]
+    db = get_db()
+    changed = 0
+    done = []
+    try:
+        with db.cursor() as cur:
+            for chunk in _chunks(ids, chunk_size):
+                cur.execute(f"""
+                    UPDATE artworks SET {set_sql}
+                    WHERE artworkId IN ({",".join(["%s"] * len(chunk))}) AND isDeleted=0{guard}
+                """, [*set_params, *chunk, *guard_params])
+                changed += cur.rowcount
+                db.commit()
+                done.extend(chunk)
+    finally:
+        # chunks committed before a failure are live; their cached rows must go too
+        if done:
+            _artwork_changed(done)
+    return changed
+
+def bulk_update_artworks(ids, data: dict, price_factor=None, provider_id=None,
+                         chunk_size: int = BULK_CHUNK_SIZE) -> int:
+    """
+    Set the fields in data (ARTWORK_UPDATABLE) on every artwork in ids;
+    price_factor multiplies pricePerMonth (e.g. 0.9 = 10% off).
+    """
+    cols, params = [], []
+    for k in ARTWORK_UPDATABLE:
+        if k in data:
+            cols.append(f"{k}=%s")
+            params.append(data[k])
+    if price_factor is not None and "pricePerMonth" not in data:
+        cols.append("pricePerMonth=ROUND(pricePerMonth * %s, 2)")
+        params.append(float(price_factor))
+    if not cols:
+        return 0
+    return _bulk_set(", ".join(cols), params, ids, provider_id, chunk_size)
+
+def bulk_delete_artworks(ids, provider_id=None, chunk_size: int = BULK_CHUNK_SIZE) -> int:
+    """Soft-delete every artwork in ids."""
+    return _bulk_set("isDeleted=1", [], ids, provider_id, chunk_size)
 
 
 # ---------------- Orders (write) ----------------
@@ -333,75 +643,133 @@ def add_order_item_row(order_id: int, artwork_id: int, image_url: str,
     db.commit()
 
 
+def add_order_item_rows(order_id: int, rows: list[dict]):
+    """
+    Insert all lease lines of an order in one transaction.
+    Idempotent: a retried job finds the items already there and does nothing.
+    """
+    if not rows:
+        return 0
+    db = get_db()
+    with db.cursor() as cur:
+        cur.execute("SELECT COUNT(*) AS n FROM order_items WHERE orderId=%s", (order_id,))
+        if cur.fetchone()["n"]:
+            return 0
+        cur.executemany("""
+            INSERT INTO order_items
+              (orderId, artworkId, imageUrl, pricePerMonth, startDate, endDate, months, TotalPrice)
+            VALUES
+              (%s, %s, %s, %s, %s, %s, %s, %s)
+        """, [(
+            order_id, r["artworkId"], r["imageUrl"], float(r["pricePerMonth"]),
+            r["startDate"], r["endDate"], r["months"], float(r["totalPrice"])
+        ) for r in rows])
+    db.commit()
+    return len(rows)
+
+
 # ---------------- Orders (read) ----------------
-def list_orders_for_user(user_id: int) -> list:
+def artwork_lookup(cur, ids, columns, include_archived: bool = False) -> dict:
+    """{artworkId: {column: value}} for ids (archived artworks too with include_archived)."""
+    ids = list(ids)
+    if not ids:
+        return {}
+    marks = ",".join(["%s"] * len(ids))
+    src, src_params = _source("artworks", include_archived,
+                              where=f"artworkId IN ({marks})", params=ids)
+    cur.execute(f"""
+        SELECT artworkId, {", ".join(columns)}
+        FROM {src}
+        WHERE artworkId IN ({marks})
+    """, (*src_params, *ids))
+    return {r["artworkId"]: {c: r[c] for c in columns} for r in cur.fetchall()}
+
+def _attach_items(cur, orders: list, include_archived: bool = False) -> list:
+    """
+    Fill order["items"] for all orders with two queries (instead of one per order):
+    the lease lines, then their artworks' labels. Lines whose artwork row is gone
+    are left out, as the JOIN this replaces did.
+    """
+    for o in orders:
+        o["items"] = []
+    if not orders:
+        return orders
+    by_id = {o["orderId"]: o for o in orders}
+    marks = ",".join(["%s"] * len(by_id))
+    src, src_params = _source("order_items", include_archived, "oi",
+                              where=f"orderId IN ({marks})", params=list(by_id))
+    cur.execute(f"""
+        SELECT 
+            oi.orderId,
+            oi.orderItemId,
+            oi.artworkId,
+            oi.imageUrl,
+            oi.pricePerMonth,
+            oi.startDate,
+            oi.endDate,
+            oi.months,
+            oi.totalPrice
+        FROM {src}
+        WHERE oi.orderId IN ({marks})
+        ORDER BY oi.orderItemId
+    """, (*src_params, *by_id))
+    items = cur.fetchall()
+    labels = artwork_lookup(cur, {i["artworkId"] for i in items},
+                            ("title", "artistName", "galleryName"), include_archived)
+    for item in items:
+        label = labels.get(item["artworkId"])
+        if label is not None:
+            item.update(label)
+            by_id[item["orderId"]]["items"].append(item)
+    return orders
+
+def _page_sql(limit=None, offset=0):
+    if limit is None:
+        return "", []
+    return " LIMIT %s OFFSET %s", [int(limit), int(offset)]
+
+def list_orders_for_user(user_id: int, include_archived: bool = False) -> list:
     if not user_id:
         return []
     db = get_db()
+    src, src_params = _source("orders", include_archived, where="userId = %s", params=(user_id,))
     with db.cursor() as cur:
-        cur.execute("""
+        cur.execute(f"""
             SELECT orderId, totalPrice, orderDate
-            FROM orders
+            FROM {src}
             WHERE userId = %s
             ORDER BY orderDate DESC
-        """, (user_id,))
-        orders = cur.fetchall()
-
-        for o in orders:
-            cur.execute("""
-                SELECT 
-                    oi.orderItemId,
-                    oi.artworkId,
-                    oi.imageUrl,
-                    oi.pricePerMonth,
-                    oi.startDate,
-                    oi.endDate,
-                    oi.months,
-                    oi.totalPrice,
-                    a.title,
-                    a.artistName,
-                    a.galleryName
-                FROM order_items oi
-                JOIN artworks a ON a.artworkId = oi.artworkId
-                WHERE oi.orderId = %s
-                ORDER BY oi.orderItemId
-            """, (o["orderId"],))
-            o["items"] = cur.fetchall()
-    return orders
-
-def admin_list_orders():
+        """, (*src_params, user_id))
+        return _attach_items(cur, cur.fetchall(), include_archived)
+
+def admin_list_orders(include_archived: bool = False, limit=None, offset=0):
+    page, page_params = _page_sql(limit, offset)
+    order_by = "orderDate DESC, orderId DESC"
+    # each branch only needs its own first offset+limit rows for the merged page
+    top = (order_by, int(offset) + int(limit)) if limit is not None else None
+    src, src_params = _source("orders", include_archived, top=top)
     db = get_db()
     with db.cursor() as cur:
-        cur.execute("""
+        cur.execute(f"""
             SELECT orderId, totalPrice, orderDate
-            FROM orders
-            ORDER BY orderDate DESC
-        """)
-        orders = cur.fetchall()
-
-        for o in orders:
-            cur.execute("""
-                SELECT 
-                    oi.orderItemId,
-                    oi.artworkId,
-                    oi.imageUrl,
-                    oi.pricePerMonth,
-                    oi.startDate,
-                    oi.endDate,
-                    oi.months,
-                    oi.totalPrice,
-                    a.title,
-                    a.artistName,
-                    a.galleryName
-                FROM order_items oi
-                JOIN artworks a ON a.artworkId = oi.artworkId
-                WHERE oi.orderId = %s
-                ORDER BY oi.orderItemId
-            """, (o["orderId"],))
-            o["items"] = cur.fetchall()
-    return orders
+            FROM {src}
+            ORDER BY {order_by}
+        """ + page, src_params + page_params)
+        return _attach_items(cur, cur.fetchall(), include_archived)
 
-def admin_list_artworks():
+def admin_count_orders(include_archived: bool = False) -> int:
+    db = get_db()
+    with db.cursor() as cur:
+        cur.execute("SELECT COUNT(*) AS n FROM orders")
+        n = cur.fetchone()["n"]
+        if include_archived and archive_available():
+            # counted apart: COUNT(*) over the UNION would materialise every row first
+            cur.execute(f"SELECT COUNT(*) AS n FROM orders{ARCHIVE_SUFFIX}")
+            n += cur.fetchone()["n"]
+        return n
+
+def admin_list_artworks(limit=None, offset=0):
+    page, page_params = _page_sql(limit, offset)
     db = get_db()
     with db.cursor() as cur:
         cur.execute("""
@@ -410,10 +778,17 @@ def admin_list_artworks():
             FROM artworks
             WHERE isDeleted = 0
             ORDER BY updateDate DESC, artworkId DESC
-        """)
+        """ + page, page_params)
         return cur.fetchall()
 
-def admin_list_providers():
+def admin_count_artworks() -> int:
+    db = get_db()
+    with db.cursor() as cur:
+        cur.execute("SELECT COUNT(*) AS n FROM artworks WHERE isDeleted = 0")
+        return cur.fetchone()["n"]
+
+def admin_list_providers(limit=None, offset=0):
+    page, page_params = _page_sql(limit, offset)
     db = get_db()
     with db.cursor() as cur:
         cur.execute("""
@@ -432,9 +807,20 @@ def admin_list_providers():
             WHERE u.role IN ('artist','gallery')
             GROUP BY u.userId, u.userName, u.email, p.galleryName
             ORDER BY createDate DESC
-        """)
+        """ + page, page_params)
         return cur.fetchall()
 
+def admin_count_providers() -> int:
+    db = get_db()
+    with db.cursor() as cur:
+        cur.execute("""
+            SELECT COUNT(DISTINCT u.userId, COALESCE(p.galleryName, '')) AS n
+            FROM users u
+            LEFT JOIN providers p ON p.userId = u.userId
+            WHERE u.role IN ('artist','gallery')
+        """)
+        return cur.fetchone()["n"]
+
 def list_my_artworks(user_id: int) -> list:
     """Artworks that belong only to this user (via providers)."""
     if not user_id:
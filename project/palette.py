@@ -0,0 +1,269 @@
+# project/palette.py
+"""
+Colour search from precomputed palettes.
+
+    flask palette-backfill            # artworks without a palette yet
+    flask palette-backfill --all      # recompute every palette
+
+When an image is uploaded (job "palette.extract"), it is decoded once and
+downsampled to PALETTE_SAMPLE_SIZE px. Its pixels are quantised to 4 levels
+per RGB channel, which gives 64 colour bins, and counted with one bincount.
+The histogram is stored as 64 bytes in artwork_palettes. Without a job
+worker (JOBS_ENABLED off) nothing is decoded in the request: the artwork is
+left without a palette until the next `flask palette-backfill`.
+
+Each process keeps every histogram in one (n, 64) float32 matrix. A colour
+query turns into a weight per bin, based on how close that bin's centre is
+to the colour. One matrix-vector product then gives each artwork's share of
+pixels near the colour. That is milliseconds even for 100k artworks.
+
+Pillow is optional. Without it nothing is extracted, but palettes already
+stored still answer queries.
+"""
+import os
+import threading
+import time
+
+import click
+from flask import current_app
+from werkzeug.security import safe_join
+
+from .jobs import job_handler, submit
+from .models import get_db
+from .startup import lazy_import
+
+np = lazy_import("numpy")
+
+# Pillow is optional; without it palettes can't be extracted (only queried)
+try:
+    from PIL import Image
+except Exception:
+    Image = None
+
+LEVELS = 4                   # per channel -> LEVELS ** 3 bins
+BINS = LEVELS ** 3
+SIGMA = 48.0                 # RGB distance at which a bin's weight falls to ~0.6
+
+# gallery colour choices; any #rrggbb also works
+NAMED_COLOURS = {
+    "red": (200, 30, 40), "orange": (235, 130, 30), "yellow": (240, 210, 60),
+    "green": (60, 150, 70), "teal": (30, 140, 140), "blue": (40, 80, 190),
+    "purple": (120, 60, 160), "pink": (235, 140, 180), "brown": (120, 80, 45),
+    "black": (20, 20, 20), "grey": (128, 128, 128), "white": (240, 240, 240),
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS artwork_palettes (
+  artworkId  INT PRIMARY KEY,
+  histogram  BINARY(64) NOT NULL,
+  updateDate TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+) ENGINE=InnoDB
+"""
+
+
+# ---------------- extraction ----------------
+def _bin_centres():
+    levels = (np.arange(LEVELS, dtype=np.float32) + 0.5) * (256 / LEVELS)
+    r, g, b = np.meshgrid(levels, levels, levels, indexing="ij")
+    return np.stack([r.ravel(), g.ravel(), b.ravel()], axis=1)  # row i = bin i
+
+
+def histogram(pixels) -> bytes:
+    """(n, 3) uint8 RGB pixels -> 64 bytes, each bin's share of the pixels in 1/255ths."""
+    q = pixels.astype(np.uint16) // (256 // LEVELS)
+    bins = (q[:, 0] * LEVELS + q[:, 1]) * LEVELS + q[:, 2]
+    counts = np.bincount(bins, minlength=BINS).astype(np.float32)
+    share = counts / max(1.0, counts.sum())
+    return np.rint(share * 255).astype(np.uint8).tobytes()
+
+
+def image_histogram(path: str, sample: int = 64) -> bytes:
+    if Image is None:
+        raise RuntimeError("Pillow is not installed")
+    with Image.open(path) as img:
+        img.draft("RGB", (sample, sample))  # JPEG: decode at reduced scale
+        img = img.convert("RGB")
+        img.thumbnail((sample, sample))
+        pixels = np.asarray(img, dtype=np.uint8).reshape(-1, 3)
+    return histogram(pixels)
+
+
+def image_path(image_url: str):
+    """imageUrl ('uploads/x.jpg', 'img/C1.jpg') -> file under the static folder, or None."""
+    if not image_url:
+        return None
+    return safe_join(current_app.static_folder, image_url)
+
+
+# ---------------- storage ----------------
+_schema_ready = [False]
+
+
+def _ensure_schema(cur):
+    if not _schema_ready[0]:
+        cur.execute(SCHEMA)
+        _schema_ready[0] = True
+
+
+def store(rows):
+    """Upsert [(artworkId, histogram bytes)]."""
+    if not rows:
+        return
+    db = get_db()
+    with db.cursor() as cur:
+        _ensure_schema(cur)
+        cur.executemany("""
+            INSERT INTO artwork_palettes (artworkId, histogram) VALUES (%s, %s)
+            ON DUPLICATE KEY UPDATE histogram = VALUES(histogram)
+        """, rows)
+    db.commit()
+    # this process reloads on its next query, the others within PALETTE_RELOAD_INTERVAL
+    # (colour matches aren't query-cached, so nothing else goes stale)
+    _index["loaded_at"] = None
+
+
+def queue_extract(artwork_id: int, image_url: str, key: str = None):
+    """After an artwork's image was saved; never raises, the artwork is committed by now."""
+    try:
+        if current_app.config.get("JOBS_ENABLED"):
+            submit("palette.extract", {"artworkId": artwork_id, "imageUrl": image_url}, key=key)
+            return
+        # inline mode: no decoding in the request. Drop a replaced image's palette so
+        # the old colours stop matching and palette-backfill picks the artwork up.
+        db = get_db()
+        with db.cursor() as cur:
+            _ensure_schema(cur)
+            cur.execute("DELETE FROM artwork_palettes WHERE artworkId = %s", (artwork_id,))
+        db.commit()
+        _index["loaded_at"] = None
+    except Exception:
+        current_app.logger.exception("Queueing palette extraction for artwork %s failed", artwork_id)
+
+
+@job_handler("palette.extract")
+def _palette_job(payload):
+    if Image is None:
+        return {"skipped": "Pillow not installed"}
+    path = image_path(payload["imageUrl"])
+    if path is None or not os.path.isfile(path):
+        return {"skipped": "image not found"}
+    store([(int(payload["artworkId"]),
+            image_histogram(path, current_app.config["PALETTE_SAMPLE_SIZE"]))])
+    return {"artworkId": payload["artworkId"]}
+
+
+def backfill(everything: bool = False, batch_size: int = 200, log=None) -> dict:
+    """Extract palettes for artworks lacking one (or all of them); stored in batches."""
+    if Image is None:
+        raise click.ClickException("Pillow is required: pip install Pillow")
+    db = get_db()
+    with db.cursor() as cur:
+        _ensure_schema(cur)
+        cur.execute(f"""
+            SELECT a.artworkId, a.imageUrl
+            FROM artworks a
+            {"" if everything else "LEFT JOIN artwork_palettes p ON p.artworkId = a.artworkId"}
+            WHERE a.isDeleted = 0 {"" if everything else "AND p.artworkId IS NULL"}
+            ORDER BY a.artworkId
+        """)
+        todo = cur.fetchall()
+    sample = current_app.config["PALETTE_SAMPLE_SIZE"]
+    done = failed = 0
+    batch = []
+    for r in todo:
+        path = image_path(r["imageUrl"])
+        try:
+            batch.append((r["artworkId"], image_histogram(path, sample)))
+        except Exception as e:
+            failed += 1
+            if log:
+                log(f"artwork {r['artworkId']}: {r['imageUrl']}: {e}")
+            continue
+        if len(batch) >= batch_size:
+            store(batch)
+            done += len(batch)
+            batch = []
+    store(batch)
+    done += len(batch)
+    return {"stored": done, "failed": failed}
+
+
+# ---------------- query ----------------
+_index = {"ids": None, "H": None, "loaded_at": None}
+_index_lock = threading.Lock()
+
+
+def _load_index():
+    db = get_db()
+    with db.cursor() as cur:
+        _ensure_schema(cur)
+        cur.execute("""
+            SELECT p.artworkId, p.histogram
+            FROM artwork_palettes p
+            JOIN artworks a ON a.artworkId = p.artworkId AND a.isDeleted = 0
+        """)
+        rows = cur.fetchall()
+    ids = np.fromiter((r["artworkId"] for r in rows), dtype=np.int64, count=len(rows))
+    H = np.frombuffer(b"".join(bytes(r["histogram"]) for r in rows), dtype=np.uint8)
+    H = H.reshape(len(rows), BINS).astype(np.float32) / 255.0
+    return ids, H
+
+
+def ensure_index():
+    """(ids, H); reloaded after PALETTE_RELOAD_INTERVAL to pick up other workers' uploads."""
+    interval = current_app.config["PALETTE_RELOAD_INTERVAL"]
+
+    def stale():
+        return _index["loaded_at"] is None or time.monotonic() - _index["loaded_at"] >= interval
+
+    if stale():
+        with _index_lock:
+            if stale():
+                _index["ids"], _index["H"] = _load_index()
+                _index["loaded_at"] = time.monotonic()
+    return _index["ids"], _index["H"]
+
+
+def parse_colour(value: str):
+    """'blue', '#3050c0' or '3050c0' -> (r, g, b); ValueError otherwise."""
+    v = (value or "").strip().lower()
+    if v in NAMED_COLOURS:
+        return NAMED_COLOURS[v]
+    v = v.lstrip("#")
+    if len(v) != 6:
+        raise ValueError(f"Unknown colour {value!r}")
+    return tuple(int(v[i:i + 2], 16) for i in (0, 2, 4))
+
+
+def _scores(colour):
+    """(ids, scores): each artwork's share of pixels near colour."""
+    ids, H = ensure_index()
+    rgb = np.asarray(parse_colour(colour), dtype=np.float32)
+    d2 = ((_bin_centres() - rgb) ** 2).sum(axis=1)
+    return ids, H @ np.exp(-d2 / (2 * SIGMA ** 2))
+
+
+def colour_matches(colour) -> dict:
+    """{artworkId: score} where colour covers at least PALETTE_MIN_SHARE of the image."""
+    ids, scores = _scores(colour)
+    hit = scores >= current_app.config["PALETTE_MIN_SHARE"]
+    return dict(zip(ids[hit].tolist(), scores[hit].tolist()))
+
+
+def sort_by_colour(rows: list, colour) -> list:
+    """Closest match first (gallery); rows below the threshold keep their order at the end."""
+    scores = colour_matches(colour)
+    return sorted(rows, key=lambda r: -scores.get(r["artworkId"], 0.0))
+
+
+def init_palette(app):
+    @app.cli.command("palette-backfill")
+    @click.option("--all", "everything", is_flag=True, help="Recompute existing palettes too.")
+    @click.option("--batch-size", type=int, default=None, help="Palettes per upsert.")
+    def palette_backfill_command(everything, batch_size):
+        """Extract colour palettes for artworks whose images have none yet."""
+        t0 = time.perf_counter()
+        res = backfill(everything, batch_size or app.config["PALETTE_BATCH_SIZE"],
+                       log=lambda m: click.echo(m, err=True))
+        click.echo(f"{res['stored']} palettes stored, {res['failed']} failed, "
+                   f"{time.perf_counter() - t0:.1f}s")
@@ -0,0 +1,167 @@
+# project/popularity.py
+"""
+Write-behind popularity counters.
+
+Item views, cart adds and leases are counted in process memory (one dict
+update per event). A daemon thread flushes the deltas every
+POPULARITY_FLUSH_INTERVAL seconds as batched upserts into artwork_stats and
+reloads the ranking every POPULARITY_RANK_INTERVAL seconds, so sorting the
+gallery by popularity is a dict lookup per row instead of an aggregate query.
+"""
+import atexit
+import os
+import threading
+import time
+
+from flask import current_app
+
+from .models import get_db
+
+COUNTERS = ("views", "cartAdds", "leases")
+# gallery ?sort= value -> ordering of artwork_stats
+SORTS = {
+    "views": "s.views DESC, s.leases DESC",
+    "leased": "s.leases DESC, s.cartAdds DESC",
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS artwork_stats (
+  artworkId  INT PRIMARY KEY,
+  views      BIGINT NOT NULL DEFAULT 0,
+  cartAdds   BIGINT NOT NULL DEFAULT 0,
+  leases     BIGINT NOT NULL DEFAULT 0,
+  updateDate TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+) ENGINE=InnoDB
+"""
+
+_lock = threading.Lock()
+_pending = {}                    # artworkId -> [views, cartAdds, leases]
+_ranks = {}                      # sort -> {artworkId: position}
+_state = {"pid": None, "app": None, "ranked_at": 0.0, "schema": False}
+
+
+# ---------------- counting (request path) ----------------
+def record(artwork_id: int, counter: str, n: int = 1):
+    """Count an event; never touches the DB."""
+    if not current_app.config.get("POPULARITY_ENABLED"):
+        return
+    i = COUNTERS.index(counter)
+    with _lock:
+        row = _pending.get(artwork_id)
+        if row is None:
+            row = _pending[artwork_id] = [0, 0, 0]
+        row[i] += n
+    _ensure_flusher()
+
+
+# ---------------- write-behind ----------------
+def _ensure_schema(cur):
+    if not _state["schema"]:
+        cur.execute(SCHEMA)
+        _state["schema"] = True
+
+
+def flush(batch_size: int = 500) -> int:
+    """Upsert pending deltas. On failure they are merged back for the next attempt."""
+    with _lock:
+        pending = dict(_pending)
+        _pending.clear()
+    if not pending:
+        return 0
+    rows = [(aid, *c) for aid, c in pending.items()]
+    db = get_db()
+    try:
+        with db.cursor() as cur:
+            _ensure_schema(cur)
+            for i in range(0, len(rows), batch_size):
+                cur.executemany("""
+                    INSERT INTO artwork_stats (artworkId, views, cartAdds, leases)
+                    VALUES (%s, %s, %s, %s)
+                    ON DUPLICATE KEY UPDATE
+                      views = views + VALUES(views),
+                      cartAdds = cartAdds + VALUES(cartAdds),
+                      leases = leases + VALUES(leases)
+                """, rows[i:i + batch_size])
+        db.commit()
+    except Exception:
+        db.rollback()
+        with _lock:
+            for aid, c in pending.items():
+                row = _pending.setdefault(aid, [0, 0, 0])
+                for j in range(3):
+                    row[j] += c[j]
+        raise
+    return len(rows)
+
+
+def load_rankings():
+    """Rebuild {sort: {artworkId: position}} from artwork_stats (live artworks only)."""
+    db = get_db()
+    ranks = {}
+    with db.cursor() as cur:
+        _ensure_schema(cur)
+        for sort, order in SORTS.items():
+            cur.execute(f"""
+                SELECT s.artworkId
+                FROM artwork_stats s
+                JOIN artworks a ON a.artworkId = s.artworkId AND a.isDeleted = 0
+                ORDER BY {order}, s.artworkId DESC
+            """)
+            ranks[sort] = {r["artworkId"]: pos for pos, r in enumerate(cur.fetchall())}
+    _ranks.clear()
+    _ranks.update(ranks)
+    _state["ranked_at"] = time.monotonic()
+
+
+def _flusher(app):
+    cfg = app.config
+    while True:
+        time.sleep(cfg["POPULARITY_FLUSH_INTERVAL"])
+        with app.app_context():
+            try:
+                flush(cfg["POPULARITY_BATCH_SIZE"])
+                if time.monotonic() - _state["ranked_at"] >= cfg["POPULARITY_RANK_INTERVAL"]:
+                    load_rankings()
+            except Exception:
+                app.logger.exception("Popularity flush failed")
+
+
+def _ensure_flusher():
+    # one thread per process; a forked worker starts its own
+    if _state["pid"] == os.getpid():
+        return
+    with _lock:
+        if _state["pid"] == os.getpid():
+            return
+        _state["pid"] = os.getpid()
+        app = current_app._get_current_object()
+        _state["app"] = app
+        threading.Thread(target=_flusher, args=(app,), daemon=True, name="popularity-flush").start()
+
+
+@atexit.register
+def _flush_at_exit():
+    app = _state["app"]
+    if app is None or _state["pid"] != os.getpid():
+        return
+    try:
+        with app.app_context():
+            flush(app.config["POPULARITY_BATCH_SIZE"])
+    except Exception:
+        pass  # counters are best-effort; losing the last interval is acceptable
+
+
+# ---------------- ranking (request path) ----------------
+def sort_by_popularity(rows: list, sort: str) -> list:
+    """Order gallery rows by the precomputed ranking; unranked ones follow, newest first."""
+    if sort not in SORTS:
+        return rows
+    if not _state["ranked_at"]:
+        try:
+            load_rankings()  # first use in this process
+        except Exception:
+            current_app.logger.exception("Loading popularity ranking failed")
+            return rows
+    rank = _ranks.get(sort, {})
+    unranked = len(rank)
+    return sorted(rows, key=lambda r: (rank.get(r["artworkId"], unranked), -r["artworkId"]))
@@ -0,0 +1,225 @@
+# project/prerender.py
+"""
+Static pre-rendering of the anonymous catalogue pages.
+
+    flask prerender            # /, /gallery (+ common filters), every /item/<id>
+
+Pages are rendered through the app itself (test client, no session) into
+PRERENDER_DIR:
+
+    /                       index.html
+    /gallery                gallery/index.html
+    /gallery?genre=Comic    gallery/genre=Comic.html   (sorted, url-encoded query)
+    /item/42                item/42.html
+
+so a CDN or nginx can serve them directly. With PRERENDER_ENABLED, artwork
+writes queue a job that re-renders the gallery pages, the changed items and
+the items listing them as similar, and recommendation updates re-render the
+items whose similar lists changed (without a job worker those pages are only
+deleted, until the next `flask prerender`). Popularity-sorted gallery pages
+are not pre-rendered.
+With PRERENDER_SERVE, the app itself answers anonymous GETs from these files
+and renders dynamically for logged-in users, visitors with a cart or pending
+flash messages, and any page not in the set.
+"""
+import os
+from urllib.parse import parse_qsl, urlencode
+
+import click
+from flask import current_app, request, send_file, session
+
+from .jobs import job_handler, submit
+from .models import list_artworks, on_artwork_change
+from .popularity import record as record_event
+from .recommend import referrers
+
+# gallery query parameters a pre-rendered page may carry
+# (not "sort": the popularity order changes whenever rankings reload, so those render live)
+GALLERY_KEYS = ("artist", "gallery", "type", "genre", "price", "size", "period", "q", "colour")
+
+# common filter combinations besides the bare /gallery (values as in gallery.html)
+GALLERY_QUERIES = (
+    [{"type": v} for v in ("Oil Painting", "Pastel Painting", "Watercolor Painting",
+                           "Acrylic Painting", "Digital Painting")]
+    + [{"genre": v} for v in ("Illustrative", "Portrait", "Surrealism", "Graffiti", "Comic", "Folk Art")]
+    + [{"price": v} for v in ("0-50", "50-500", "500-5000", "5000-20000", "20000+")]
+)
+
+RENDER_HEADER = "X-Prerender"  # set on our own renders so serving mode never answers them
+
+
+def page_file(path: str, query_pairs) -> str:
+    """Relative output file for a URL, or None if the URL is not pre-renderable."""
+    pairs = sorted((k, v) for k, v in query_pairs if v)
+    if path == "/":
+        return None if pairs else "index.html"
+    if path == "/gallery":
+        if any(k not in GALLERY_KEYS for k, _ in pairs):
+            return None
+        return f"gallery/{urlencode(pairs)}.html" if pairs else "gallery/index.html"
+    parts = path.strip("/").split("/")
+    if len(parts) == 2 and parts[0] == "item" and parts[1].isdigit() and not pairs:
+        return f"item/{int(parts[1])}.html"
+    return None
+
+
+def _url(path: str, query: dict = None) -> str:
+    return f"{path}?{urlencode(sorted(query.items()))}" if query else path
+
+
+def _write(out_dir: str, rel: str, body: bytes):
+    dest = os.path.join(out_dir, rel)
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    tmp = f"{dest}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as fh:
+        fh.write(body)
+    os.replace(tmp, dest)  # readers never see a half-written page
+
+
+def render_urls(app, urls) -> dict:
+    """Render each URL anonymously; returns {url: status}. Non-200 pages are removed."""
+    out_dir = app.config["PRERENDER_DIR"]
+    client = app.test_client()
+    statuses = {}
+    for url in urls:
+        path, _, query = url.partition("?")
+        rel = page_file(path, parse_qsl(query))
+        if rel is None:
+            continue
+        resp = client.get(url, headers={RENDER_HEADER: "1"})
+        statuses[url] = resp.status_code
+        if resp.status_code == 200:
+            _write(out_dir, rel, resp.get_data())
+        else:
+            try:
+                os.remove(os.path.join(out_dir, rel))
+            except FileNotFoundError:
+                pass
+    return statuses
+
+
+def catalogue_urls(item_ids=None) -> list:
+    urls = ["/", "/gallery"] + [_url("/gallery", q) for q in GALLERY_QUERIES]
+    if item_ids is None:
+        item_ids = [r["artworkId"] for r in list_artworks({}, fields=["artworkId"])]
+    return urls + [f"/item/{i}" for i in item_ids]
+
+
+def prerender_all(app) -> dict:
+    with app.app_context():
+        ids = [r["artworkId"] for r in list_artworks({}, fields=["artworkId"])]
+    statuses = render_urls(app, catalogue_urls(ids))
+    # drop pages of artworks that are gone, and gallery variants no longer pre-rendered
+    out_dir = app.config["PRERENDER_DIR"]
+    for sub, live in (("item", {f"{i}.html" for i in ids}),
+                      ("gallery", {page_file("/gallery", q.items())[len("gallery/"):]
+                                   for q in [{}] + GALLERY_QUERIES})):
+        folder = os.path.join(out_dir, sub)
+        if os.path.isdir(folder):
+            for name in os.listdir(folder):
+                if name.endswith(".html") and name not in live:
+                    os.remove(os.path.join(folder, name))
+    return statuses
+
+
+# ---------------- incremental regeneration ----------------
+def _item_urls(ids) -> list:
+    return [f"/item/{i}" for i in sorted({int(i) for i in ids})]
+
+
+def _stale_urls(ids) -> list:
+    """
+    Every gallery page (any write can move an item in or out of a listing), the
+    changed items, and the items showing one of them under "similar artworks".
+    """
+    return ["/gallery"] + [_url("/gallery", q) for q in GALLERY_QUERIES] + _item_urls(list(ids) + referrers(ids))
+
+
+def remove_pages(urls) -> int:
+    """Delete the pre-rendered files of urls, so they are rendered dynamically until the next run."""
+    out_dir = current_app.config["PRERENDER_DIR"]
+    n = 0
+    for url in urls:
+        path, _, query = url.partition("?")
+        rel = page_file(path, parse_qsl(query))
+        if rel is None:
+            continue
+        try:
+            os.remove(os.path.join(out_dir, rel))
+            n += 1
+        except FileNotFoundError:
+            pass
+    return n
+
+
+def _render_job(urls) -> dict:
+    statuses = render_urls(current_app._get_current_object(), urls)
+    return {"rendered": sum(1 for s in statuses.values() if s == 200)}
+
+
+@job_handler("prerender.artworks")
+def _prerender_job(payload):
+    return _render_job(_stale_urls(payload["ids"]))
+
+
+@job_handler("prerender.items")
+def _prerender_items_job(payload):
+    return _render_job(_item_urls(payload["ids"]))
+
+
+def _refresh(kind: str, ids, urls):
+    if not ids or not current_app.config.get("PRERENDER_ENABLED"):
+        return
+    if current_app.config.get("JOBS_ENABLED"):
+        submit(kind, {"ids": ids})
+    else:
+        # no worker: rendering here would nest test-client requests inside this one
+        # (shared g, metrics); drop the stale pages and leave them to `flask prerender`
+        remove_pages(urls(ids))
+
+
+@on_artwork_change
+def _queue_prerender(ids):
+    _refresh("prerender.artworks", ids, _stale_urls)
+
+
+def refresh_items(ids):
+    """Item pages whose similar artworks changed (recommend.py's index update)."""
+    _refresh("prerender.items", ids, _item_urls)
+
+
+# ---------------- serving mode ----------------
+def _anonymous_visitor() -> bool:
+    """Nothing on the page would differ from the pre-rendered copy."""
+    if request.cookies.get("remember_token"):
+        return False
+    return not (session.get("_user_id") or session.get("cart") or session.get("_flashes"))
+
+
+def _serve_prerendered():
+    if request.method != "GET" or request.headers.get(RENDER_HEADER):
+        return None
+    rel = page_file(request.path, request.args.items(multi=True))
+    if rel is None or not _anonymous_visitor():
+        return None
+    path = os.path.join(current_app.config["PRERENDER_DIR"], rel)
+    if not os.path.isfile(path):
+        return None
+    if rel.startswith("item/"):
+        record_event(int(rel[5:-5]), "views")  # the dynamic view would have counted it
+    resp = send_file(path, mimetype="text/html", conditional=True)
+    resp.headers["Cache-Control"] = f"public, max-age={current_app.config['PRERENDER_MAX_AGE']}"
+    resp.headers["X-Prerendered"] = "1"
+    return resp
+
+
+def init_prerender(app):
+    if app.config.get("PRERENDER_SERVE"):
+        app.before_request(_serve_prerendered)
+
+    @app.cli.command("prerender")
+    def prerender_command():
+        """Render the anonymous catalogue pages into PRERENDER_DIR."""
+        statuses = prerender_all(app)
+        ok = sum(1 for s in statuses.values() if s == 200)
+        click.echo(f"{ok}/{len(statuses)} pages written to {app.config['PRERENDER_DIR']}")
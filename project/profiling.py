@@ -0,0 +1,246 @@
+# project/profiling.py
+"""
+Opt-in sampling profiler for individual requests.
+
+A sampled request gets a background thread that reads the request thread's
+stack via sys._current_frames() every PROFILE_INTERVAL seconds; nothing is
+hooked into the interpreter, so unsampled requests pay one random() call.
+Stacks are stored collapsed ("a;b;c 12") in a local SQLite file together with
+the endpoint, timing and a per model-function / template breakdown.
+"""
+import json
+import os
+import random
+import sqlite3
+import sys
+import threading
+import time
+
+from flask import current_app, g, request
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+MODELS_FILE = os.path.join(PROJECT_DIR, "models.py")
+TEMPLATES_DIR = os.path.join(PROJECT_DIR, "templates")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS profiles (
+  profileId  INTEGER PRIMARY KEY AUTOINCREMENT,
+  endpoint   TEXT,
+  method     TEXT,
+  path       TEXT,
+  status     INTEGER,
+  durationMs REAL,
+  samples    INTEGER,
+  stacks     TEXT,   -- collapsed stacks, one "frame;frame;frame count" per line
+  breakdown  TEXT,   -- JSON {"model:list_artworks": n, "template:gallery.html": n, ...}
+  createDate REAL
+);
+CREATE INDEX IF NOT EXISTS idx_profiles_duration ON profiles(durationMs);
+"""
+
+
+# ---------------- sampling ----------------
+def frame_label(frame) -> str:
+    """Readable, groupable name for one stack frame."""
+    code = frame.f_code
+    fname = code.co_filename
+    if fname == MODELS_FILE:
+        return f"model:{code.co_name}"
+    if fname.startswith(TEMPLATES_DIR) or fname.endswith(".html"):
+        return f"template:{os.path.relpath(fname, TEMPLATES_DIR) if fname.startswith(TEMPLATES_DIR) else os.path.basename(fname)}"
+    if fname.startswith(PROJECT_DIR):
+        return f"{os.path.basename(fname)[:-3]}:{code.co_name}"
+    # library frames: top-level package + function keeps stacks short
+    parts = fname.replace("\\", "/").split("/site-packages/")
+    mod = parts[-1].split("/")[0] if len(parts) > 1 else os.path.basename(fname)
+    return f"{mod}:{code.co_name}"
+
+
+class Sampler(threading.Thread):
+    """Collects collapsed stacks of one target thread until stop()."""
+
+    def __init__(self, target_ident: int, interval: float):
+        super().__init__(daemon=True, name="request-profiler")
+        self.target_ident = target_ident
+        self.interval = interval
+        self.counts = {}
+        self.samples = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.target_ident)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(frame_label(frame))
+                frame = frame.f_back
+            key = ";".join(reversed(stack))
+            self.counts[key] = self.counts.get(key, 0) + 1
+            self.samples += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+def breakdown(counts: dict) -> dict:
+    """Samples attributed to the innermost model function / template of each stack."""
+    out = {}
+    for stack, n in counts.items():
+        label = "other"
+        for frame in reversed(stack.split(";")):
+            if frame.startswith(("model:", "template:")):
+                label = frame
+                break
+        out[label] = out.get(label, 0) + n
+    return dict(sorted(out.items(), key=lambda kv: -kv[1]))
+
+
+def flame_rects(stacks_text: str, min_width: float = 0.2) -> list:
+    """
+    Icicle layout for the collapsed stacks: one dict per box with depth,
+    x / width in percent of all samples, label and sample count.
+    """
+    root = {"children": {}, "value": 0}
+    for line in stacks_text.splitlines():
+        stack, _, n = line.rpartition(" ")
+        if not stack:
+            continue
+        n = int(n)
+        root["value"] += n
+        node = root
+        for frame in stack.split(";"):
+            node = node["children"].setdefault(frame, {"children": {}, "value": 0})
+            node["value"] += n
+    total = root["value"] or 1
+    rects = []
+
+    def walk(node, depth, x):
+        for name, child in sorted(node["children"].items()):
+            width = 100.0 * child["value"] / total
+            if width >= min_width:
+                rects.append({"depth": depth, "x": x, "width": width,
+                              "label": name, "samples": child["value"]})
+                walk(child, depth + 1, x)
+            x += width
+
+    walk(root, 0, 0.0)
+    return rects
+
+
+# ---------------- storage ----------------
+def _connect(path):
+    con = sqlite3.connect(path, timeout=10)
+    con.row_factory = sqlite3.Row
+    return con
+
+
+def save_profile(app, row: dict):
+    con = _connect(app.config["PROFILE_DB"])
+    try:
+        with con:
+            con.execute("""
+                INSERT INTO profiles
+                  (endpoint, method, path, status, durationMs, samples, stacks, breakdown, createDate)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (row["endpoint"], row["method"], row["path"], row["status"], row["durationMs"],
+                  row["samples"], row["stacks"], json.dumps(row["breakdown"]), time.time()))
+            # keep only the newest PROFILE_KEEP profiles
+            con.execute("""
+                DELETE FROM profiles WHERE profileId <= (
+                  SELECT profileId FROM profiles ORDER BY profileId DESC LIMIT 1 OFFSET ?)
+            """, (app.config["PROFILE_KEEP"],))
+    finally:
+        con.close()
+
+
+def list_profiles(limit: int = 50, endpoint: str = None) -> list:
+    con = _connect(current_app.config["PROFILE_DB"])
+    try:
+        where, params = "", []
+        if endpoint:
+            where, params = "WHERE endpoint=?", [endpoint]
+        rows = con.execute(f"""
+            SELECT profileId, endpoint, method, path, status, durationMs, samples, breakdown, createDate
+            FROM profiles {where}
+            ORDER BY durationMs DESC
+            LIMIT ?
+        """, params + [limit]).fetchall()
+        return [dict(r, breakdown=json.loads(r["breakdown"])) for r in rows]
+    finally:
+        con.close()
+
+
+def get_profile(profile_id: int):
+    con = _connect(current_app.config["PROFILE_DB"])
+    try:
+        row = con.execute("SELECT * FROM profiles WHERE profileId=?", (profile_id,)).fetchone()
+        return dict(row, breakdown=json.loads(row["breakdown"])) if row else None
+    finally:
+        con.close()
+
+
+# ---------------- request hooks ----------------
+def _admin_requested() -> bool:
+    """X-Profile: 1 is honoured for logged-in admins only."""
+    if request.headers.get("X-Profile") != "1":
+        return False
+    try:
+        from flask_login import current_user
+        return bool(current_user.is_authenticated and current_user.role == "admin")
+    except Exception:
+        return False
+
+
+def _start_profile():
+    cfg = current_app.config
+    if request.endpoint == "static":
+        return
+    if random.random() < cfg["PROFILE_SAMPLE_RATE"] or _admin_requested():
+        g._profiler = Sampler(threading.get_ident(), cfg["PROFILE_INTERVAL"])
+        g._profile_t0 = time.perf_counter()
+        g._profiler.start()
+
+
+def _note_status(response):
+    if getattr(g, "_profiler", None) is not None:
+        g._profile_status = response.status_code
+    return response
+
+
+def _finish_profile(exc=None):
+    sampler = getattr(g, "_profiler", None)
+    if sampler is None:
+        return
+    g._profiler = None
+    sampler.stop()
+    app = current_app._get_current_object()
+    try:
+        save_profile(app, {
+            "endpoint": request.endpoint,
+            "method": request.method,
+            "path": request.full_path.rstrip("?"),
+            "status": getattr(g, "_profile_status", 500),
+            "durationMs": (time.perf_counter() - g._profile_t0) * 1000.0,
+            "samples": sampler.samples,
+            "stacks": "\n".join(f"{k} {v}" for k, v in sampler.counts.items()),
+            "breakdown": breakdown(sampler.counts),
+        })
+    except Exception:
+        app.logger.exception("Saving request profile failed")
+
+
+def init_profiling(app):
+    if not app.config.get("PROFILE_ENABLED"):
+        return
+    os.makedirs(os.path.dirname(app.config["PROFILE_DB"]) or ".", exist_ok=True)
+    con = _connect(app.config["PROFILE_DB"])
+    try:
+        con.executescript(SCHEMA)
+    finally:
+        con.close()
+    app.before_request(_start_profile)
+    app.after_request(_note_status)
+    app.teardown_request(_finish_profile)
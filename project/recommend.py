@@ -0,0 +1,363 @@
+# project/recommend.py
+"""
+"Similar artworks": precomputed top-K cosine neighbours.
+
+Every artwork is encoded as a hashed feature vector (type, genre, size, period,
+price band, title/description terms). Neighbours are computed offline in blocks
+(`flask recs-build`) and refreshed incrementally by a job after artwork writes;
+without a job worker the changed ids are only noted, for `flask recs-build
+--pending` (e.g. from cron).
+The request path only does a dict lookup (`similar_ids`).
+"""
+from __future__ import annotations
+
+import fcntl
+import math
+import os
+import re
+import threading
+import time
+import zlib
+
+import click
+from flask import current_app
+
+from .jobs import job_handler, submit
+from .models import list_artworks, get_artworks_by_ids, on_artwork_change
+from .startup import lazy_import
+
+np = lazy_import("numpy")  # loaded on first use, not at app start
+
+# feature layout: [categorical block | term block]
+CAT_DIMS = 256
+TERM_DIMS = 1024
+DIMS = CAT_DIMS + TERM_DIMS
+
+# relative weight of each feature group in the cosine
+WEIGHTS = {"type": 1.0, "genre": 1.5, "size": 0.5, "year": 0.75, "price": 0.75, "terms": 1.0}
+
+STOPWORDS = {
+    "the", "and", "for", "with", "from", "this", "that", "are", "was", "its", "into",
+    "our", "your", "his", "her", "their", "has", "have", "not", "but", "all", "one",
+}
+_TOKEN = re.compile(r"[a-z0-9]{3,}")
+
+
+# ---------------- encoding ----------------
+def _bucket(token: str, dims: int) -> int:
+    # crc32 is stable across processes (str hash() is salted per process)
+    return zlib.crc32(token.encode("utf-8")) % dims
+
+
+def price_band(price) -> int:
+    """Log-scale band: 0 = <10, 1 = 10-99, 2 = 100-999, ... (mirrors the gallery buckets)."""
+    p = float(price or 0)
+    return int(math.log10(p)) if p >= 10 else 0
+
+
+def encode(row: dict) -> np.ndarray:
+    """Unit-length feature vector for one artwork row."""
+    v = np.zeros(DIMS, dtype=np.float32)
+    for key in ("type", "genre", "size", "year"):
+        if row.get(key):
+            v[_bucket(f"{key}={row[key]}", CAT_DIMS)] += WEIGHTS[key]
+    v[_bucket(f"price={price_band(row.get('pricePerMonth'))}", CAT_DIMS)] += WEIGHTS["price"]
+
+    text = f"{row.get('title') or ''} {row.get('description') or ''}".lower()
+    terms = [t for t in _TOKEN.findall(text) if t not in STOPWORDS]
+    if terms:
+        tv = np.zeros(TERM_DIMS, dtype=np.float32)
+        np.add.at(tv, [_bucket(t, TERM_DIMS) for t in terms], 1.0)
+        tv = np.log1p(tv)  # sublinear tf so long descriptions don't dominate
+        v[CAT_DIMS:] = WEIGHTS["terms"] * tv / np.linalg.norm(tv)
+
+    n = np.linalg.norm(v)
+    return v / n if n else v
+
+
+def encode_rows(rows) -> np.ndarray:
+    if not rows:
+        return np.zeros((0, DIMS), dtype=np.float32)
+    return np.vstack([encode(r) for r in rows])
+
+
+# ---------------- top-K ----------------
+def topk_block(Q: np.ndarray, X: np.ndarray, ids: np.ndarray, k: int, self_pos=None):
+    """
+    Top-k neighbours of each row of Q among the rows of X (cosine; rows are unit length).
+    self_pos[i] is Q[i]'s own row in X (excluded), or -1.
+    Returns (nbr_ids [len(Q), k] with -1 padding, nbr_scores [len(Q), k]).
+    """
+    nq, n = len(Q), len(X)
+    out_ids = np.full((nq, k), -1, dtype=np.int64)
+    out_scores = np.full((nq, k), -np.inf, dtype=np.float32)
+    if nq == 0 or n == 0:
+        return out_ids, out_scores
+    S = Q @ X.T
+    if self_pos is not None:
+        rows = np.nonzero(self_pos >= 0)[0]
+        S[rows, self_pos[rows]] = -np.inf
+    kk = min(k, n)
+    part = np.argpartition(-S, kk - 1, axis=1)[:, :kk]
+    part_scores = np.take_along_axis(S, part, axis=1)
+    order = np.argsort(-part_scores, axis=1)
+    part = np.take_along_axis(part, order, axis=1)
+    part_scores = np.take_along_axis(part_scores, order, axis=1)
+    valid = np.isfinite(part_scores)
+    out_ids[:, :kk] = np.where(valid, ids[part], -1)
+    out_scores[:, :kk] = np.where(valid, part_scores, -np.inf)
+    return out_ids, out_scores
+
+
+def topk_all(X: np.ndarray, ids: np.ndarray, k: int, rows=None, block: int = 512):
+    """top-k for the given row positions of X (default all), block by block."""
+    rows = np.arange(len(X)) if rows is None else np.asarray(rows, dtype=np.int64)
+    nbr_ids = np.full((len(rows), k), -1, dtype=np.int64)
+    nbr_scores = np.full((len(rows), k), -np.inf, dtype=np.float32)
+    for s in range(0, len(rows), block):
+        pos = rows[s:s + block]
+        nbr_ids[s:s + block], nbr_scores[s:s + block] = topk_block(X[pos], X, ids, k, self_pos=pos)
+    return nbr_ids, nbr_scores
+
+
+# ---------------- index ----------------
+class RecIndex:
+    """Feature matrix + neighbour table, persisted as a single .npz file."""
+
+    def __init__(self, ids, X, nbr_ids, nbr_scores):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.X = X
+        self.nbr_ids = nbr_ids
+        self.nbr_scores = nbr_scores
+        self._pos = {int(a): i for i, a in enumerate(self.ids)}
+
+    @property
+    def k(self):
+        return self.nbr_ids.shape[1]
+
+    @classmethod
+    def build(cls, rows, k: int, block: int = 512):
+        ids = np.array([r["artworkId"] for r in rows], dtype=np.int64)
+        X = encode_rows(rows)
+        nbr_ids, nbr_scores = topk_all(X, ids, k, block=block)
+        return cls(ids, X, nbr_ids, nbr_scores)
+
+    def neighbours(self) -> dict:
+        """{artworkId: (neighbourId, ...)} for O(1) lookups on the request path."""
+        return _neighbour_map(self.ids, self.nbr_ids)
+
+    def update(self, rows, removed_ids, block: int = 512):
+        """
+        Apply upserts (rows) and removals in place, recomputing only the neighbour
+        lists that can change: the touched artworks themselves, lists that contained
+        a touched artwork, and lists where a touched artwork now beats the k-th score.
+        Returns the ids whose lists were recomputed.
+        """
+        touched = set(int(i) for i in removed_ids) | {int(r["artworkId"]) for r in rows}
+
+        # removals
+        drop = [self._pos[i] for i in removed_ids if i in self._pos]
+        if drop:
+            keep = np.setdiff1d(np.arange(len(self.ids)), drop)
+            self.ids, self.X = self.ids[keep], self.X[keep]
+            self.nbr_ids, self.nbr_scores = self.nbr_ids[keep], self.nbr_scores[keep]
+
+        # upserts
+        if rows:
+            self._pos = {int(a): i for i, a in enumerate(self.ids)}
+            vecs = encode_rows(rows)
+            new = []
+            for r, v in zip(rows, vecs):
+                p = self._pos.get(int(r["artworkId"]))
+                if p is None:
+                    new.append((r["artworkId"], v))
+                else:
+                    self.X[p] = v
+            if new:
+                self.ids = np.concatenate([self.ids, np.array([a for a, _ in new], dtype=np.int64)])
+                self.X = np.vstack([self.X, np.vstack([v for _, v in new])])
+                self.nbr_ids = np.vstack([self.nbr_ids, np.full((len(new), self.k), -1, dtype=np.int64)])
+                self.nbr_scores = np.vstack([self.nbr_scores,
+                                             np.full((len(new), self.k), -np.inf, dtype=np.float32)])
+        self._pos = {int(a): i for i, a in enumerate(self.ids)}
+        if len(self.ids) == 0:
+            return []
+
+        # which lists must be recomputed
+        dirty = np.isin(self.nbr_ids, np.array(sorted(touched), dtype=np.int64)).any(axis=1)
+        dirty |= np.isin(self.ids, np.array(sorted(touched), dtype=np.int64))
+        changed_pos = np.array([self._pos[int(r["artworkId"])] for r in rows], dtype=np.int64)
+        if len(changed_pos):
+            # similarity of every artwork to each changed one, vs its current k-th score
+            S = self.X @ self.X[changed_pos].T
+            S[changed_pos, np.arange(len(changed_pos))] = -np.inf
+            kth = self.nbr_scores[:, -1]
+            dirty |= (S > kth[:, None]).any(axis=1)
+
+        rows_to_fix = np.nonzero(dirty)[0]
+        if len(rows_to_fix):
+            ids_, scores_ = topk_all(self.X, self.ids, self.k, rows=rows_to_fix, block=block)
+            self.nbr_ids[rows_to_fix], self.nbr_scores[rows_to_fix] = ids_, scores_
+        return [int(i) for i in self.ids[rows_to_fix]]
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez(tmp, ids=self.ids, X=self.X, nbr_ids=self.nbr_ids, nbr_scores=self.nbr_scores)
+        os.replace(tmp, path)  # readers see either the old or the new file
+
+    @classmethod
+    def load(cls, path: str):
+        with np.load(path) as z:
+            return cls(z["ids"], z["X"], z["nbr_ids"], z["nbr_scores"])
+
+
+# ---------------- read path ----------------
+def _neighbour_map(ids, nbr_ids) -> dict:
+    return {int(a): tuple(int(b) for b in row if b >= 0) for a, row in zip(ids, nbr_ids)}
+
+
+def load_neighbours(path: str) -> dict:
+    """neighbours() of a saved index, reading only ids and nbr_ids (not X) from the .npz."""
+    with np.load(path) as z:  # members are read on access
+        return _neighbour_map(z["ids"], z["nbr_ids"])
+
+
+_lookup = {"neighbours": {}, "mtime": None, "checked": 0.0}
+_lookup_lock = threading.Lock()
+
+
+def _refresh_lookup():
+    cfg = current_app.config
+    now = time.monotonic()
+    if now - _lookup["checked"] < cfg["RECS_RELOAD_INTERVAL"]:
+        return
+    with _lookup_lock:
+        _lookup["checked"] = now
+        path = cfg["RECS_INDEX_PATH"]
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            return
+        if mtime != _lookup["mtime"]:
+            _lookup["neighbours"] = load_neighbours(path)
+            _lookup["mtime"] = mtime
+
+
+def referrers(ids) -> list:
+    """Artworks whose similar list shows any of ids (as of this process' lookup)."""
+    try:
+        _refresh_lookup()
+    except Exception:
+        current_app.logger.exception("Loading recommendations index failed")
+    ids = {int(i) for i in ids}
+    return [a for a, nbrs in _lookup["neighbours"].items() if not ids.isdisjoint(nbrs)]
+
+
+def similar_ids(artwork_id: int) -> tuple:
+    """Precomputed neighbour ids (best first); empty until the index is built."""
+    try:
+        _refresh_lookup()
+    except Exception:
+        current_app.logger.exception("Loading recommendations index failed")
+    return _lookup["neighbours"].get(int(artwork_id), ())
+
+
+# ---------------- write path ----------------
+class _IndexLock:
+    """Exclusive file lock so concurrent job workers don't lose each other's updates."""
+
+    def __init__(self, path):
+        self.path = path + ".lock"
+
+    def __enter__(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self.fh = open(self.path, "w")
+        fcntl.flock(self.fh, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        fcntl.flock(self.fh, fcntl.LOCK_UN)
+        self.fh.close()
+
+
+def build_index() -> RecIndex:
+    cfg = current_app.config
+    with _IndexLock(cfg["RECS_INDEX_PATH"]):
+        index = RecIndex.build(list_artworks({}), cfg["RECS_TOP_K"], cfg["RECS_BLOCK_SIZE"])
+        index.save(cfg["RECS_INDEX_PATH"])
+    return index
+
+
+def update_index(ids) -> dict:
+    """Apply artwork changes to the saved index (a full build if there is none yet)."""
+    cfg = current_app.config
+    path = cfg["RECS_INDEX_PATH"]
+    if not os.path.exists(path):
+        return {"rebuilt": len(build_index().ids)}
+    ids = [int(i) for i in ids]
+    with _IndexLock(path):
+        index = RecIndex.load(path)
+        rows = get_artworks_by_ids(ids)  # deleted artworks simply don't come back
+        present = {r["artworkId"] for r in rows}
+        relisted = index.update(rows, [i for i in ids if i not in present], cfg["RECS_BLOCK_SIZE"])
+        index.save(path)
+    from .prerender import refresh_items  # their pre-rendered "similar artworks" changed
+    refresh_items(relisted)
+    return {"updated": len(ids)}
+
+
+def _pending_path() -> str:
+    return current_app.config["RECS_INDEX_PATH"] + ".pending"
+
+
+def mark_dirty(ids):
+    """Note changed ids for `flask recs-build --pending` (one appended line, no index work)."""
+    path = _pending_path()
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "a") as fh:
+        fh.write(" ".join(str(int(i)) for i in ids) + "\n")
+
+
+def take_pending() -> list:
+    """Ids marked dirty so far; the list is cleared."""
+    path = _pending_path()
+    work = f"{path}.{os.getpid()}"
+    try:
+        os.replace(path, work)  # new marks go to a fresh file
+    except FileNotFoundError:
+        return []
+    with open(work) as fh:
+        ids = sorted({int(t) for t in fh.read().split()})
+    os.remove(work)
+    return ids
+
+
+@job_handler("recs.update")
+def _recs_update_job(payload):
+    return update_index(payload["ids"])
+
+
+@on_artwork_change
+def _queue_recs_update(ids):
+    if current_app.config.get("JOBS_ENABLED"):
+        submit("recs.update", {"ids": ids})
+    else:
+        # no worker to hand it to: never load / rebuild the index inside the request
+        mark_dirty(ids)
+
+
+def init_recommend(app):
+    @app.cli.command("recs-build")
+    @click.option("--pending", is_flag=True,
+                  help="Only apply artworks changed since the last run (JOBS_ENABLED off).")
+    def recs_build_command(pending):
+        """Rebuild the similar-artworks index from scratch (or apply --pending changes)."""
+        t0 = time.perf_counter()
+        ids = take_pending()  # a full build covers them too
+        if pending:
+            res = update_index(ids) if ids else {"updated": 0}
+            click.echo(f"{res}, {time.perf_counter() - t0:.2f}s")
+            return
+        index = build_index()
+        click.echo(f"{len(index.ids)} artworks, k={index.k}, {time.perf_counter() - t0:.2f}s")
@@ -0,0 +1,135 @@
+# project/startup.py
+"""
+Worker cold start.
+
+- Compiled templates are kept on disk (Jinja FileSystemBytecodeCache in
+  STARTUP_BYTECODE_DIR), so a new worker loads bytecode instead of parsing
+  and compiling base.html, gallery.html, ... again.
+- With STARTUP_COMPILE_TEMPLATES every template is loaded while the app is
+  built, not on the first request that renders it.
+- With STARTUP_WARMUP the @on_warmup tasks run before create_app returns,
+  i.e. before the worker accepts traffic: fill the read caches the catalogue
+  pages use and load the in-memory indexes. (DB connections are not kept:
+  Flask-MySQLdb closes them at app-context teardown, so opening one here
+  would not save the first request anything.)
+- Heavy modules that only some requests need are imported on first
+  attribute access (lazy_import), not when the app is built.
+
+Each phase is timed; the times are logged, kept in app.extensions["startup"]
+and exported as the app_startup_seconds gauge.
+"""
+import importlib.util
+import os
+import sys
+import time
+
+from jinja2 import FileSystemBytecodeCache
+
+from .metrics import gauge_set
+
+
+def lazy_import(name: str):
+    """The module `name`, loaded on first attribute access instead of now."""
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ImportError(f"No module named {name!r}")
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+
+# ---------------- warm-up tasks ----------------
+_warmups = []  # [(name, fn)]
+
+
+def on_warmup(fn):
+    """Register fn() to run inside an app context before the worker serves requests."""
+    _warmups.append((fn.__name__.lstrip("_"), fn))
+    return fn
+
+
+@on_warmup
+def _catalogue():
+    # the unfiltered gallery: id list (query cache), rows (row cache) and facets
+    from .models import list_artworks, list_distinct_artists, list_distinct_galleries
+    list_artworks({})
+    list_distinct_artists()
+    list_distinct_galleries()
+
+
+@on_warmup
+def _suggest():
+    from .suggest import ensure_index
+    ensure_index()
+
+
+@on_warmup
+def _popularity():
+    from flask import current_app
+    if current_app.config.get("POPULARITY_ENABLED"):
+        from .popularity import load_rankings
+        load_rankings()
+
+
+@on_warmup
+def _recommendations():
+    from .recommend import similar_ids
+    similar_ids(0)  # loads the neighbour index (and NumPy)
+
+
+def warm_up(app) -> dict:
+    """Run every warm-up task; returns {name: seconds}. A failing task is logged and skipped."""
+    timings = {}
+    for name, fn in _warmups:
+        t0 = time.perf_counter()
+        with app.app_context():
+            try:
+                fn()
+            except Exception:
+                app.logger.exception("Warm-up task %s failed", name)
+        timings[name] = time.perf_counter() - t0
+    return timings
+
+
+# ---------------- templates ----------------
+def compile_templates(app) -> int:
+    """Load (and so compile, or read from the bytecode cache) every template."""
+    env = app.jinja_env
+    names = env.list_templates(filter_func=lambda n: n.endswith(".html"))
+    for name in names:
+        env.get_template(name)
+    return len(names)
+
+
+def init_startup(app, started: float = None):
+    """Call last in create_app; `started` is time.perf_counter() at its start."""
+    cfg = app.config
+    timings = {}
+    if started is not None:
+        timings["app"] = time.perf_counter() - started
+
+    if cfg["STARTUP_BYTECODE_DIR"]:
+        os.makedirs(cfg["STARTUP_BYTECODE_DIR"], exist_ok=True)
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(cfg["STARTUP_BYTECODE_DIR"])
+
+    if cfg["STARTUP_COMPILE_TEMPLATES"]:
+        t0 = time.perf_counter()
+        compile_templates(app)
+        timings["templates"] = time.perf_counter() - t0
+
+    if cfg["STARTUP_WARMUP"]:
+        t0 = time.perf_counter()
+        for name, secs in warm_up(app).items():
+            timings[f"warmup.{name}"] = secs
+        timings["warmup"] = time.perf_counter() - t0
+
+    app.extensions["startup"] = timings
+    for phase, secs in timings.items():
+        gauge_set("app_startup_seconds", {"phase": phase}, secs)
+    app.logger.info("Worker %d ready: %s", os.getpid(),
+                    ", ".join(f"{k}={v * 1000:.0f}ms" for k, v in timings.items()))
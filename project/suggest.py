@@ -0,0 +1,143 @@
+# project/suggest.py
+"""
+Type-ahead suggestions for artist names, gallery names and artwork titles.
+
+A sorted list of (normalised key, kind, display name) tuples is searched with
+bisect; every word of a name is indexed so "smi" also finds "John Smith".
+Matches are ranked by how many artworks carry the name. The index is built
+once per process and patched on artwork writes.
+"""
+import heapq
+import threading
+import time
+import unicodedata
+from bisect import bisect_left, insort
+
+from flask import current_app
+
+from .models import get_db, get_artworks_by_ids, on_artwork_change
+
+KINDS = ("artist", "gallery", "title")
+_FIELDS = {"artist": "artistName", "gallery": "galleryName", "title": "title"}
+
+
+def normalize(text: str) -> str:
+    """Case- and accent-insensitive form: 'Renée  Ödon' -> 'renee odon'."""
+    decomposed = unicodedata.normalize("NFKD", text or "")
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return " ".join(stripped.casefold().split())
+
+
+def _keys_for(name: str):
+    """The full name plus every later word start."""
+    words = normalize(name).split(" ")
+    return {" ".join(words[i:]) for i in range(len(words)) if words[i]}
+
+
+class PrefixIndex:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._keys = []        # sorted [(key, kind, display)]
+        self._counts = {}      # (kind, display) -> number of artworks
+        self._by_artwork = {}  # artworkId -> {kind: display}
+        self.built_at = None
+
+    # -- maintenance --
+    def _add(self, kind, display):
+        k = (kind, display)
+        n = self._counts.get(k, 0)
+        self._counts[k] = n + 1
+        if n == 0:
+            for key in _keys_for(display):
+                insort(self._keys, (key, kind, display))
+
+    def _remove(self, kind, display):
+        k = (kind, display)
+        n = self._counts.get(k, 0)
+        if n <= 1:
+            self._counts.pop(k, None)
+            for key in _keys_for(display):
+                i = bisect_left(self._keys, (key, kind, display))
+                if i < len(self._keys) and self._keys[i] == (key, kind, display):
+                    del self._keys[i]
+        else:
+            self._counts[k] = n - 1
+
+    def set_artwork(self, artwork_id: int, row):
+        """Replace what artwork_id contributes (row=None removes it)."""
+        with self._lock:
+            for kind, display in self._by_artwork.pop(artwork_id, {}).items():
+                self._remove(kind, display)
+            if row is None:
+                return
+            names = {kind: row[_FIELDS[kind]].strip() for kind in KINDS
+                     if (row.get(_FIELDS[kind]) or "").strip()}
+            for kind, display in names.items():
+                self._add(kind, display)
+            self._by_artwork[artwork_id] = names
+
+    def rebuild(self, rows):
+        fresh = PrefixIndex()
+        for r in rows:
+            fresh.set_artwork(r["artworkId"], r)
+        with self._lock:
+            self._keys, self._counts, self._by_artwork = fresh._keys, fresh._counts, fresh._by_artwork
+            self.built_at = time.monotonic()
+
+    # -- lookup --
+    def suggest(self, prefix: str, kind: str = None, limit: int = 10, scan_limit: int = 5000):
+        p = normalize(prefix)
+        if not p:
+            return []
+        with self._lock:
+            lo = bisect_left(self._keys, (p,))
+            hi = bisect_left(self._keys, (p + "\uffff",), lo)
+            window = self._keys[lo:min(hi, lo + scan_limit)]
+            seen = {}
+            for _key, k, display in window:
+                if kind and k != kind:
+                    continue
+                seen[(k, display)] = self._counts.get((k, display), 0)
+        best = heapq.nlargest(limit, seen.items(), key=lambda kv: (kv[1], -len(kv[0][1])))
+        return [{"value": display, "kind": k, "count": n} for (k, display), n in best]
+
+
+index = PrefixIndex()
+_build_lock = threading.Lock()
+
+
+def _load_rows():
+    db = get_db()
+    with db.cursor() as cur:
+        cur.execute("""
+            SELECT artworkId, artistName, galleryName, title
+            FROM artworks
+            WHERE isDeleted=0
+        """)
+        return cur.fetchall()
+
+
+def ensure_index():
+    """Build on first use; rebuild after SUGGEST_REBUILD_INTERVAL to pick up other workers' writes."""
+    interval = current_app.config["SUGGEST_REBUILD_INTERVAL"]
+    if index.built_at is not None and time.monotonic() - index.built_at < interval:
+        return index
+    with _build_lock:
+        if index.built_at is None or time.monotonic() - index.built_at >= interval:
+            index.rebuild(_load_rows())
+    return index
+
+
+def suggest(prefix: str, kind: str = None, limit: int = 10):
+    cfg = current_app.config
+    return ensure_index().suggest(prefix, kind, min(limit, cfg["SUGGEST_MAX_RESULTS"]),
+                                  cfg["SUGGEST_SCAN_LIMIT"])
+
+
+@on_artwork_change
+def _patch_index(ids):
+    if index.built_at is None:
+        return  # not built in this process yet; the first lookup loads fresh rows
+    rows = {r["artworkId"]: r for r in get_artworks_by_ids(ids, fields=["artistName", "galleryName", "title"])}
+    for i in ids:
+        index.set_artwork(i, rows.get(i))
@@ -0,0 +1,205 @@
+# project/uploads.py
+"""
+Streaming, size-capped image uploads.
+
+Werkzeug normally spools every uploaded file (to memory or a temp file) and the
+view only looks at it afterwards. UploadRequest replaces that spool with
+ImageSpool, which writes each chunk straight into UPLOAD_FOLDER as it arrives and
+validates the magic bytes and pixel dimensions from the first bytes, aborting the
+request before the rest of a bogus or oversized file is read.
+"""
+import os
+import struct
+import uuid
+
+from flask import Request, current_app, flash, redirect, request
+from werkzeug.exceptions import HTTPException, RequestEntityTooLarge
+
+
+class UploadRejected(HTTPException):
+    """Raised from inside form parsing; HTTPException so Werkzeug doesn't swallow it."""
+    code = 415
+
+    def __init__(self, description, code=None):
+        super().__init__(description)
+        if code:
+            self.code = code
+
+
+# ---------------- format sniffing ----------------
+def _jpeg_size(head: bytes):
+    """Walk JPEG markers up to the first SOFn. None = need more bytes."""
+    i = 2
+    while True:
+        if i + 4 > len(head):
+            return None
+        if head[i] != 0xFF:
+            raise UploadRejected("Corrupt JPEG file")
+        marker = head[i + 1]
+        if marker == 0xFF:  # fill byte
+            i += 1
+            continue
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:  # no length field
+            i += 2
+            continue
+        seg_len = struct.unpack(">H", head[i + 2:i + 4])[0]
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            if i + 9 > len(head):
+                return None
+            h, w = struct.unpack(">HH", head[i + 5:i + 9])
+            return w, h
+        i += 2 + seg_len
+
+
+def sniff_image(head: bytes):
+    """
+    Identify an image from its first bytes.
+    Returns (ext, width, height), or None if more bytes are needed.
+    Raises UploadRejected if the bytes are not a supported image.
+    """
+    if len(head) < 32:
+        return None
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        w, h = struct.unpack(">II", head[16:24])
+        return "png", w, h
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        w, h = struct.unpack("<HH", head[6:10])
+        return "gif", w, h
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        chunk = head[12:16]
+        if chunk == b"VP8 ":
+            w, h = struct.unpack("<HH", head[26:30])
+            return "webp", w & 0x3FFF, h & 0x3FFF
+        if chunk == b"VP8L":
+            b = head[21:25]
+            w = 1 + (((b[1] & 0x3F) << 8) | b[0])
+            h = 1 + (((b[3] & 0x0F) << 10) | (b[2] << 2) | ((b[1] & 0xC0) >> 6))
+            return "webp", w, h
+        if chunk == b"VP8X":
+            w = 1 + int.from_bytes(head[24:27], "little")
+            h = 1 + int.from_bytes(head[27:30], "little")
+            return "webp", w, h
+        raise UploadRejected("Unsupported WebP variant")
+    if head[:3] == b"\xff\xd8\xff":
+        size = _jpeg_size(head)
+        return None if size is None else ("jpg", size[0], size[1])
+    raise UploadRejected("Unsupported image type")
+
+
+# ---------------- streaming spool ----------------
+class ImageSpool:
+    """
+    File-like target for one uploaded file part. Chunks go to a hidden
+    '.<uuid>.part' file in the upload folder; finalize() renames it into place,
+    otherwise close() deletes it.
+    """
+
+    def __init__(self, upload_dir, max_bytes, max_pixels, sniff_bytes):
+        self.max_bytes = max_bytes
+        self.max_pixels = max_pixels
+        self.sniff_bytes = sniff_bytes
+        self.path = os.path.join(upload_dir, f".{uuid.uuid4().hex}.part")
+        self._fh = open(self.path, "w+b")
+        self._head = bytearray()  # only kept until the format/dimensions are known
+        self.size = 0
+        self.info = None          # (ext, width, height) once validated
+        self.finalized = False
+
+    # -- writing (called by Werkzeug's multipart parser) --
+    def write(self, data: bytes):
+        self.size += len(data)
+        if self.size > self.max_bytes:
+            self._discard()
+            raise UploadRejected(f"Image is too large (max {self.max_bytes // (1024 * 1024)} MB)", 413)
+        if self.info is None:
+            self._head += data
+            try:
+                info = sniff_image(bytes(self._head))
+            except UploadRejected:
+                self._discard()
+                raise
+            if info is None and len(self._head) >= self.sniff_bytes:
+                self._discard()
+                raise UploadRejected("Could not read image dimensions")
+            if info is not None:
+                ext, w, h = info
+                if not w or not h or w * h > self.max_pixels:
+                    self._discard()
+                    raise UploadRejected(f"Image dimensions {w}x{h} are not allowed")
+                self.info = info
+                self._head = None
+        return self._fh.write(data)
+
+    # -- file-like passthrough (FileStorage expects these) --
+    def seek(self, *args):
+        return self._fh.seek(*args)
+
+    def tell(self):
+        return self._fh.tell()
+
+    def read(self, *args):
+        return self._fh.read(*args)
+
+    def flush(self):
+        return self._fh.flush()
+
+    @property
+    def closed(self):
+        return self._fh.closed
+
+    @property
+    def validated(self) -> bool:
+        return self.info is not None
+
+    @property
+    def ext(self):
+        return self.info[0] if self.info else None
+
+    def finalize(self, dest: str):
+        """Move the completed upload to dest (same filesystem -> no copy)."""
+        self._fh.flush()
+        os.fsync(self._fh.fileno())
+        self._fh.close()
+        os.replace(self.path, dest)
+        self.finalized = True
+
+    def _discard(self):
+        if not self._fh.closed:
+            self._fh.close()
+        if not self.finalized and os.path.exists(self.path):
+            os.remove(self.path)
+
+    def close(self):
+        self._discard()
+
+    def __del__(self):
+        try:
+            self._discard()
+        except Exception:
+            pass
+
+
+class UploadRequest(Request):
+    def _get_file_stream(self, total_content_length, content_type, filename=None,
+                         content_length=None):
+        cfg = current_app.config
+        return ImageSpool(cfg["UPLOAD_FOLDER"], cfg["UPLOAD_MAX_IMAGE_BYTES"],
+                          cfg["UPLOAD_MAX_PIXELS"], cfg["UPLOAD_SNIFF_BYTES"])
+
+
+def _upload_error(e):
+    """Rejected uploads go back to the form with a toast instead of an error page."""
+    if request.method != "POST":
+        return e
+    if isinstance(e, UploadRejected):
+        flash(e.description, "danger")
+    else:
+        limit = current_app.config["MAX_CONTENT_LENGTH"] // (1024 * 1024)
+        flash(f"Upload is too large (max {limit} MB)", "danger")
+    return redirect(request.path)
+
+
+def init_uploads(app):
+    app.request_class = UploadRequest
+    app.register_error_handler(UploadRejected, _upload_error)
+    app.register_error_handler(RequestEntityTooLarge, _upload_error)
@@ -5,7 +5,7 @@ from functools import wraps
 
 from flask import (
     Blueprint, render_template, abort, request, redirect,
-    url_for, flash, current_app, session, send_from_directory
+    url_for, flash, current_app, session
 )
 from flask_login import login_required, current_user
 from werkzeug.utils import secure_filename
@@ -15,21 +15,29 @@ from .models import (
     create_artwork,
     list_artworks,
     get_artwork,
-    list_distinct_artists,
-    list_distinct_galleries,
+    get_artworks_by_ids,
     create_order,        # NEW
     add_order_items,
     create_payment, 
     create_address, 
     create_order_row, 
-    add_order_item_row     # NEW
+    add_order_item_rows,   # NEW
 )
+from .jobs import job_handler, submit
+from .recommend import similar_ids
+from .popularity import record as record_event, sort_by_popularity
+from .palette import NAMED_COLOURS, parse_colour, queue_extract, sort_by_colour
+from .prerender import RENDER_HEADER
+from .uploads import ImageSpool, UploadRejected
+from .delivery import send_from
 
 # Optional admin/customer/vendor helpers (safe if not implemented)
 try:
     from .models import admin_list_orders, admin_list_artworks, admin_list_providers
+    from .models import admin_count_orders, admin_count_artworks, admin_count_providers
 except Exception:
     admin_list_orders = admin_list_artworks = admin_list_providers = None
+    admin_count_orders = admin_count_artworks = admin_count_providers = None
 
 try:
     from .models import list_orders_for_user
@@ -76,6 +84,21 @@ def _parse_float(val, default=0.0):
         return default
 
 
+TRACKED_JOBS = 20
+
+
+def track_job(job_id):
+    """Remember a job this session submitted; only it (or an admin) may poll its status."""
+    if job_id:
+        session["jobs"] = (session.get("jobs", []) + [job_id])[-TRACKED_JOBS:]
+
+
+def can_see_job(job_id: int) -> bool:
+    if job_id in session.get("jobs", []):
+        return True
+    return getattr(current_user, "is_authenticated", False) and current_user.role == "admin"
+
+
 def _save_image(file_storage):
     """
     Save to <project>/project/static/uploads/<uuid>.<ext>
@@ -83,6 +106,15 @@ def _save_image(file_storage):
       url_for('static', filename=imageUrl)
     """
     cfg = current_app.config
+    stream = file_storage.stream
+    if isinstance(stream, ImageSpool):
+        # already streamed to disk and sniffed while the request was parsed
+        if not stream.validated:
+            raise ValueError("Unsupported image type")
+        new_name = f"{uuid.uuid4().hex}.{stream.ext}"
+        stream.finalize(os.path.join(cfg["UPLOAD_FOLDER"], new_name))
+        return f"uploads/{new_name}"
+
     fname = secure_filename(file_storage.filename or "")
     ext = fname.rsplit(".", 1)[-1].lower() if "." in fname else ""
     if not ext or ext not in cfg["ALLOWED_IMAGE_EXTS"]:
@@ -99,40 +131,53 @@ def home():
     return render_template("home.html")
 
 
+def read_filters(args) -> dict:
+    """Catalogue filters from a query string (shared by /gallery and the JSON API)."""
+    return {
+        "artist":  (args.get("artist") or "").strip(),
+        "gallery": (args.get("gallery") or "").strip(),
+        "type":    (args.get("type") or "").strip(),
+        "genre":   (args.get("genre") or "").strip(),
+        "price":   (args.get("price") or "").strip(),   # '0-50','50-500','500-5000','5000-20000','20000+'
+        "size":    (args.get("size") or "").strip(),    # 's','m','l','xl'
+        "period":  (args.get("period") or "").strip(),  # '2020s','2010s',...,'pre-1980'
+        "q":       (args.get("q") or "").strip(),
+        "colour":  (args.get("colour") or "").strip(),  # 'blue' / '#3050c0' (palette.py)
+        # optional providerId if you reuse for vendor listing
+        "providerId": args.get("providerId")
+    }
+
+
+def check_colour(filters: dict) -> dict:
+    """Drop an unknown colour filter (with a warning) before any query runs."""
+    if filters["colour"]:
+        try:
+            parse_colour(filters["colour"])
+        except ValueError:
+            flash("Unknown colour", "warning")
+            filters["colour"] = ""
+    return filters
+
+
 @main.get("/gallery")
 def gallery():
     # Read filters (from navbar or on-page form)
-    filters = {
-        "artist":  (request.args.get("artist") or "").strip(),
-        "gallery": (request.args.get("gallery") or "").strip(),
-        "type":    (request.args.get("type") or "").strip(),
-        "genre":   (request.args.get("genre") or "").strip(),
-        "price":   (request.args.get("price") or "").strip(),   # '0-50','50-500','500-5000','5000-20000','20000+'
-        "size":    (request.args.get("size") or "").strip(),    # 's','m','l','xl'
-        "period":  (request.args.get("period") or "").strip(),  # '2020s','2010s',...,'pre-1980'
-        "q":       (request.args.get("q") or "").strip(),
-        # optional providerId if you reuse for vendor listing
-        "providerId": request.args.get("providerId")
-    }
+    filters = check_colour(read_filters(request.args))
 
     items = list_artworks(filters)
+    sort = request.args.get("sort") or ""
+    if filters["colour"] and not sort:
+        items = sort_by_colour(items, filters["colour"])  # closest match first
+    else:
+        items = sort_by_popularity(items, sort)  # precomputed ranks; default stays newest first
 
-    # Dropdown options
-    try:
-        artist_opts = list_distinct_artists() or []
-    except Exception:
-        artist_opts = []
-    try:
-        gallery_opts = list_distinct_galleries() or []
-    except Exception:
-        gallery_opts = []
-
+    # artist / gallery inputs are type-ahead (/api/suggest), no option lists here
     return render_template(
         "gallery.html",
         items=items,
         filters=filters,
-        artist_opts=artist_opts,
-        gallery_opts=gallery_opts,
+        sort=sort,
+        colours=NAMED_COLOURS,
     )
 
 
@@ -141,7 +186,15 @@ def item_detail(item_id: int):
     it = get_artwork(item_id)
     if not it:
         abort(404)
-    return render_template("item_detail.html", item=it)
+    if not request.headers.get(RENDER_HEADER):  # pre-render passes aren't visitors
+        record_event(item_id, "views")
+    # neighbours are precomputed; this is a dict lookup + one IN (...) query
+    try:
+        similar = get_artworks_by_ids(similar_ids(item_id))
+    except Exception:
+        current_app.logger.exception("Load similar artworks failed")
+        similar = []
+    return render_template("item_detail.html", item=it, similar=similar)
 
 
 # ========== cart ==========
@@ -163,6 +216,7 @@ def cart_add(item_id: int):
 
     price = _parse_float(it.get("pricePerMonth"), 0.0)
 
+    record_event(it["artworkId"], "cartAdds")
     _cart().append({
         "id": it["artworkId"],
         "title": it["title"],
@@ -204,56 +258,74 @@ def checkout():
         flash("Your cart is empty.", "warning")
         return redirect(url_for("main.checkout"))
 
-    # read form (ชื่อฟิลด์ตามเพื่อน แต่แมพเข้าตารางตามของคุณ)
-    email = (request.form.get("email") or "").strip()
-    phone = (request.form.get("phoneNumber") or "").strip()
-    recipient = (request.form.get("recipientName") or "").strip()
-    addr = (request.form.get("address") or "").strip()
-    city = (request.form.get("city") or "").strip()
-    state = (request.form.get("state") or "").strip()
-    postcode = (request.form.get("postcode") or "").strip()
-    card = (request.form.get("cardNumber") or "").strip()
-    exp = (request.form.get("expDate") or "").strip()
-    cvv = (request.form.get("cvv") or "").strip()
-
-    if not all([email, phone, recipient, addr, city, state, postcode, card, exp, cvv]):
+    form = checkout_form(request.form)
+    if form is None:
         flash("Please complete all fields.", "warning")
         return render_template("checkout.html", cart=cart, total=total)
 
     try:
         # 1) payments
-        payment_id = create_payment(card, exp, cvv)
+        payment_id = create_payment(form["card"], form["exp"], form["cvv"])
         # 2) addresses
-        address_id = create_address(recipient, addr, city, state, postcode)
+        address_id = create_address(form["recipient"], form["addr"], form["city"], form["state"], form["postcode"])
         # 3) orders
         user_id = current_user.id if getattr(current_user, "is_authenticated", False) else None
-        order_id = create_order_row(user_id, email, phone, total, address_id, payment_id)
-        # 4) order_items (คำนวณช่วงเช่าจาก months)
-        start = date.today()
-        for line in cart:
-            months = int(line.get("months", 1))
-            end = _add_months(start, months)
-            add_order_item_row(
-                order_id=order_id,
-                artwork_id=int(line["id"]),
-                image_url=line["imageUrl"],
-                price_per_month=_parse_float(line["pricePerMonth"], 0.0),
-                months=months,
-                start_date=start,
-                end_date=end,
-                total_price=_parse_float(line["subtotal"], 0.0),
-            )
-
-        # success
-        session.pop("cart", None)
-        flash(f"Order #{order_id} placed successfully!", "success")
-        return redirect(url_for("main.customer_center") if getattr(current_user, "is_authenticated", False) else url_for("main.home"))
+        order_id = create_order_row(user_id, form["email"], form["phone"], total, address_id, payment_id)
+        # 4) order_items (คำนวณช่วงเช่าจาก months) -> handed off to the job queue
+        return checkout_placed(order_id, cart)
 
     except Exception:
         flash("Checkout failed. Please try again.", "danger")
         return render_template("checkout.html", cart=cart, total=total)
 
 
+def checkout_form(form):
+    """Checkout fields (ชื่อฟิลด์ตามเพื่อน แต่แมพเข้าตารางตามของคุณ); None if any is missing."""
+    fields = {
+        "email": "email", "phone": "phoneNumber", "recipient": "recipientName",
+        "addr": "address", "city": "city", "state": "state", "postcode": "postcode",
+        "card": "cardNumber", "exp": "expDate", "cvv": "cvv",
+    }
+    out = {k: (form.get(name) or "").strip() for k, name in fields.items()}
+    return out if all(out.values()) else None
+
+
+def checkout_placed(order_id: int, cart: list):
+    """Queue the order's lease lines, empty the cart and redirect (shared with asgi.py)."""
+    lines = [{
+        "artworkId": int(line["id"]),
+        "imageUrl": line["imageUrl"],
+        "pricePerMonth": _parse_float(line["pricePerMonth"], 0.0),
+        "months": int(line.get("months", 1)),
+        "totalPrice": _parse_float(line["subtotal"], 0.0),
+    } for line in cart]
+    job_id = submit("order.items",
+                    {"orderId": order_id, "start": date.today().isoformat(), "lines": lines},
+                    key=f"order-{order_id}-items")
+    track_job(job_id)
+
+    # success
+    session.pop("cart", None)
+    flash(f"Order #{order_id} placed successfully!", "success")
+    if getattr(current_user, "is_authenticated", False):
+        # the orders page polls the job until the lease lines are written
+        return redirect(url_for("main.customer_center", job=job_id) if job_id else url_for("main.customer_center"))
+    return redirect(url_for("main.home"))
+
+
+@job_handler("order.items")
+def _order_items_job(payload):
+    """Write the lease lines of an order (start today, end = start + months)."""
+    start = date.fromisoformat(payload["start"])
+    rows = [dict(line, startDate=start, endDate=_add_months(start, line["months"]))
+            for line in payload["lines"]]
+    inserted = add_order_item_rows(payload["orderId"], rows)
+    if inserted:  # 0 = a retry found the lines already written and counted
+        for line in payload["lines"]:
+            record_event(line["artworkId"], "leases")
+    return {"inserted": inserted}
+
+
 # ========== upload & vendor ==========
 @main.route("/upload", methods=["GET", "POST"])
 @role_required("artist", "gallery", "admin")
@@ -295,9 +367,13 @@ def upload():
                 return redirect(url_for("main.upload"))
 
             new_id = create_artwork(prov["providerId"], data)
+            # logs its own errors: the artwork is saved either way
+            queue_extract(new_id, image_path, key=f"artwork-{new_id}-palette")
             flash("Artwork uploaded", "success")
             return redirect(url_for("main.item_detail", item_id=new_id))
 
+        except UploadRejected as e:
+            flash(e.description, "danger")
         except ValueError as e:
             flash(str(e), "danger")
         except Exception:
@@ -395,6 +471,8 @@ def item_edit(artwork_id: int):
 
         try:
             update_artwork(artwork_id, payload)
+            if new_image_url:
+                queue_extract(artwork_id, new_image_url)
             flash("Artwork updated", "success")
             return redirect(url_for("main.vendor_center"))
         except Exception:
@@ -431,28 +509,289 @@ def item_delete(artwork_id: int):
     return redirect(url_for("main.vendor_center"))
 
 
+BULK_FIELDS = ("leaseStatus", "pricePerMonth", "type", "genre", "galleryName")
+# allowed values of the ENUM columns (database.sql); the others are free text up to these lengths
+BULK_CHOICES = {
+    "leaseStatus": ("Available", "Unavailable"),
+    "type": ("Oil Painting", "Pastel Painting", "Watercolor Painting", "Acrylic Painting", "Digital Painting"),
+}
+BULK_MAX_LEN = {"genre": 50, "galleryName": 100}
+
+
+def _check_bulk_set(values: dict):
+    """ValueError unless every set_ value fits its column."""
+    for k, v in values.items():
+        if k == "pricePerMonth":
+            continue
+        if not isinstance(v, str):
+            raise ValueError(k)
+        if k in BULK_CHOICES and v not in BULK_CHOICES[k]:
+            raise ValueError(k)
+        if k in BULK_MAX_LEN and not (v.strip() and len(v) <= BULK_MAX_LEN[k]):
+            raise ValueError(k)
+
+
+def _bulk_request() -> dict:
+    """
+    Form post from the vendor center, or a JSON body
+    {action, ids|filters, set, pricePercent, confirmAll}.
+    """
+    if request.is_json:
+        body = request.get_json(silent=True) or {}
+        return {
+            "action": body.get("action") or "update",
+            "ids": body.get("ids") or [],
+            "filters": body.get("filters"),
+            "set": {k: v for k, v in (body.get("set") or {}).items() if k in BULK_FIELDS},
+            "pricePercent": body.get("pricePercent"),
+            "confirmAll": body.get("confirmAll") is True,
+        }
+    form = request.form
+    ids = [i for v in form.getlist("ids") for i in v.split(",") if i.strip()]
+    return {
+        "action": form.get("action") or "update",
+        "ids": ids,
+        # "all" = every artwork matching the listing's filters instead of the ticked ones
+        "filters": read_filters(form) if form.get("scope") == "all" else None,
+        # set_<field>, so they can't clash with the filter fields of the same name
+        "set": {k: form[f"set_{k}"] for k in BULK_FIELDS if form.get(f"set_{k}")},
+        "pricePercent": form.get("pricePercent") or None,
+        "confirmAll": form.get("confirmAll") == "1",
+    }
+
+
+@main.post("/artworks/bulk")
+@role_required("artist", "gallery", "admin")
+def artworks_bulk():
+    """Update or soft-delete many artworks at once (ticked ids or a filter)."""
+    from .models import artwork_owners, artwork_ids_matching, bulk_update_artworks, bulk_delete_artworks
+
+    req = _bulk_request()
+    chunk = current_app.config["BULK_CHUNK_SIZE"]
+    provider_id = None
+    if current_user.role != "admin":
+        provider_id = ensure_provider_for_user(current_user.id, current_user.role,
+                                               current_user.userName)["providerId"]
+
+    try:
+        if req["filters"] is not None:
+            filters = dict(req["filters"])
+            if provider_id is None and not any(filters.values()) and not req["confirmAll"]:
+                # an admin's "all" with no filter is every artwork of every provider
+                return _bulk_done(0, "Pick a filter, or confirm changing the whole catalogue", 400)
+            if provider_id is not None:
+                filters["providerId"] = provider_id  # "all" means all of mine
+            ids = artwork_ids_matching(filters)
+        else:
+            ids = sorted({int(i) for i in req["ids"]})
+        factor = None
+        if req["pricePercent"] not in (None, ""):
+            factor = 1 + float(req["pricePercent"]) / 100
+            if factor <= 0:
+                raise ValueError("pricePercent")
+        _check_bulk_set(req["set"])
+        if "pricePerMonth" in req["set"]:
+            req["set"]["pricePerMonth"] = float(req["set"]["pricePerMonth"])
+            if req["set"]["pricePerMonth"] <= 0:
+                raise ValueError("pricePerMonth")
+    except (TypeError, ValueError):
+        return _bulk_done(0, "Invalid bulk request", 400)
+
+    # one ownership query per chunk instead of one get_artwork per id
+    owners = artwork_owners(ids, chunk)
+    missing = [i for i in ids if i not in owners]
+    if provider_id is not None and any(p != provider_id for p in owners.values()):
+        return abort(403)
+    ids = [i for i in ids if i in owners]
+
+    try:
+        if req["action"] == "delete":
+            n = bulk_delete_artworks(ids, provider_id, chunk)
+            return _bulk_done(n, f"{n} artworks deleted", skipped=missing)
+        if req["action"] != "update" or not (req["set"] or factor is not None):
+            return _bulk_done(0, "Nothing to change", 400)
+        n = bulk_update_artworks(ids, req["set"], factor, provider_id, chunk)
+        return _bulk_done(n, f"{n} artworks updated", skipped=missing)
+    except Exception:
+        current_app.logger.exception("Bulk %s failed", req["action"])
+        return _bulk_done(0, "Bulk update failed", 500)
+
+
+def _bulk_done(changed: int, message: str, status: int = 200, skipped=()):
+    if request.is_json:
+        from .api import json_response
+        body = {"changed": changed, "skipped": list(skipped)}
+        if status >= 400:
+            body = {"error": message}
+        return json_response(body, status)
+    flash(message, "success" if status < 400 else "danger")
+    return redirect(request.referrer or url_for("main.vendor_center"))
+
+
 # Compatibility route for legacy '/uploads/<file>'
 @main.get("/uploads/<path:filename>")
 def uploads_compat(filename):
-    return send_from_directory(current_app.config["UPLOAD_FOLDER"], filename)
+    return send_from(current_app.config["UPLOAD_FOLDER"], filename)
 
 
 # ========== centers (admin / customer) ==========
 @main.get("/admin/center")
 @role_required("admin")
 def admin_center():
-    orders = admin_list_orders() if callable(admin_list_orders) else []
-    artworks = admin_list_artworks() if callable(admin_list_artworks) else []
-    providers = admin_list_providers() if callable(admin_list_providers) else []
-    return render_template("user_center_admin.html",
-                           orders=orders, artworks=artworks, providers=providers)
+    # panels are fetched by the page on demand (admin_panel), so no queries here
+    archived = request.args.get("archived") == "1"  # old orders live in orders_archive
+    return render_template("user_center_admin.html", archived=archived)
+
+
+# panel -> (rows(limit, offset, archived), total(archived))
+ADMIN_PANELS = {
+    "orders": (lambda limit, offset, archived: admin_list_orders(archived, limit, offset),
+               lambda archived: admin_count_orders(archived)),
+    "artworks": (lambda limit, offset, archived: admin_list_artworks(limit, offset),
+                 lambda archived: admin_count_artworks()),
+    "providers": (lambda limit, offset, archived: admin_list_providers(limit, offset),
+                  lambda archived: admin_count_providers()),
+}
+
+
+def _panel_args():
+    try:
+        page = max(1, int(request.args.get("page") or 1))
+        per_page = int(request.args.get("per_page") or current_app.config["ADMIN_PAGE_SIZE"])
+    except ValueError:
+        abort(400)
+    return page, max(1, min(per_page, 100)), request.args.get("archived") == "1"
+
+
+def _load_panel(name: str, page: int, per_page: int, archived: bool) -> dict:
+    rows, total = ADMIN_PANELS[name]
+    n = total(archived)
+    return {
+        "name": name,
+        "items": rows(per_page, (page - 1) * per_page, archived),
+        "total": n,
+        "page": page,
+        "pages": max(1, -(-n // per_page)),
+        "archived": 1 if archived else None,
+    }
+
+
+def _load_panel_in_thread(app, name, page, per_page, archived):
+    # own app context -> own DB connection; the request's one isn't thread-safe
+    with app.app_context():
+        return _load_panel(name, page, per_page, archived)
+
+
+_panel_pool = None
+
+
+def _panel_executor():
+    global _panel_pool
+    if _panel_pool is None:
+        from concurrent.futures import ThreadPoolExecutor
+        _panel_pool = ThreadPoolExecutor(max_workers=len(ADMIN_PANELS), thread_name_prefix="admin-panel")
+    return _panel_pool
+
+
+@main.get("/admin/center/<panel>")
+@role_required("admin")
+def admin_panel(panel: str):
+    """One panel page as an HTML fragment, or JSON with ?format=json."""
+    if panel not in ADMIN_PANELS:
+        abort(404)
+    data = _load_panel(panel, *_panel_args())
+    if request.args.get("format") == "json":
+        from .api import json_response
+        return json_response(data)
+    return render_template(f"_admin_{panel}.html", items=data["items"], panel=data)
+
+
+@main.get("/admin/center/panels")
+@role_required("admin")
+def admin_panels():
+    """
+    Several panels at once (?names=orders,artworks,providers); their queries run
+    concurrently, then each fragment is rendered here. JSON: {name: {"html", "total"}}.
+    """
+    names = [n for n in (request.args.get("names") or ",".join(ADMIN_PANELS)).split(",") if n in ADMIN_PANELS]
+    page, per_page, archived = _panel_args()
+    app = current_app._get_current_object()
+    futures = {n: _panel_executor().submit(_load_panel_in_thread, app, n, page, per_page, archived)
+               for n in names}
+    from .api import json_response
+    out = {}
+    for n, fut in futures.items():
+        data = fut.result()
+        out[n] = {"html": render_template(f"_admin_{n}.html", items=data["items"], panel=data),
+                  "total": data["total"]}
+    return json_response(out)
+
+
+def _parse_month(val, default: date) -> date:
+    """'YYYY-MM' -> first day of that month."""
+    try:
+        y, m = (val or "").split("-")
+        return date(int(y), int(m), 1)
+    except Exception:
+        return default
+
+
+@main.get("/admin/analytics")
+@role_required("admin")
+def admin_analytics():
+    from .analytics import revenue_report  # NumPy-heavy; only admins need it
+
+    this_month = date.today().replace(day=1)
+    start = _parse_month(request.args.get("start"), _add_months(this_month, -11))
+    end = _add_months(_parse_month(request.args.get("end"), this_month), 1)  # inclusive month
+    if end <= start:
+        end = _add_months(start, 1)
+    report = revenue_report(start, end)
+    return render_template("admin_analytics.html", report=report,
+                           start=start, last_month=_add_months(end, -1))
+
+
+@main.get("/admin/profiles")
+@role_required("admin")
+def admin_profiles():
+    from .profiling import list_profiles
+
+    endpoint = (request.args.get("ep") or "").strip() or None
+    profiles = list_profiles(100, endpoint) if current_app.config.get("PROFILE_ENABLED") else []
+    return render_template("admin_profiles.html", profiles=profiles, endpoint=endpoint)
+
+
+@main.get("/admin/profiles/<int:profile_id>")
+@role_required("admin")
+def admin_profile_detail(profile_id: int):
+    from .profiling import get_profile, flame_rects
+
+    prof = get_profile(profile_id) if current_app.config.get("PROFILE_ENABLED") else None
+    if not prof:
+        abort(404)
+    return render_template("admin_profile_detail.html", prof=prof, rects=flame_rects(prof["stacks"]))
+
+
+@main.get("/admin/profiles/<int:profile_id>/collapsed.txt")
+@role_required("admin")
+def admin_profile_collapsed(profile_id: int):
+    """Raw collapsed stacks (flamegraph.pl / speedscope input)."""
+    from .profiling import get_profile
+
+    prof = get_profile(profile_id) if current_app.config.get("PROFILE_ENABLED") else None
+    if not prof:
+        abort(404)
+    return current_app.response_class(prof["stacks"], mimetype="text/plain")
 
 
 @main.get("/customer/center")
 @role_required("customer")
 def customer_center():
+    archived = request.args.get("archived") == "1"
     if callable(list_orders_for_user):
-        orders = list_orders_for_user(current_user.id)
+        orders = list_orders_for_user(current_user.id, include_archived=archived)
     else:
         orders = []
-    return render_template("user_center_customer.html", orders=orders)
+    job = request.args.get("job", type=int)
+    return render_template("user_center_customer.html", orders=orders, archived=archived,
+                           job=job if job and can_see_job(job) else None)